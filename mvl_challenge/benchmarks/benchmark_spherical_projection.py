@@ -0,0 +1,159 @@
+import argparse
+from mvl_challenge import EPILOG
+import time
+import numpy as np
+from mvl_challenge.utils import spherical_projection
+from mvl_challenge.utils.spherical_utils import sph2uv
+
+
+def legacy_phi_coords2xyz(phi_coords):
+    """
+    phi_coords2xyz() before precomputed tables (reference implementation)
+    """
+    W = phi_coords.__len__()
+    u = np.linspace(0, W - 1, W)
+    theta_coords = (2 * np.pi * u / W) - np.pi
+    bearings_y = np.sin(phi_coords)
+    bearings_x = np.cos(phi_coords) * np.sin(theta_coords)
+    bearings_z = np.cos(phi_coords) * np.cos(theta_coords)
+    return np.vstack((bearings_x, bearings_y, bearings_z))
+
+
+def legacy_phi_coords2uv(phi_coords, shape=(512, 1024)):
+    """
+    phi_coords2uv() before precomputed tables (reference implementation)
+    """
+    H, W = shape
+    u = np.linspace(0, W - 1, W)
+    theta_coords = (2 * np.pi * u / W) - np.pi
+    uv_c = sph2uv(np.vstack((theta_coords, phi_coords[0])), shape)
+    uv_f = sph2uv(np.vstack((theta_coords, phi_coords[1])), shape)
+    return uv_c, uv_f
+
+
+def timeit(func, list_args, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        [func(*args) for args in list_args]
+        best = min(best, time.perf_counter() - tic)
+    return best / list_args.__len__()
+
+
+def main(args):
+    W = args.width
+    shape = (W // 2, W)
+    np.random.seed(0)
+    list_phi_coords = [
+        np.vstack(
+            (np.random.uniform(-1.4, -0.1, W), np.random.uniform(0.1, 1.4, W))
+        ).astype(dtype)
+        for dtype in (np.float64, np.float32)
+        for _ in range(args.num_frames // 2)
+    ]
+    phi_64 = [(ph[1].astype(np.float64),) for ph in list_phi_coords]
+    phi_32 = [(ph[1].astype(np.float32),) for ph in list_phi_coords]
+    out_64 = np.empty((3, W), dtype=np.float64)
+    out_32 = np.empty((3, W), dtype=np.float32)
+    out_uv = np.empty((2, 2, W), dtype=int)
+
+    # ! Warming up the tables
+    spherical_projection.phi_coords2xyz(phi_64[0][0])
+    spherical_projection.phi_coords2xyz(phi_32[0][0])
+    spherical_projection.phi_coords2uv(list_phi_coords[0], shape)
+
+    results = [
+        ("phi_coords2xyz (legacy)", timeit(legacy_phi_coords2xyz, phi_64, args.repeat)),
+        (
+            "phi_coords2xyz float64",
+            timeit(spherical_projection.phi_coords2xyz, phi_64, args.repeat),
+        ),
+        (
+            "phi_coords2xyz float64 out=",
+            timeit(
+                lambda ph: spherical_projection.phi_coords2xyz(ph, out=out_64),
+                phi_64,
+                args.repeat,
+            ),
+        ),
+        (
+            "phi_coords2xyz float32 out=",
+            timeit(
+                lambda ph: spherical_projection.phi_coords2xyz(ph, out=out_32),
+                phi_32,
+                args.repeat,
+            ),
+        ),
+        (
+            "phi_coords2uv (legacy)",
+            timeit(
+                lambda ph: legacy_phi_coords2uv(ph, shape),
+                [(ph,) for ph in list_phi_coords],
+                args.repeat,
+            ),
+        ),
+        (
+            "phi_coords2uv out=",
+            timeit(
+                lambda ph: spherical_projection.phi_coords2uv(ph, shape, out=out_uv),
+                [(ph,) for ph in list_phi_coords],
+                args.repeat,
+            ),
+        ),
+    ]
+
+    # ! Parity w.r.t. legacy implementations
+    err_xyz = max(
+        np.max(np.abs(legacy_phi_coords2xyz(ph) - spherical_projection.phi_coords2xyz(ph)))
+        for ph, in phi_64
+    )
+    err_uv = max(
+        np.max(
+            np.abs(
+                np.stack(legacy_phi_coords2uv(ph, shape))
+                - np.stack(spherical_projection.phi_coords2uv(ph, shape))
+            )
+        )
+        for ph in list_phi_coords
+    )
+
+    print(f"Width: {W} - frames: {list_phi_coords.__len__()} - repeat: {args.repeat}")
+    ref = {"phi_coords2xyz": results[0][1], "phi_coords2uv": results[4][1]}
+    for name, t in results:
+        speedup = ref[name.split(" ")[0]] / t
+        print(f"{name:<32}{t * 1e6:>10.2f} us/frame{speedup:>8.2f}x")
+    print(f"Max abs error phi_coords2xyz (float64): {err_xyz:.3e}")
+    print(f"Max abs error phi_coords2uv: {err_uv}")
+
+
+def get_argparse():
+    desc = (
+        "Micro-benchmark of the phi_coords to bearings/uv conversions "
+        + "using precomputed trigonometric tables against the legacy implementations."
+    )
+
+    parser = argparse.ArgumentParser(description=desc, epilog=EPILOG)
+
+    parser.add_argument(
+        "-w", "--width", type=int, default=1024, help="Image width (W)."
+    )
+
+    parser.add_argument(
+        "-n",
+        "--num_frames",
+        type=int,
+        default=1000,
+        help="Number of random phi_coords evaluated.",
+    )
+
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Number of repetitions (best is reported)."
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = get_argparse()
+    main(args)
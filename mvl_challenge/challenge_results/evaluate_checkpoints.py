@@ -0,0 +1,273 @@
+import argparse
+from mvl_challenge import (
+    DEFAULT_MVL_DIR,
+    CFG_DIR,
+    EPILOG,
+    ASSETS_DIR,
+    SCENE_LIST_DIR,
+)
+import os
+import time
+import logging
+import numpy as np
+from copy import deepcopy
+from pathlib import Path
+from tqdm import tqdm
+from torch.utils.data import DataLoader
+from mvl_challenge.config.cfg import read_omega_cfg
+from mvl_challenge.datasets.mvl_dataset import MVLDataset, MVImageLayout
+from mvl_challenge.models.wrapper_horizon_net import WrapperHorizonNet
+from mvl_challenge.utils.io_utils import create_directory, save_json_dict, load_gt_label
+from mvl_challenge.utils.eval_utils import eval_2d3d_iuo_batch
+from mvl_challenge.utils.parallel_eval_utils import iter_room_evaluations, get_num_eval_workers
+from mvl_challenge.utils.results_store import ResultsWriter, get_results_records, RESULTS_EXT
+
+
+def get_cfg_from_args(args):
+    cfg = read_omega_cfg(args.cfg)
+    cfg.scene_dir = args.scene_dir
+    cfg.scene_list = args.scene_list
+    cfg.cuda_device = args.cuda_device
+    return cfg
+
+
+def get_checkpoints(cfg, list_ckpt):
+    """
+    Returns {model_name: ckpt} for the passed ckpt files or
+    model names defined in trained_models.yaml (e.g. mp3d, zind).
+    ckpt files with the same filename are named by their parent directory too.
+    """
+    trained_models = cfg.get("trained_models", None) or {}
+    names = [ckpt if ckpt in trained_models else Path(ckpt).stem for ckpt in list_ckpt]
+    checkpoints = {}
+    for name, ckpt in zip(names, list_ckpt):
+        if ckpt in trained_models:
+            ckpt = trained_models[ckpt]["ckpt"]
+        elif names.count(name) > 1:
+            name = f"{Path(ckpt).parent.name}__{name}"
+        assert name not in checkpoints, f"Duplicated model name {name} ({ckpt}, {checkpoints[name]})"
+        checkpoints[name] = ckpt
+    for name, ckpt in checkpoints.items():
+        assert os.path.isfile(ckpt), f"Not found {ckpt} ({name})"
+    return checkpoints
+
+
+def load_models(cfg, checkpoints):
+    """
+    Returns {model_name: WrapperHorizonNet} with the same cfg except for the ckpt
+    """
+    models = {}
+    for name, ckpt in checkpoints.items():
+        cfg_model = deepcopy(cfg)
+        cfg_model.ckpt = ckpt
+        cfg_model.model.ckpt = ckpt
+        models[name] = WrapperHorizonNet(cfg_model)
+    return models
+
+
+def estimate_room(models, dataset, room_scene):
+    """
+    Estimates all frames of a room by every model. Every image batch is decoded once
+    and fed to all models. Returns {model_name: {idx: phi_coords}} (see WrapperHorizonNet.estimate_batch()).
+    """
+    cfg = dataset.cfg
+    layout_dataloader = DataLoader(
+        MVImageLayout(
+            dataset.get_img_data(room_scene),
+            uint8_images=cfg.runners.mvl.get("uint8_images", False),
+            image_cache=cfg.runners.mvl.get("image_cache", None),
+        ),
+        batch_size=cfg.runners.mvl.batch_size,
+        shuffle=False,
+        drop_last=False,
+        num_workers=cfg.runners.mvl.num_workers,
+    )
+    evaluated_data = {name: {} for name in models.keys()}
+    for x in layout_dataloader:
+        for name, model in models.items():
+            for data, idx in zip(model.estimate_batch(x["images"]), x["idx"]):
+                evaluated_data[name][idx] = data
+    return evaluated_data
+
+
+def get_checkpoints_room_task(models, dataset, room_scene, gt_dir):
+    """
+    Returns the (picklable) data needed to evaluate all models in a room
+    """
+    list_ly = dataset.load_list_ly(room_scene=room_scene)
+    evaluated_data = estimate_room(models, dataset, room_scene)
+    list_idx = [ly.idx for ly in list_ly]
+    return dict(
+        gt_dir=gt_dir,
+        list_idx=list_idx,
+        camera_heights=np.array([ly.camera_height for ly in list_ly]),
+        phi_coords={
+            # ! y_bon and y_cor only, the TTA std rows are not evaluated
+            name: np.stack([data[idx][:3] for idx in list_idx])
+            for name, data in evaluated_data.items()
+        },
+    )
+
+
+def eval_checkpoints_room_task(task):
+    """
+    Loads the GT labels of a room once and computes 2D/3D IoU for every model.
+    Returns {model_name: results records} (see get_results_records()).
+    eval_time is the IoU time of every model plus its share of the GT loading time.
+    """
+    tic = time.time()
+    phi_coords_gt = np.stack(
+        [load_gt_label(os.path.join(task["gt_dir"], f"{idx}.npz")) for idx in task["list_idx"]]
+    )
+    load_time = (time.time() - tic) / task["phi_coords"].__len__()
+    room_results = {}
+    for name, phi_coords_est in task["phi_coords"].items():
+        tic = time.time()
+        iou2d, iou3d = eval_2d3d_iuo_batch(
+            phi_coords_est=phi_coords_est,
+            phi_coords_gt_bon=phi_coords_gt,
+            ch=task["camera_heights"],
+        )
+        room_results[name] = get_results_records(
+            list_idx=task["list_idx"],
+            iou2d=iou2d,
+            iou3d=iou3d,
+            cam_h=task["camera_heights"],
+            failed=np.minimum(iou2d, iou3d) < 0,
+            eval_time=(time.time() - tic + load_time) / task["list_idx"].__len__(),
+        )
+    return room_results
+
+
+def print_comparison_table(table):
+    print(f"{'model':<30}{'frames':>8}{'failed':>8}{'2d-IoU':>10}{'3d-IoU':>10}")
+    for name, value in table.items():
+        print(
+            f"{name:<30}{value['frames']:>8}{value['failed']:>8}"
+            + f"{value['m2dIoU']:>10.4f}{value['m3dIoU']:>10.4f}"
+        )
+
+
+def main(args):
+    cfg = get_cfg_from_args(args)
+    checkpoints = get_checkpoints(cfg, args.ckpt)
+    if cfg.runners.mvl.get("inference_cache", None) is not None and cfg.runners.mvl.inference_cache.get("cache_dir", ""):
+        logging.warning("runners.mvl.inference_cache is not used by this script. All frames are estimated")
+    models = load_models(cfg, checkpoints)
+    mvl = MVLDataset(cfg)
+    mvl.print_mvl_data_info()
+
+    output_dir = create_directory(
+        os.path.join(args.output_dir, f"{Path(args.scene_list).stem}__checkpoints"),
+        delete_prev=True,
+    )
+    gt_dir = os.path.join(args.scene_dir, "labels", "gt")
+
+    # ! Results of every model are streamed into their own columnar store (see query_results.py)
+    writers = {
+        name: ResultsWriter(
+            filename=os.path.join(output_dir, f"{name}{RESULTS_EXT}"),
+            meta=dict(ckpt=ckpt, scene_list=cfg.scene_list),
+        )
+        for name, ckpt in checkpoints.items()
+    }
+    results = {name: dict(iou2d=[], iou3d=[], failed=0) for name in models.keys()}
+
+    iter_tasks = (
+        get_checkpoints_room_task(models, mvl, room_scene, gt_dir)
+        for room_scene in tqdm(mvl.list_rooms, desc=f"Estimating layout ({models.__len__()} models)...")
+        if mvl.data_scenes[room_scene].__len__() > 0
+    )
+    for room_results in iter_room_evaluations(
+        iter_tasks,
+        num_workers=get_num_eval_workers(args.eval_workers),
+        func=eval_checkpoints_room_task,
+    ):
+        for name, records in room_results.items():
+            writers[name].write(records)
+            results[name]["iou2d"].append(records["iou2d"])
+            results[name]["iou3d"].append(records["iou3d"])
+            results[name]["failed"] += int(np.sum(records["failed"]))
+    [writer.close() for writer in writers.values()]
+
+    # ! Failed frames are counted with IoU 0 (see get_results_records())
+    table = {
+        name: dict(
+            ckpt=checkpoints[name],
+            frames=int(np.concatenate(value["iou2d"]).size),
+            failed=value["failed"],
+            m2dIoU=float(np.mean(np.concatenate(value["iou2d"]))),
+            m3dIoU=float(np.mean(np.concatenate(value["iou3d"]))),
+        )
+        for name, value in results.items()
+    }
+    fn = os.path.join(output_dir, f"{Path(args.scene_list).stem}__checkpoints.json")
+    save_json_dict(filename=fn, dict_data=table)
+    logging.info(f"Results saved at {output_dir}")
+
+    print_comparison_table(table)
+
+
+def get_argparse():
+    desc = (
+        "This script evaluates 2d-IoU, 3d-IoU of several checkpoints in a single pass over the data. "
+        + "Every image is decoded once and fed to all models, and GT labels are loaded once per room. "
+        + "A comparison table (json) and a results file (*.mvlres) per checkpoint are saved. "
+        + "Note that this script assumes you have access to some GT labels."
+    )
+
+    parser = argparse.ArgumentParser(description=desc, epilog=EPILOG)
+
+    parser.add_argument(
+        "-d",
+        "--scene_dir",
+        type=str,
+        default=f"{DEFAULT_MVL_DIR}",
+        help="MVL dataset directory.",
+    )
+
+    parser.add_argument(
+        "--cfg",
+        type=str,
+        default=f"{CFG_DIR}/eval_mvl_dataset.yaml",
+        help=f"Config file to load a MVL dataset. For this script model cfg most be defined in the cfg file too. (Default: {CFG_DIR}/eval_mvl_dataset.yaml)",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--scene_list",
+        type=str,
+        default=f"{SCENE_LIST_DIR}/scene_list__warm_up_pilot_set.json",
+        help="Scene_list of mvl scenes in scene_room_idx format.",
+    )
+
+    parser.add_argument(
+        "--ckpt",
+        type=str,
+        nargs="+",
+        default=[f"{ASSETS_DIR}/ckpt/hn_mp3d.pth"],
+        help="Pretrained model ckpts or model names defined in trained_models.yaml, e.g. mp3d zind st3d panos2d3d (Default: mp3d ckpt)",
+    )
+
+    parser.add_argument("--cuda_device", default=0, type=int, help="Cuda device. (Default: 0)")
+
+    parser.add_argument(
+        "--eval_workers",
+        default=0,
+        type=int,
+        help="Processes for GT loading and IoU evaluation. 0: main process, -1: all cores. (Default: 0)",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output_dir",
+        default=f"{ASSETS_DIR}/results",
+        help="Output directory where to store the results.",
+    )
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = get_argparse()
+    main(args)
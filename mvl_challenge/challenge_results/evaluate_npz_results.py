@@ -0,0 +1,236 @@
+import argparse
+from mvl_challenge import (
+    EPILOG,
+    DEFAULT_MVL_DIR,
+    DEFAULT_NPZ_DIR,
+    SCENE_LIST_DIR,
+)
+import os
+import json
+import time
+import logging
+import numpy as np
+from pathlib import Path
+from mvl_challenge.config.cfg import set_loggings
+from mvl_challenge.utils.io_utils import (
+    save_json_dict,
+    get_scene_room_from_scene_room_idx,
+)
+from mvl_challenge.utils.eval_utils import eval_2d3d_iuo_batch
+from mvl_challenge.utils.parallel_eval_utils import (
+    iter_room_evaluations,
+    get_num_eval_workers,
+)
+from mvl_challenge.utils.results_store import (
+    ResultsWriter,
+    get_results_records,
+    RESULTS_EXT,
+)
+
+
+def load_list_phi_coords(data_dir, list_idx):
+    """
+    Loads the phi_coords (npz files) of the passed frames.
+    Returns the phi_coords (N, 2, W) and a mask (N,) of the found files.
+    """
+    list_fn = [os.path.join(data_dir, f"{idx}.npz") for idx in list_idx]
+    found = np.array([os.path.exists(fn) for fn in list_fn], dtype=bool)
+    list_phi_coords = [np.load(fn)["phi_coords"] for fn in list_fn if os.path.exists(fn)]
+    return list_phi_coords, found
+
+
+def eval_npz_room_task(task):
+    """
+    Evaluates 2D/3D IoU for all frames of a room from npz files.
+    Returns the results records (see get_results_records()) in the same order as
+    task["list_idx"]. Frames without estimation are evaluated as 0 (the highest penalty)
+    and flagged as failed.
+    """
+    tic = time.time()
+    list_idx = task["list_idx"]
+    list_phi_coords_gt, found_gt = load_list_phi_coords(task["gt_dir"], list_idx)
+    assert np.all(found_gt), f"Not found GT labels for {task['room']} in {task['gt_dir']}"
+
+    list_phi_coords_est, found = load_list_phi_coords(task["results_dir"], list_idx)
+    camera_heights = np.array(
+        [
+            json.load(open(os.path.join(task["geom_info_dir"], f"{idx}.json")))["cam_h"]
+            for idx in list_idx
+        ]
+    )
+
+    iou2d = np.zeros(list_idx.__len__())
+    iou3d = np.zeros(list_idx.__len__())
+    if np.any(found):
+        iou2d[found], iou3d[found] = eval_2d3d_iuo_batch(
+            phi_coords_est=np.stack(list_phi_coords_est),
+            phi_coords_gt_bon=np.stack(list_phi_coords_gt)[found],
+            ch=camera_heights[found],
+        )
+    return get_results_records(
+        list_idx=list_idx,
+        iou2d=iou2d,
+        iou3d=iou3d,
+        cam_h=camera_heights,
+        failed=~found | (np.minimum(iou2d, iou3d) < 0),
+        eval_time=(time.time() - tic) / list_idx.__len__(),
+    )
+
+
+def get_rooms_data(args):
+    """
+    Returns {room_scene: [idx, ...]} from the scene list, or from the
+    npz files in the results directory if no scene list is passed.
+    """
+    if args.scene_list is not None:
+        data_scenes = json.load(open(args.scene_list, "r"))
+        return {
+            room: [Path(fr).stem for fr in list_frames]
+            for room, list_frames in data_scenes.items()
+        }
+    rooms_data = {}
+    for fn in sorted(os.listdir(args.results_dir)):
+        if not fn.endswith(".npz"):
+            continue
+        idx = Path(fn).stem
+        rooms_data.setdefault(get_scene_room_from_scene_room_idx(idx), []).append(idx)
+    return rooms_data
+
+
+def main(args):
+    set_loggings()
+    if args.gt_dir is None:
+        args.gt_dir = os.path.join(args.scene_dir, "labels", "gt")
+    if args.geom_info_dir is None:
+        args.geom_info_dir = os.path.join(args.scene_dir, "geometry_info")
+    assert os.path.isdir(args.results_dir), f"Not found {args.results_dir}"
+
+    rooms_data = get_rooms_data(args)
+    list_rooms = [room for room, list_idx in rooms_data.items() if list_idx.__len__() > 0]
+    iter_tasks = (
+        dict(
+            room=room,
+            list_idx=rooms_data[room],
+            results_dir=args.results_dir,
+            gt_dir=args.gt_dir,
+            geom_info_dir=args.geom_info_dir,
+        )
+        for room in list_rooms
+    )
+
+    if args.output_file is None:
+        args.output_file = os.path.join(
+            Path(args.results_dir).parent, f"{Path(args.results_dir).stem}__results.json"
+        )
+    # ! Results are also streamed into a columnar store (see query_results.py)
+    writer = ResultsWriter(
+        filename=Path(args.output_file).with_suffix(RESULTS_EXT).__str__(),
+        meta=dict(results_dir=args.results_dir, scene_list=args.scene_list),
+    )
+
+    results = {}
+    rooms_results = {}
+    failed = 0
+    iter_results = iter_room_evaluations(
+        iter_tasks,
+        num_workers=get_num_eval_workers(args.eval_workers),
+        func=eval_npz_room_task,
+    )
+    for room, room_results in zip(list_rooms, iter_results):
+        writer.write(room_results)
+        failed += int(np.sum(room_results["failed"]))
+        for record in room_results:
+            results[f"{record['idx'].decode()}__2dIoU"] = float(record["iou2d"])
+            results[f"{record['idx'].decode()}__3dIoU"] = float(record["iou3d"])
+        rooms_results[f"{room}__m2dIoU"] = np.mean(room_results["iou2d"])
+        rooms_results[f"{room}__m3dIoU"] = np.mean(room_results["iou3d"])
+    writer.close()
+
+    if failed > 0:
+        logging.warning(
+            f"{failed} frames failed (without estimation or invalid GT) in {args.results_dir}"
+        )
+
+    _2dIoU = np.mean([value for key, value in results.items() if key.endswith("__2dIoU")])
+    _3dIoU = np.mean([value for key, value in results.items() if key.endswith("__3dIoU")])
+
+    results.update(rooms_results)
+    results["total__m2dIoU"] = _2dIoU
+    results["total__m3dIoU"] = _3dIoU
+
+    save_json_dict(filename=args.output_file, dict_data=results)
+    logging.info(f"Results saved at {args.output_file}")
+
+    print(f"2d-IoU: {_2dIoU:2.3f}\t3d-IoU: {_3dIoU:2.3f}")
+
+
+def get_argparse():
+    desc = (
+        "This script evaluates 2d-IoU, 3d-IoU from a directory of npz estimations (see create_npz_files.py) "
+        + "without loading the model. Per-frame, per-room and total IoU are saved in a json file. "
+        + "Note that this script assumes you have access to the GT labels and geometry info."
+    )
+
+    parser = argparse.ArgumentParser(description=desc, epilog=EPILOG)
+
+    parser.add_argument(
+        "-r",
+        "--results_dir",
+        type=str,
+        default=f"{DEFAULT_NPZ_DIR}/scene_list__warm_up_pilot_set",
+        help="Directory of npz estimations (phi_coords).",
+    )
+
+    parser.add_argument(
+        "-d",
+        "--scene_dir",
+        type=str,
+        default=f"{DEFAULT_MVL_DIR}",
+        help="MVL dataset directory.",
+    )
+
+    parser.add_argument(
+        "--gt_dir",
+        type=str,
+        default=None,
+        help="GT labels directory. (Default: ${scene_dir}/labels/gt)",
+    )
+
+    parser.add_argument(
+        "--geom_info_dir",
+        type=str,
+        default=None,
+        help="Geometry info directory (camera heights). (Default: ${scene_dir}/geometry_info)",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--scene_list",
+        type=str,
+        default=None,
+        help="Scene_list of mvl scenes in scene_room_idx format. "
+        + f"e.g. {SCENE_LIST_DIR}/scene_list__warm_up_pilot_set.json (Default: all npz files in results_dir)",
+    )
+
+    parser.add_argument(
+        "--eval_workers",
+        default=-1,
+        type=int,
+        help="Processes for IoU evaluation. 0: main process, -1: all cores. (Default: -1)",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        default=None,
+        help="Output json file. (Default: ${results_dir}__results.json)",
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = get_argparse()
+    main(args)
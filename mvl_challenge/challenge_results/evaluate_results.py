@@ -11,18 +11,19 @@ from mvl_challenge import (
 from mvl_challenge.config.cfg import read_omega_cfg
 from mvl_challenge.datasets.mvl_dataset import MVLDataset, iter_mvl_room_scenes
 from mvl_challenge.utils.vispy_utils import plot_list_ly
-from mvl_challenge.utils.image_utils import draw_boundaries_phi_coords, add_caption_to_image, draw_boundaries_uv
-from imageio import imwrite
-from mvl_challenge.utils.image_utils import COLOR_CYAN, COLOR_GREEN, xyz2uv
 from mvl_challenge.models.wrapper_horizon_net import WrapperHorizonNet
 from mvl_challenge.utils.io_utils import (
     create_directory,
     save_json_dict,
-    load_gt_label,
     get_scene_room_from_scene_room_idx,
 )
 from mvl_challenge.utils.image_utils import plot_image
-from mvl_challenge.utils.eval_utils import eval_2d3d_iuo
+from mvl_challenge.utils.parallel_eval_utils import (
+    get_room_eval_task,
+    iter_room_evaluations,
+    get_num_eval_workers,
+)
+from mvl_challenge.utils.results_store import ResultsWriter, RESULTS_EXT
 import numpy as np
 import os
 from pathlib import Path
@@ -49,56 +50,40 @@ def main(args):
 
     results = {}
 
-    for list_ly in iter_mvl_room_scenes(model=hn, dataset=mvl):
-        for ly in list_ly:
-
-            phi_coords_gt = load_gt_label(
-                os.path.join(args.scene_dir, "labels", "gt", f"{ly.idx}.npz")
-            )
-
-            phi_coords_est = ly.phi_coords
-
-            results_2d3d_iou = eval_2d3d_iuo(
-                phi_coords_est=phi_coords_est,
-                phi_coords_gt_bon=phi_coords_gt,
-                ch=ly.camera_height,
-            )
-
-            if np.min(results_2d3d_iou) < 0:
-                # ! IoU evaluation failed, then IoU is 0 (the highest penalty)
-                results[f"{ly.idx}__2dIoU"] = 0
-                results[f"{ly.idx}__3dIoU"] = 0
-
-            if args.vis:
-                # ! Save visualizations
-                img = ly.get_rgb()
-                draw_boundaries_phi_coords(
-                    img, phi_coords=phi_coords_est,
-                    color=COLOR_CYAN
-                )
-                
-                draw_boundaries_phi_coords(
-                    img, phi_coords=phi_coords_gt,
-                    color=COLOR_GREEN
-                )
-                
-                img = add_caption_to_image(img, ly.idx)
-
-                fn = os.path.join(output_dir_vis, f"{ly.idx}.jpg")
-                imwrite(fn, img)
-
-            
-            results[f"{ly.idx}__2dIoU"] = results_2d3d_iou[0]
-            results[f"{ly.idx}__3dIoU"] = results_2d3d_iou[1]
+    # ! GT loading, IoU and visualizations are evaluated per room (see --eval_workers)
+    iter_tasks = (
+        get_room_eval_task(
+            list_ly,
+            gt_dir=os.path.join(args.scene_dir, "labels", "gt"),
+            vis_dir=output_dir_vis if args.vis else None,
+        )
+        for list_ly in iter_mvl_room_scenes(model=hn, dataset=mvl)
+        if list_ly.__len__() > 0
+    )
+    fn = os.path.join(
+        output_dir, f"{Path(args.scene_list).stem}__{Path(args.ckpt).stem}.json"
+    )
+    # ! Results are also streamed into a columnar store (see query_results.py)
+    writer = ResultsWriter(
+        filename=Path(fn).with_suffix(RESULTS_EXT).__str__(),
+        meta=dict(ckpt=cfg.ckpt, scene_list=cfg.scene_list),
+    )
+    for room_results in iter_room_evaluations(
+        iter_tasks, num_workers=get_num_eval_workers(args.eval_workers)
+    ):
+        writer.write(room_results)
+        for record in room_results:
+            # ! Frames whose IoU evaluation failed are stored with IoU 0 (see results_store.py)
+            idx = record["idx"].decode()
+            results[f"{idx}__2dIoU"] = float(record["iou2d"])
+            results[f"{idx}__3dIoU"] = float(record["iou3d"])
+    writer.close()
 
     _2dIoU = np.mean([value for key, value in results.items() if "2dIoU" in key])
     _3dIoU = np.mean([value for key, value in results.items() if "3dIoU" in key])
 
     results["total__m2dIoU"] = _2dIoU
     results["total__m3dIoU"] = _3dIoU
-    fn = os.path.join(
-        output_dir, f"{Path(args.scene_list).stem}__{Path(args.ckpt).stem}.json"
-    )
     save_json_dict(filename=fn, dict_data=results)
 
     print(f"2d-IoU: {_2dIoU:2.3f}\t3d-IoU: {_3dIoU:2.3f}")
@@ -150,6 +135,13 @@ def get_argparse():
      
     parser.add_argument("--cuda_device", default=0, type=int, help="Cuda device. (Default: 0)")
 
+    parser.add_argument(
+        "--eval_workers",
+        default=0,
+        type=int,
+        help="Processes for GT loading, IoU and visualizations. 0: main process, -1: all cores. (Default: 0)",
+    )
+
     parser.add_argument(
         "-o",
         "--output_dir",
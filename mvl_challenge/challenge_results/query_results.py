@@ -0,0 +1,82 @@
+import argparse
+from mvl_challenge import EPILOG
+from pathlib import Path
+from mvl_challenge.utils.results_store import ResultsStore
+
+
+def print_breakdown(store, by):
+    aggregation = store.aggregate(by=by)
+    print(f"\n{store.filename} ({store.__len__()} frames)")
+    print(f"{by:<40}{'frames':>8}{'failed':>8}{'2d-IoU':>10}{'3d-IoU':>10}{'time[s]':>10}")
+    for key, value in aggregation.items():
+        print(
+            f"{key:<40}{value['frames']:>8}{value['failed']:>8}"
+            + f"{value['m2dIoU']:>10.4f}{value['m3dIoU']:>10.4f}{value['eval_time']:>10.2f}"
+        )
+
+
+def print_comparison(ref_store, store, by):
+    """
+    Prints the per key (room, scene or total) IoU differences (store - ref_store)
+    """
+    ref = ref_store.aggregate(by=by)
+    curr = store.aggregate(by=by)
+    print(f"\n{Path(store.filename).name} vs {Path(ref_store.filename).name}")
+    print(f"{by:<40}{'2d-IoU':>10}{'diff':>10}{'3d-IoU':>10}{'diff':>10}")
+    for key in sorted(set(ref.keys()) | set(curr.keys())):
+        if key not in ref or key not in curr:
+            print(f"{key:<40}{'only in ' + ('ref' if key in ref else 'curr'):>40}")
+            continue
+        print(
+            f"{key:<40}{curr[key]['m2dIoU']:>10.4f}{curr[key]['m2dIoU'] - ref[key]['m2dIoU']:>+10.4f}"
+            + f"{curr[key]['m3dIoU']:>10.4f}{curr[key]['m3dIoU'] - ref[key]['m3dIoU']:>+10.4f}"
+        )
+
+
+def main(args):
+    list_stores = [ResultsStore(fn) for fn in args.results]
+    if list_stores.__len__() == 1 or not args.compare:
+        [print_breakdown(store, args.by) for store in list_stores]
+        return
+
+    # ! The first results file is the reference
+    [print_comparison(list_stores[0], store, args.by) for store in list_stores[1:]]
+
+
+def get_argparse():
+    desc = (
+        "This script reports per-room, per-scene or total 2d-IoU and 3d-IoU from results files (*.mvlres) "
+        + "created by evaluate_results.py or evaluate_npz_results.py. "
+        + "With --compare, the differences w.r.t. the first results file are reported (e.g. between checkpoints)."
+    )
+
+    parser = argparse.ArgumentParser(description=desc, epilog=EPILOG)
+
+    parser.add_argument(
+        "results",
+        type=str,
+        nargs="+",
+        help="Results files (*.mvlres).",
+    )
+
+    parser.add_argument(
+        "--by",
+        type=str,
+        default="scene",
+        choices=["room", "scene", "total"],
+        help="Aggregation level. (Default: scene)",
+    )
+
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Reports the differences w.r.t. the first results file.",
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = get_argparse()
+    main(args)
@@ -2,10 +2,13 @@ import os
 import numpy as np
 import pathlib
 import torch.utils.data as data
-from PIL import Image
 import json
 import torch
 import logging
+from mvl_challenge.datasets.mvl_shard import get_shard, get_shard_fn
+from mvl_challenge.datasets.image_cache import get_image_cache, read_rgb
+from mvl_challenge.datasets.label_store import get_label_store, is_label_store_updated
+from mvl_challenge.utils.io_utils import get_scene_room_from_scene_room_idx, save_json_dict
 
   
 class ListLayout:
@@ -30,8 +33,17 @@ class MVLDataLoader(data.Dataset):
     def __init__(self, cfg):
         self.cfg = cfg
         
+        # ! Consolidated labels and std (see label_store.py)
+        self.label_store = None
+        if self.cfg.data_dir.get('label_store', ''):
+            self.label_store = get_label_store(self.cfg.data_dir.label_store)
+
         # ! List of scenes defined in a list file
-        if cfg.get('scene_list', '') == '':
+        if cfg.get('scene_list', '') == '' and self.label_store is not None:
+            self.raw_data = list(self.label_store.list_idx)
+            self.list_frames = self.raw_data
+            self.list_rooms = None
+        elif cfg.get('scene_list', '') == '':
             # ! Reading from available labels data       
             self.raw_data = os.listdir(
                 os.path.join(self.cfg.data_dir.labels_dir, self.cfg.label)
@@ -53,61 +65,229 @@ class MVLDataLoader(data.Dataset):
         else:
             np.random.shuffle(self.list_frames)
             self.data = self.list_frames[:cfg.size]
+
+        if self.label_store is not None and not is_label_store_updated(
+            self.label_store, self.cfg.data_dir.labels_dir, self.cfg.label, self.data
+        ):
+            # ! Per-frame label files were rewritten after the store was created (see create_label_store.py)
+            logging.warning(f"Outdated label store {self.label_store.store_dir}. Reading the per-frame labels")
+            self.label_store = None
+        # ! Workers return uint8 images, augmentations are applied batched
+        self.uint8_images = self.cfg.get('uint8_images', False)
         # ! By default this dataloader iterates by frames
-        logging.info(f"Simple MLC dataloader initialized with: {self.cfg.data_dir.img_dir}")
-        logging.info(f"Labels reading from: {os.path.join(self.cfg.data_dir.labels_dir, self.cfg.label)}")
+        self.shard_dir = self.cfg.data_dir.get('shard_dir', '')
+        if self.shard_dir:
+            logging.info(f"Simple MLC dataloader initialized with shards: {self.shard_dir}")
+            logging.info(f"Labels reading from shards: {self.cfg.label}")
+        else:
+            logging.info(f"Simple MLC dataloader initialized with: {self.cfg.data_dir.img_dir}")
+            if self.label_store is not None:
+                logging.info(f"Labels reading from: {self.label_store.store_dir}")
+            else:
+                logging.info(f"Labels reading from: {os.path.join(self.cfg.data_dir.labels_dir, self.cfg.label)}")
+            self.set_manifest()
         logging.info(f"Total number of frames:{self.data.__len__()}")
+
+    def get_manifest_info(self):
+        return dict(
+            img_dir=self.cfg.data_dir.img_dir,
+            labels_dir=self.cfg.data_dir.labels_dir,
+            label=self.cfg.label,
+            label_store=self.cfg.data_dir.get('label_store', ''),
+        )
+
+    def set_manifest(self):
+        """
+        Sets the image, label and std files of every frame (self.manifest) at once.
+        The manifest is loaded from/saved to cfg.manifest (if defined), otherwise
+        it is built by listing the data directories once.
+        """
+        manifest_fn = self.cfg.get('manifest', '')
+        self.manifest = {}
+        if manifest_fn and os.path.exists(manifest_fn):
+            manifest = json.load(open(manifest_fn))
+            if manifest["info"] == self.get_manifest_info():
+                self.manifest = manifest["frames"]
+            else:
+                logging.warning(f"Manifest {manifest_fn} does not match the dataloader cfg. Rebuilding it")
+
+        list_filenames = [os.path.splitext(fr)[0] for fr in self.data]
+        if not all(filename in self.manifest for filename in list_filenames):
+            self.manifest.update(self.build_manifest(list_filenames))
+            if manifest_fn:
+                save_json_dict(
+                    filename=manifest_fn,
+                    dict_data=dict(info=self.get_manifest_info(), frames=self.manifest),
+                )
+                logging.info(f"Manifest saved at {manifest_fn}")
+
+    def build_manifest(self, list_filenames):
+        """
+        Returns {filename: dict(image_fn, label_fn, std_fn)} for the passed frames.
+        Missing images or labels are reported together.
+        """
+        img_dir = self.cfg.data_dir.img_dir
+        label_dir = os.path.join(self.cfg.data_dir.labels_dir, self.cfg.label)
+        std_dir = os.path.join(self.cfg.data_dir.labels_dir, 'std')
+        # ! A single listing per directory instead of probing every file
+        img_files = set(os.listdir(img_dir)) if os.path.isdir(img_dir) else set()
+        if self.label_store is not None:
+            # ! Labels and std are read from the label store
+            label_files, std_files = set(), set()
+        else:
+            label_files = set(os.listdir(label_dir)) if os.path.isdir(label_dir) else set()
+            std_files = set(os.listdir(std_dir)) if os.path.isdir(std_dir) else set()
+
+        manifest = {}
+        missing = []
+        for filename in list_filenames:
+            image_fn = next((f"{filename}{ext}" for ext in ('.jpg', '.png') if f"{filename}{ext}" in img_files), None)
+            label_fn = next((f"{filename}{ext}" for ext in ('.npy', '.npz') if f"{filename}{ext}" in label_files), None)
+            if self.label_store is not None and filename in self.label_store:
+                label_fn = self.label_store.store_dir
+            if image_fn is None:
+                missing.append(os.path.join(img_dir, filename))
+            if label_fn is None:
+                missing.append(os.path.join(label_dir if self.label_store is None else self.label_store.store_dir, filename))
+            if image_fn is None or label_fn is None:
+                continue
+            manifest[filename] = dict(
+                image_fn=os.path.join(img_dir, image_fn),
+                label_fn=os.path.join(label_dir, label_fn) if self.label_store is None else None,
+                std_fn=os.path.join(std_dir, f"{filename}.npy") if f"{filename}.npy" in std_files else None,
+            )
+
+        if missing.__len__() > 0:
+            [logging.error(f"Not found {fn}") for fn in missing]
+            raise ValueError(f"Not found {missing.__len__()} images/labels for {self.cfg.label} (see log)")
+        return manifest
         
     def __len__(self):
         return self.data.__len__()
 
+    def read_image(self, image_fn, idx=None):
+        img = read_rgb(image_fn, idx, cache=get_image_cache(self.cfg.get('image_cache', None)))
+        if self.uint8_images:
+            # ! Normalized in the main process (see normalize_uint8_batch())
+            return img
+        return img.astype(np.float32) / 255.
+
+    def load_from_files(self, filename):
+        frame = self.manifest[filename]
+        img = self.read_image(frame["image_fn"])
+
+        if self.label_store is not None:
+            label = self.label_store.get_label(filename)
+            std = self.label_store.get_std(filename)
+            return img, label, np.ones_like(label) if std is None else std
+
+        if frame["label_fn"].endswith(".npz"):
+            label = np.load(frame["label_fn"])["phi_coords"]
+        else:
+            label = np.load(frame["label_fn"])
+
+        if frame["std_fn"] is not None:
+            std = np.load(frame["std_fn"])
+        else:
+            std = np.ones_like(label)
+        return img, label, std
+
+    def load_from_shard(self, filename):
+        shard = get_shard(get_shard_fn(self.shard_dir, get_scene_room_from_scene_room_idx(filename)))
+        img = self.read_image(shard.filename, filename)
+
+        if not shard.has_label(self.cfg.label, filename):
+            raise ValueError(f"Not found {self.cfg.label} for {filename} in {shard.filename}")
+        label = shard.get_label(self.cfg.label, filename)
+
+        if shard.has_label('std', filename):
+            std = shard.get_label('std', filename)
+        else:
+            std = np.ones_like(label)
+        return img, label, std
+
     def __getitem__(self, idx):
         # ! iteration per each self.data given a idx
         filename = os.path.splitext(self.data[idx])[0]
-        label_fn = os.path.join(self.cfg.data_dir.labels_dir, self.cfg.label, f"{filename}")
-            
-        std_fn = os.path.join(self.cfg.data_dir.labels_dir, 'std', f"{filename}.npy")
-        image_fn = os.path.join(self.cfg.data_dir.img_dir, f"{filename}")
-        
-        if os.path.exists(image_fn + '.jpg'):
-            image_fn += '.jpg'
-        elif os.path.exists(image_fn + '.png'):
-            image_fn += '.png'
-        
-        img = np.array(Image.open(image_fn), np.float32)[..., :3] / 255.
-        
-        if os.path.exists(label_fn + ".npy"):
-            label = np.load(label_fn + ".npy")
-        elif os.path.exists(label_fn + ".npz"):
-            label = np.load(label_fn + ".npz")["phi_coords"]
+        if self.shard_dir:
+            img, label, std = self.load_from_shard(filename)
         else:
-            raise ValueError(f"Not found {label_fn}")
+            img, label, std = self.load_from_files(filename)
         
+        flip, dx, p = self.get_augmentation(img.shape[1])
+        if flip:
+            label = np.flip(label, axis=len(label.shape) - 1)
+        if dx != 0:
+            label = np.roll(label, dx, axis=len(label.shape) - 1)
+        label = torch.FloatTensor(label.copy())
+        std = torch.FloatTensor(std.copy())
+
+        if self.uint8_images:
+            # ! CHW view of the decoded image (no copies in the worker)
+            x = torch.from_numpy(img).permute(2, 0, 1)
+            aug = torch.tensor([flip, dx, p], dtype=torch.float64)
+            return [x, label, std, aug]
+
         # Random flip
-        if self.cfg.get('flip', False) and np.random.randint(2) == 0:
+        if flip:
             img = np.flip(img, axis=1)
-            label = np.flip(label, axis=len(label.shape) - 1)
 
         # Random horizontal rotate
-        if self.cfg.get('rotate', False):
-            dx = np.random.randint(img.shape[1])
+        if dx != 0:
             img = np.roll(img, dx, axis=1)
-            label = np.roll(label, dx, axis=len(label.shape) - 1)
 
         # Random gamma augmentation
         if self.cfg.get('gamma', False):
-            p = np.random.uniform(1, 2)
-            if np.random.randint(2) == 0:
-                p = 1 / p
             img = img**p
         
-        if os.path.exists(std_fn):
-            std = np.load(std_fn)
-        else:
-            std = np.ones_like(label)
-        
         x = torch.FloatTensor(img.transpose([2, 0, 1]).copy())
-        label = torch.FloatTensor(label.copy())
-        std = torch.FloatTensor(std.copy())
         return [x, label, std]
 
+    def get_augmentation(self, width):
+        """
+        Returns the random (flip, dx, gamma) augmentation of a frame
+        """
+        flip = self.cfg.get('flip', False) and np.random.randint(2) == 0
+        dx = np.random.randint(width) if self.cfg.get('rotate', False) else 0
+        p = 1
+        if self.cfg.get('gamma', False):
+            p = np.random.uniform(1, 2)
+            if np.random.randint(2) == 0:
+                p = 1 / p
+        return flip, dx, p
+
+
+def normalize_uint8_batch(x, aug):
+    """
+    Returns the float images (B, 3, H, W) in [0, 1] of a uint8 batch of MVLDataLoader,
+    applying the flip, horizontal rotation and gamma (aug (B, 3)) drawn by the workers.
+    The result is the same as the float32 path of MVLDataLoader.
+    """
+    B, C, H, W = x.shape
+    flip, dx = aug[:, 0].to(x.device) > 0, aug[:, 1].to(x.device).long()
+    if torch.any(flip) or torch.any(dx != 0):
+        # ! Flip and rotation as a single column gather
+        cols = (torch.arange(W, device=x.device)[None] - dx[:, None]) % W
+        cols = torch.where(flip[:, None], W - 1 - cols, cols)
+        x = torch.gather(x, 3, cols[:, None, None, :].expand(B, C, H, W))
+
+    if torch.all(aug[:, 2] == 1):
+        return x.float() / 255.
+
+    # ! Gamma as a lookup table per image (the same float32 values as img**p)
+    lut = np.stack([(np.arange(256, dtype=np.float32) / 255.)**p for p in aug[:, 2].tolist()])
+    lut = torch.from_numpy(lut).to(x.device)
+    return torch.gather(lut, 1, x.reshape(B, -1).long()).reshape(B, C, H, W)
+
+
+def unpack_batch(batch, device=None):
+    """
+    Returns x, label, std from a batch of MVLDataLoader.
+    uint8 batches are moved to device (if defined) and normalized there.
+    """
+    if batch.__len__() == 3:
+        return batch
+    x, label, std, aug = batch
+    if device is not None:
+        x = x.to(device)
+    return normalize_uint8_batch(x, aug), label, std
@@ -0,0 +1,143 @@
+import os
+import logging
+import numpy as np
+from torch.utils.data import Sampler
+from mvl_challenge.datasets.image_cache import get_image_cache
+from mvl_challenge.utils.io_utils import get_scene_room_from_scene_room_idx
+
+
+def get_room_groups(dataset):
+    """
+    Returns a list of arrays with the dataset indexes of every room.
+    Rooms are defined by the scene list (dataset.raw_data) if available.
+    """
+    frame_rows = {}
+    for row, frame in enumerate(dataset.data):
+        frame_rows.setdefault(frame, []).append(row)
+
+    if dataset.list_rooms is not None:
+        list_groups = [
+            [row for frame in dataset.raw_data[room] for row in frame_rows.get(frame, [])]
+            for room in dataset.list_rooms
+        ]
+    else:
+        rooms = {}
+        for row, frame in enumerate(dataset.data):
+            room = get_scene_room_from_scene_room_idx(os.path.splitext(frame)[0])
+            rooms.setdefault(room, []).append(row)
+        list_groups = list(rooms.values())
+    return [np.array(rows, dtype=np.int64) for rows in list_groups if rows.__len__() > 0]
+
+
+class RoomBatchSampler(Sampler):
+    """
+    Batch sampler for MVLDataLoader which draws shuffled blocks of frames of the same room,
+    so room-level resources (shards, label stores, image cache pages) are reused by consecutive samples.
+
+    locality in [0, 1] trades randomness for I/O locality. The block size is the largest
+    divisor of batch_size not above locality x batch_size frames, so blocks never straddle
+    batches: 0 is a frame-wise global shuffle, 1 means every batch from a single room.
+    The leftover frames of every room (fewer than a block) are shuffled into mixed batches.
+    """
+
+    def __init__(self, dataset, batch_size, locality=1.0, drop_last=True):
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        max_block_size = max(1, int(round(locality * batch_size)))
+        self.block_size = max(d for d in range(1, max_block_size + 1) if batch_size % d == 0)
+        self.room_groups = get_room_groups(dataset)
+        self.num_frames = int(sum(rows.size for rows in self.room_groups))
+        self.room_hit_rate = 0
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_frames // self.batch_size
+        return (self.num_frames + self.batch_size - 1) // self.batch_size
+
+    def get_batches(self):
+        """
+        Returns the batches of an epoch as (rows, room ids) in random order.
+        The partial batch (if any) is the last one.
+        """
+        blocks, leftovers = [], []
+        for room_id, rows in enumerate(self.room_groups):
+            rows = np.random.permutation(rows)
+            num_full = rows.size - rows.size % self.block_size
+            blocks += [
+                (rows[i : i + self.block_size], np.full(self.block_size, room_id))
+                for i in range(0, num_full, self.block_size)
+            ]
+            leftovers += [(row, room_id) for row in rows[num_full:]]
+
+        # ! Full blocks are grouped into batches, so a batch holds batch_size / block_size blocks
+        blocks = [blocks[i] for i in np.random.permutation(blocks.__len__())]
+        blocks_per_batch = self.batch_size // self.block_size
+        batches = [
+            (
+                np.concatenate([rows for rows, _ in blocks[i : i + blocks_per_batch]]),
+                np.concatenate([rooms for _, rooms in blocks[i : i + blocks_per_batch]]),
+            )
+            for i in range(0, blocks.__len__(), blocks_per_batch)
+        ]
+        # ! Leftover frames (and the remaining blocks) are mixed
+        if batches.__len__() > 0 and batches[-1][0].size < self.batch_size:
+            rows, rooms = batches.pop()
+            leftovers += list(zip(rows, rooms))
+        leftovers = [leftovers[i] for i in np.random.permutation(leftovers.__len__())]
+        leftover_batches = [
+            (
+                np.array([row for row, _ in leftovers[i : i + self.batch_size]], dtype=np.int64),
+                np.array([room for _, room in leftovers[i : i + self.batch_size]]),
+            )
+            for i in range(0, leftovers.__len__(), self.batch_size)
+        ]
+        partial = []
+        if leftover_batches.__len__() > 0 and leftover_batches[-1][0].size < self.batch_size:
+            partial = [leftover_batches.pop()]
+        batches += leftover_batches
+        return [batches[i] for i in np.random.permutation(batches.__len__())] + partial
+
+    def __iter__(self):
+        batches = self.get_batches()
+        if batches.__len__() == 0:
+            return
+        rooms = np.concatenate([rooms for _, rooms in batches])
+
+        # ! Fraction of samples from the same room as the previous sample
+        self.room_hit_rate = float(np.mean(rooms[1:] == rooms[:-1])) if rooms.size > 1 else 0
+
+        for batch, _ in batches:
+            if batch.size < self.batch_size and self.drop_last:
+                return
+            yield batch.tolist()
+
+
+class CacheHitReport:
+    """
+    Reports, per epoch, the room locality of a RoomBatchSampler and the hit rate
+    of the decoded-image cache (if defined in the dataset cfg).
+    """
+
+    def __init__(self, dataset, sampler=None):
+        self.sampler = sampler
+        self.image_cache = get_image_cache(dataset.cfg.get("image_cache", None))
+        self.last_stats = self.get_image_cache_stats()
+
+    def get_image_cache_stats(self):
+        if self.image_cache is None:
+            return None
+        return self.image_cache.get_stats()
+
+    def get_epoch_report(self):
+        report = {}
+        if isinstance(self.sampler, RoomBatchSampler):
+            report["room_hit_rate"] = self.sampler.room_hit_rate
+        stats = self.get_image_cache_stats()
+        if stats is not None:
+            hits = stats["hits"] - self.last_stats["hits"]
+            misses = stats["misses"] - self.last_stats["misses"]
+            report["image_cache_hit_rate"] = hits / max(hits + misses, 1)
+            self.last_stats = stats
+        for key, value in report.items():
+            logging.info(f"{key}: {value:.3f}")
+        return report
@@ -1,2 +1,3 @@
 from .layout import Layout
 from .cam_pose import CamPose
+from .layout_batch import LayoutBatch
@@ -61,6 +61,15 @@ class CamPose:
         )
         self.__pose[:3, 3] = value
 
+    def set_rot_and_t(self, rot, t):
+        """
+        Sets rotation and translation at once. The rotation is assumed to be
+        already validated (e.g., by GeometryStore), so isRotationMatrix is skipped.
+        """
+        self.__pose[:3, :3] = rot
+        self.__rot = self.__pose[:3, :3]
+        self.t = t
+
     def SE3_scaled(self):
         m = np.eye(4)
         m[0:3, 0:3] = self.rot
@@ -1,8 +1,11 @@
 import numpy as np
 
 from mvl_challenge.utils.geometry_utils import extend_array_to_homogeneous
-from mvl_challenge.utils.spherical_utils import phi_coords2xyz
+from mvl_challenge.utils.spherical_utils import phi_coords2xyz, phi_coords2xyz_batch
 
+from mvl_challenge.datasets.mvl_shard import get_shard, is_shard_fn
+from mvl_challenge.datasets.image_cache import get_image_cache
+from omegaconf import OmegaConf
 from .cam_pose import CAM_REF
 from imageio import imread
 
@@ -17,12 +20,99 @@ class Layout:
         self.__phi_coords = value
         if value is None:
             return
-        self.recompute_ly_geometry()
+        # ! Geometry is computed lazily on first access (see update_ly_geometry())
+        self.cam_ref = CAM_REF.WC
+        self.__geometry_outdated = True
 
     def set_phi_coords(self, phi_coords):
         self.phi_coords = phi_coords
 
+    # ! Inputs of the layout geometry. Changing them outdates the geometry
+    @property
+    def pose(self):
+        return self.__pose
+
+    @pose.setter
+    def pose(self, value):
+        self.__pose = value
+        self.__geometry_outdated = self.phi_coords is not None
+
+    @property
+    def camera_height(self):
+        return self.__camera_height
+
+    @camera_height.setter
+    def camera_height(self, value):
+        self.__camera_height = value
+        self.__geometry_outdated = self.phi_coords is not None
+
+    @property
+    def ceiling_height(self):
+        return self.__ceiling_height
+
+    @ceiling_height.setter
+    def ceiling_height(self, value):
+        self.__ceiling_height = value
+        self.__geometry_outdated = self.phi_coords is not None
+
+    @property
+    def scale(self):
+        return self.__scale
+
+    @scale.setter
+    def scale(self, value):
+        self.__scale = value
+        self.__geometry_outdated = self.phi_coords is not None
+
+    # ! Layout geometry. Computed from the inputs on first access and cached
+    @property
+    def bearings_floor(self):
+        self.update_ly_geometry()
+        return self.__bearings_floor
+
+    @bearings_floor.setter
+    def bearings_floor(self, value):
+        self.__bearings_floor = value
+
+    @property
+    def bearings_ceiling(self):
+        self.update_ly_geometry()
+        return self.__bearings_ceiling
+
+    @bearings_ceiling.setter
+    def bearings_ceiling(self, value):
+        self.__bearings_ceiling = value
+
+    @property
+    def boundary_floor(self):
+        self.update_ly_geometry()
+        return self.__boundary_floor
+
+    @boundary_floor.setter
+    def boundary_floor(self, value):
+        self.__boundary_floor = value
+
+    @property
+    def boundary_ceiling(self):
+        self.update_ly_geometry()
+        return self.__boundary_ceiling
+
+    @boundary_ceiling.setter
+    def boundary_ceiling(self, value):
+        self.__boundary_ceiling = value
+
+    @property
+    def cam2boundary(self):
+        self.update_ly_geometry()
+        return self.__cam2boundary
+
+    @cam2boundary.setter
+    def cam2boundary(self, value):
+        self.__cam2boundary = value
+
     def __init__(self, cfg):
+        self.__phi_coords = None
+        self.__geometry_outdated = False
         self.cfg = cfg
 
         self.boundary_floor = None
@@ -39,6 +129,7 @@ class Layout:
         self.idx = ""
 
         self.phi_coords = None
+        self.phi_coords_std = None  # ! Per-column std of the estimation (e.g. TTA)
         self.cam_ref = CAM_REF.CC
         self.ceiling_height = None  # ! Must be None by default
         self.camera_height = 1
@@ -49,6 +140,34 @@ class Layout:
         self.bound_scale = 1
         self.bound_center = np.zeros((3, 1))
 
+    def update_ly_geometry(self):
+        """
+        Computes the layout geometry only if it is outdated, i.e., phi_coords
+        or any other input (pose, camera_height, ceiling_height, scale) has changed.
+        Note that in-place changes of the pose instance are not tracked.
+        """
+        if self.__geometry_outdated:
+            self.recompute_ly_geometry()
+
+    def set_ly_geometry(
+        self,
+        bearings_ceiling,
+        bearings_floor,
+        boundary_ceiling,
+        boundary_floor,
+        cam2boundary,
+    ):
+        """
+        Sets the layout geometry computed outside this instance (see compute_list_ly_geometry())
+        """
+        self.__geometry_outdated = False
+        self.bearings_ceiling = bearings_ceiling
+        self.bearings_floor = bearings_floor
+        self.boundary_ceiling = boundary_ceiling
+        self.boundary_floor = boundary_floor
+        self.cam2boundary = cam2boundary
+        self.cam_ref = CAM_REF.WC
+
     def apply_vo_scale(self, scale):
 
         if self.cam_ref == CAM_REF.WC_SO3:
@@ -112,6 +231,7 @@ class Layout:
         # self.cam2boundary_mask = self.cam2boundary < np.quantile(self.cam2boundary, 0.25)
 
     def recompute_ly_geometry(self):
+        self.__geometry_outdated = False
 
         # ! Compute bearings
         self.bearings_ceiling = phi_coords2xyz(phi_coords=self.phi_coords[0, :])
@@ -125,6 +245,10 @@ class Layout:
             :3, :
         ] @ extend_array_to_homogeneous(pcl)
 
+        # ! The floor boundary in camera coordinates is pcl, thus
+        # ! compute_cam2boundary() is not needed here (no inverse pose)
+        self.cam2boundary = np.linalg.norm(pcl[(0, 2), :], axis=0)
+
         # from mlc.utils.vispy_utils.vispy_utils import plot_pcl
         # ! Compute ceiling boundary
         if self.ceiling_height is None:
@@ -143,7 +267,6 @@ class Layout:
         self.boundary_ceiling = self.pose.SE3_scaled()[
             :3, :
         ] @ extend_array_to_homogeneous(pcl)
-        self.compute_cam2boundary()
 
     def transform_to_WC_SO3(self):
 
@@ -165,7 +288,86 @@ class Layout:
         self.boundary_ceiling = self.apply_normalization(self.bearings_ceiling)
 
     def get_rgb(self):
+        cache = get_image_cache(OmegaConf.select(self.cfg, "runners.mvl.image_cache", default=None))
+        if cache is not None:
+            return cache.get_rgb(self.img_fn, self.idx)
+        if is_shard_fn(self.img_fn):
+            return get_shard(self.img_fn).get_rgb(self.idx)
         return imread(self.img_fn)
 
     def apply_normalization(self, xyz):
-        return (xyz - self.bound_center)/self.bound_scale
\ No newline at end of file
+        return (xyz - self.bound_center)/self.bound_scale
+
+
+def compute_list_ly_geometry(list_ly):
+    """
+    Computes the geometry of all layouts in list_ly (e.g. a room) in one vectorized pass.
+    This is equivalent to calling recompute_ly_geometry() for every layout.
+    """
+    list_ly = [ly for ly in list_ly if ly.phi_coords is not None]
+    if list_ly.__len__() == 0:
+        return
+
+    phi_coords = np.stack([ly.phi_coords[:2] for ly in list_ly])
+    poses = np.stack([ly.pose.SE3_scaled() for ly in list_ly])
+    camera_heights = np.array([ly.camera_height for ly in list_ly], dtype=np.float64)
+    scales = np.array([ly.scale for ly in list_ly], dtype=np.float64)
+    ceiling_heights = np.array(
+        [np.nan if ly.ceiling_height is None else ly.ceiling_height for ly in list_ly],
+        dtype=np.float64,
+    )
+
+    geometry = compute_boundaries_from_phi_coords(
+        phi_coords, poses, camera_heights, scales, ceiling_heights
+    )
+    for i, ly in enumerate(list_ly):
+        ly.set_ly_geometry(*[data[i] for data in geometry])
+
+
+def compute_boundaries_from_phi_coords(
+    phi_coords, poses, camera_heights, scales=None, ceiling_heights=None
+):
+    """
+    Vectorized layout geometry for N layouts.
+
+    Args:
+        phi_coords (N, 2, W): ceiling and floor phi_coords
+        poses (N, 4, 4): SE3 camera poses (scaled)
+        camera_heights (N,): camera heights
+        scales (N,): layout scales. Defaults to ones.
+        ceiling_heights (N,): ceiling heights, NaN means not defined (ceiling is
+            forced to be consistent with the floor). Defaults to NaN.
+
+    Returns:
+        bearings_ceiling, bearings_floor, boundary_ceiling, boundary_floor (N, 3, W)
+        and cam2boundary (N, W)
+    """
+    N = phi_coords.shape[0]
+    scales = np.ones(N) if scales is None else scales
+    ceiling_heights = np.full(N, np.nan) if ceiling_heights is None else ceiling_heights
+
+    bearings_ceiling = phi_coords2xyz_batch(phi_coords[:, 0, :])
+    bearings_floor = phi_coords2xyz_batch(phi_coords[:, 1, :])
+
+    # ! Floor boundary in camera coordinates
+    ly_scale = camera_heights[:, None] / bearings_floor[:, 1, :]
+    pcl_floor = (ly_scale * scales[:, None])[:, None, :] * bearings_floor
+    cam2boundary = np.linalg.norm(pcl_floor[:, (0, 2), :], axis=1)
+
+    # ! Ceiling boundary in camera coordinates
+    scale_ceil = cam2boundary / np.linalg.norm(bearings_ceiling[:, (0, 2), :], axis=1)
+    pcl_ceiling = scale_ceil[:, None, :] * bearings_ceiling
+    defined_ceiling = ~np.isnan(ceiling_heights)
+    if np.any(defined_ceiling):
+        ly_scale = (ceiling_heights - camera_heights)[:, None] / bearings_ceiling[:, 1, :]
+        pcl_ceiling[defined_ceiling] = (
+            (ly_scale * scales[:, None])[:, None, :] * bearings_ceiling
+        )[defined_ceiling]
+
+    rot = poses[:, :3, :3]
+    t = poses[:, :3, 3:]
+    boundary_floor = rot @ pcl_floor + t
+    boundary_ceiling = rot @ pcl_ceiling + t
+
+    return bearings_ceiling, bearings_floor, boundary_ceiling, boundary_floor, cam2boundary
+
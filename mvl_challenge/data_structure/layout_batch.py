@@ -0,0 +1,186 @@
+import numpy as np
+
+from .layout import Layout, compute_boundaries_from_phi_coords
+from .cam_pose import CamPose, CAM_REF
+
+
+class LayoutBatch:
+    """
+    Struct-of-arrays representation of a list of layouts (e.g. a whole room).
+    phi_coords (N, 2, W), poses (N, 4, 4), camera heights (N,) and the derived
+    geometry (N, 3, W) are stored as contiguous arrays.
+    """
+
+    def __init__(
+        self,
+        phi_coords,
+        poses,
+        camera_heights,
+        ceiling_heights=None,
+        scales=None,
+        list_idx=None,
+        list_img_fn=None,
+        cfg=None,
+    ):
+        self.cfg = cfg
+        self.phi_coords = np.ascontiguousarray(phi_coords, dtype=np.float64)
+        N = self.phi_coords.shape[0]
+
+        self.poses = np.ascontiguousarray(poses, dtype=np.float64)
+        self.camera_heights = np.asarray(camera_heights, dtype=np.float64).reshape(N)
+        # ! NaN means ceiling_height=None (see Layout.recompute_ly_geometry())
+        self.ceiling_heights = (
+            np.full(N, np.nan)
+            if ceiling_heights is None
+            else np.asarray(ceiling_heights, dtype=np.float64).reshape(N)
+        )
+        self.scales = (
+            np.ones(N) if scales is None else np.asarray(scales, dtype=np.float64).reshape(N)
+        )
+        self.list_idx = [""] * N if list_idx is None else list(list_idx)
+        self.list_img_fn = [""] * N if list_img_fn is None else list(list_img_fn)
+
+        assert self.poses.shape == (N, 4, 4), f"Wrong poses shape {self.poses.shape}"
+        assert self.list_idx.__len__() == N
+        assert self.list_img_fn.__len__() == N
+
+        self.bearings_ceiling = None
+        self.bearings_floor = None
+        self.boundary_ceiling = None
+        self.boundary_floor = None
+        self.cam2boundary = None
+        self.cam_ref = CAM_REF.WC
+
+        # ! data for normalize boundaries
+        self.bound_scale = 1
+        self.bound_center = np.zeros((3, 1))
+
+        self.recompute_ly_geometry()
+
+    def __len__(self):
+        return self.phi_coords.shape[0]
+
+    def __getitem__(self, mask):
+        """
+        Returns a new LayoutBatch with the selected layouts (boolean mask or indexes)
+        """
+        rows = np.arange(self.__len__())[mask]
+        return LayoutBatch(
+            phi_coords=self.phi_coords[rows],
+            poses=self.poses[rows],
+            camera_heights=self.camera_heights[rows],
+            ceiling_heights=self.ceiling_heights[rows],
+            scales=self.scales[rows],
+            list_idx=[self.list_idx[r] for r in rows],
+            list_img_fn=[self.list_img_fn[r] for r in rows],
+            cfg=self.cfg,
+        )
+
+    @classmethod
+    def from_list_ly(cls, list_ly):
+        assert list_ly.__len__() > 0, "Empty list of layouts"
+        return cls(
+            phi_coords=np.stack([ly.phi_coords[:2] for ly in list_ly]),
+            poses=np.stack([ly.pose.SE3_scaled() for ly in list_ly]),
+            camera_heights=[ly.camera_height for ly in list_ly],
+            ceiling_heights=[
+                np.nan if ly.ceiling_height is None else ly.ceiling_height
+                for ly in list_ly
+            ],
+            scales=[ly.scale for ly in list_ly],
+            list_idx=[ly.idx for ly in list_ly],
+            list_img_fn=[ly.img_fn for ly in list_ly],
+            cfg=list_ly[0].cfg,
+        )
+
+    def to_list_ly(self):
+        """
+        Returns a list of Layout instances. Their geometry is a view of this batch.
+        """
+        list_ly = []
+        for i in range(self.__len__()):
+            ly = Layout(self.cfg)
+            ly.idx = self.list_idx[i]
+            ly.img_fn = self.list_img_fn[i]
+            ly.pose = CamPose(self.cfg)
+            ly.pose.set_rot_and_t(self.poses[i, :3, :3], self.poses[i, :3, 3])
+            ly.pose.idx = ly.idx
+            ly.camera_height = float(self.camera_heights[i])
+            if not np.isnan(self.ceiling_heights[i]):
+                ly.ceiling_height = float(self.ceiling_heights[i])
+            ly.scale = float(self.scales[i])
+            ly.phi_coords = self.phi_coords[i]
+            ly.set_ly_geometry(
+                self.bearings_ceiling[i],
+                self.bearings_floor[i],
+                self.boundary_ceiling[i],
+                self.boundary_floor[i],
+                self.cam2boundary[i],
+            )
+            ly.cam_ref = self.cam_ref
+            ly.bound_scale = self.bound_scale
+            ly.bound_center = self.bound_center
+            list_ly.append(ly)
+        return list_ly
+
+    def recompute_ly_geometry(self):
+        (
+            self.bearings_ceiling,
+            self.bearings_floor,
+            self.boundary_ceiling,
+            self.boundary_floor,
+            self.cam2boundary,
+        ) = compute_boundaries_from_phi_coords(
+            phi_coords=self.phi_coords,
+            poses=self.poses,
+            camera_heights=self.camera_heights,
+            scales=self.scales,
+            ceiling_heights=self.ceiling_heights,
+        )
+        self.cam_ref = CAM_REF.WC
+
+    def get_pcl(self, ceil_or_floor=""):
+        """
+        Returns the boundaries of all layouts as a single pcl (3, N*W).
+        Same as np.hstack([ly.boundary_* for ly in list_ly])
+        """
+        if ceil_or_floor == "ceil":
+            boundaries = self.boundary_ceiling
+        elif ceil_or_floor == "floor":
+            boundaries = self.boundary_floor
+        else:
+            boundaries = np.concatenate((self.boundary_floor, self.boundary_ceiling))
+        return boundaries.transpose(1, 0, 2).reshape(3, -1)
+
+    def get_noisy_mask(self, max_room_factor_size=2):
+        """
+        Returns a boolean mask (N,) of the layouts which have an estimation greater
+        than max_room_factor_size x median( of all cam distances). See filter_out_noisy_layouts()
+        """
+        max_cam2boundary = self.cam2boundary.max(axis=1)
+        return ~(max_cam2boundary < max_room_factor_size * np.median(max_cam2boundary))
+
+    def filter_out_noisy_layouts(self, max_room_factor_size=2):
+        return self[~self.get_noisy_mask(max_room_factor_size)]
+
+    def normalize_boundaries(self, scale_and_center=None):
+        """
+        Vectorized version of normalize_list_ly()
+        """
+        if scale_and_center is None:
+            pcl = self.get_pcl("floor")
+            center = np.median(pcl, axis=1, keepdims=True)
+            pcl = pcl - center
+            scale = np.max(np.linalg.norm(pcl[(0, 2), :], axis=0))
+        else:
+            scale, center = scale_and_center
+        assert (
+            scale > 0
+        ), "Zero or negative scale is not allowed to normalize a layout bondary"
+
+        self.bound_scale = scale
+        self.bound_center = center
+        # ! Same as Layout.normalize_boundaries()
+        self.boundary_floor = (self.bearings_floor - center) / scale
+        self.boundary_ceiling = (self.bearings_ceiling - center) / scale
+        return scale, center
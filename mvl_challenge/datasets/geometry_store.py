@@ -0,0 +1,84 @@
+import os
+import json
+import logging
+import numpy as np
+from tqdm import tqdm
+from mvl_challenge.utils.geometry_utils import (
+    quaternions2rotation_matrices,
+    areRotationMatrices,
+)
+
+# ! Columnar geometry info. One record per frame as defined in geometry_info/*.json
+GEOMETRY_STORE_DTYPE = np.dtype(
+    [
+        ("idx", "S64"),
+        ("translation", "<f8", (3,)),
+        ("quaternion", "<f8", (4,)),
+        ("cam_h", "<f8"),
+    ]
+)
+
+
+def create_geometry_store(geom_info_dir, list_frames, filename):
+    """
+    Reads the geometry_info/*.json files of the passed list of frames
+    and saves them into a single columnar file (*.npy)
+    """
+    data = np.zeros(list_frames.__len__(), dtype=GEOMETRY_STORE_DTYPE)
+    for i, frame in enumerate(tqdm(list_frames, desc="Reading geometry info...")):
+        idx = os.path.splitext(frame)[0]
+        geom_fn = os.path.join(geom_info_dir, f"{idx}.json")
+        assert os.path.exists(geom_fn), f"Not found {geom_fn}"
+        geom = json.load(open(geom_fn))
+        data[i]["idx"] = idx.encode()
+        data[i]["translation"] = geom["translation"]
+        data[i]["quaternion"] = geom["quaternion"]
+        data[i]["cam_h"] = geom["cam_h"]
+
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    np.save(filename, data)
+    logging.info(f"Geometry store saved at {filename}")
+
+
+class GeometryStore:
+    """
+    Geometry info (translations Nx3, quaternions Nx4, cam_h N) for a whole scene list.
+    Rotation matrices are computed once for all frames in a single vectorized pass.
+    """
+
+    def __init__(self, filename):
+        assert os.path.exists(filename), f"Not found {filename}"
+        self.filename = filename
+        self.data = np.load(filename, mmap_mode="r")
+        self.list_idx = [idx.decode() for idx in self.data["idx"]]
+        self.rows = {idx: row for row, idx in enumerate(self.list_idx)}
+
+        self.translation = np.array(self.data["translation"])
+        self.cam_h = np.array(self.data["cam_h"])
+        self.rot = quaternions2rotation_matrices(self.data["quaternion"])
+        assert np.all(areRotationMatrices(self.rot)), f"Invalid rotations in {filename}"
+
+    def __contains__(self, idx):
+        return idx in self.rows
+
+    def __len__(self):
+        return self.list_idx.__len__()
+
+    def get_rows(self, list_idx):
+        return np.array([self.rows[idx] for idx in list_idx], dtype=np.int64)
+
+    def get_poses(self, list_idx):
+        """
+        Returns the SE3 camera poses (N, 4, 4) for the passed list of frames
+        """
+        rows = self.get_rows(list_idx)
+        poses = np.tile(np.eye(4), (rows.size, 1, 1))
+        poses[:, :3, :3] = self.rot[rows]
+        poses[:, :3, 3] = self.translation[rows]
+        return poses
+
+    def check_frames(self, list_frames):
+        missing = [fr for fr in list_frames if os.path.splitext(fr)[0] not in self.rows]
+        assert (
+            missing.__len__() == 0
+        ), f"{missing.__len__()} frames not found in {self.filename}, e.g., {missing[:5]}"
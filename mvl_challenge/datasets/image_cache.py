@@ -0,0 +1,272 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image
+from mvl_challenge.datasets.mvl_shard import get_shard, is_shard_fn
+
+IMAGE_CACHE_MAGIC = b"MVLIMC02"
+IMAGE_CACHE_ALIGN = 64
+
+# ! One record per slot. Keys are sha1 digests of the image source (file or shard::idx).
+# ! generation is odd while the slot is being written (see ImageCache.put())
+IMAGE_CACHE_INDEX_DTYPE = np.dtype(
+    [
+        ("key", "S40"),
+        ("valid", "u1"),
+        ("generation", "<u8"),
+        ("last_access", "<f8"),
+    ]
+)
+# ! Counters shared by all processes (approximate, updated without lock)
+IMAGE_CACHE_STATS_DTYPE = np.dtype([("hits", "<u8"), ("misses", "<u8")])
+
+
+def _align(offset):
+    return (offset + IMAGE_CACHE_ALIGN - 1) // IMAGE_CACHE_ALIGN * IMAGE_CACHE_ALIGN
+
+
+def get_image_key(img_fn, idx=None):
+    if is_shard_fn(img_fn):
+        return f"{os.path.abspath(img_fn)}::{idx}"
+    return os.path.abspath(img_fn)
+
+
+class ImageCache:
+    """
+    Decoded-image cache (uint8 H x W x 3) in a single memory-mapped file, shared
+    across epochs and processes (e.g. DataLoader workers). The file is created with
+    the shape of the first cached image, and it holds as many images as max_bytes allows.
+    The least recently used image is evicted when the cache is full.
+    Images can be downscaled by an integer factor before being cached (more images
+    for the same max_bytes). They are upsampled back to their original size when read,
+    so readers always get full-size images (with less detail).
+
+    Writers hold a file lock. Readers do not lock: they copy the image and check that
+    the slot still holds the same key and generation (a seqlock), otherwise it is a miss.
+    """
+
+    def __init__(self, filename, max_bytes, downscale=1):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.downscale = downscale
+        self.slots = {}
+        self.__buffer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_ImageCache__buffer"] = None
+        return state
+
+    @contextmanager
+    def lock(self):
+        with open(f"{self.filename}.lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def create(self, shape, full_shape):
+        slot_size = int(np.prod(shape))
+        num_slots = max(1, int(self.max_bytes // slot_size))
+        header = dict(
+            shape=list(shape),
+            full_shape=list(full_shape),
+            num_slots=num_slots,
+            downscale=self.downscale,
+            index_offset=0,
+            stats_offset=_align(num_slots * IMAGE_CACHE_INDEX_DTYPE.itemsize),
+        )
+        header["images_offset"] = _align(header["stats_offset"] + IMAGE_CACHE_STATS_DTYPE.itemsize)
+        header_bytes = json.dumps(header).encode()
+        data_start = _align(IMAGE_CACHE_MAGIC.__len__() + 8 + header_bytes.__len__())
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        tmp_fn = f"{self.filename}.tmp"
+        with open(tmp_fn, "wb") as f:
+            f.write(IMAGE_CACHE_MAGIC)
+            f.write(np.array([header_bytes.__len__()], dtype="<u8").tobytes())
+            f.write(header_bytes)
+            f.truncate(data_start + header["images_offset"] + num_slots * slot_size)
+        os.replace(tmp_fn, self.filename)
+        logging.info(
+            f"Image cache created at {self.filename}: {num_slots} images of {tuple(shape)}"
+        )
+
+    @property
+    def is_open(self):
+        return self.__buffer is not None
+
+    def open(self):
+        """
+        Memory-maps the cache file. Returns False if the file does not exist yet.
+        """
+        if self.is_open:
+            return True
+        if not os.path.exists(self.filename):
+            return False
+        with open(self.filename, "rb") as f:
+            magic = f.read(IMAGE_CACHE_MAGIC.__len__())
+            if magic != IMAGE_CACHE_MAGIC:
+                assert magic.startswith(IMAGE_CACHE_MAGIC[:-2]), f"Not an image cache {self.filename}"
+                # ! Previous version of the cache. It is created again by put()
+                logging.warning(f"Outdated image cache {self.filename}")
+                return False
+            header_size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            self.header = json.loads(f.read(header_size))
+        assert (
+            self.header["downscale"] == self.downscale
+        ), f"Image cache {self.filename} was created with downscale {self.header['downscale']}"
+        data_start = _align(IMAGE_CACHE_MAGIC.__len__() + 8 + header_size)
+        self.shape = tuple(self.header["shape"])
+        self.full_shape = tuple(self.header["full_shape"])
+        self.num_slots = self.header["num_slots"]
+
+        self.__buffer = np.memmap(self.filename, dtype=np.uint8, mode="r+")
+        start = data_start + self.header["index_offset"]
+        self.index = self.__buffer[
+            start : start + self.num_slots * IMAGE_CACHE_INDEX_DTYPE.itemsize
+        ].view(IMAGE_CACHE_INDEX_DTYPE)
+        start = data_start + self.header["stats_offset"]
+        self.stats = self.__buffer[start : start + IMAGE_CACHE_STATS_DTYPE.itemsize].view(
+            IMAGE_CACHE_STATS_DTYPE
+        )
+        start = data_start + self.header["images_offset"]
+        self.images = self.__buffer[
+            start : start + self.num_slots * int(np.prod(self.shape))
+        ].reshape((self.num_slots,) + self.shape)
+        return True
+
+    def find_slot(self, key):
+        slot = self.slots.get(key)
+        if slot is None or self.index["key"][slot] != key or not self.index["valid"][slot]:
+            # ! The slot could have been filled or evicted by another process
+            found = np.flatnonzero((self.index["key"] == key) & (self.index["valid"] == 1))
+            if found.size == 0:
+                return None
+            slot = int(found[0])
+            self.slots[key] = slot
+        return slot
+
+    def get(self, key):
+        """
+        Returns a copy of the cached image or None if it is not cached
+        (or it was evicted/rewritten while being copied).
+        """
+        if not self.open():
+            return None
+        slot = self.find_slot(key)
+        if slot is None:
+            return None
+        generation = self.index["generation"][slot]
+        if generation % 2 == 1:
+            return None
+        img = np.array(self.images[slot])
+        if (
+            self.index["generation"][slot] != generation
+            or self.index["key"][slot] != key
+            or not self.index["valid"][slot]
+        ):
+            return None
+        self.index["last_access"][slot] = time.time()
+        return img
+
+    def put(self, key, img, full_shape=None):
+        """
+        Caches the image (downscaled, if so). Images with a shape different from the cache are not cached.
+        full_shape is the shape of the image before downscaling (Default: img.shape)
+        """
+        with self.lock():
+            if not self.open():
+                self.create(img.shape, img.shape if full_shape is None else full_shape)
+                self.open()
+            if img.shape != self.shape:
+                return
+            slot = self.find_slot(key)
+            if slot is None:
+                empty = np.flatnonzero(self.index["valid"] == 0)
+                slot = int(empty[0]) if empty.size > 0 else int(np.argmin(self.index["last_access"]))
+                # ! Readers copying this slot detect the change of generation
+                self.index["generation"][slot] += 1
+                self.index["valid"][slot] = 0
+                self.images[slot] = img
+                self.index["key"][slot] = key
+                self.index["valid"][slot] = 1
+                self.index["generation"][slot] += 1
+                self.slots[key] = slot
+            self.index["last_access"][slot] = time.time()
+
+    def get_rgb(self, img_fn, idx=None):
+        """
+        Returns the uint8 RGB image (H, W, 3) of a frame from the cache.
+        The image is decoded (and downscaled) on a cache miss.
+        With downscale > 1, the image is upsampled back to its original size.
+        """
+        key = hashlib.sha1(get_image_key(img_fn, idx).encode()).hexdigest().encode()
+        img = self.get(key)
+        if img is not None:
+            self.stats["hits"] += 1
+            return self.upsample(img, self.full_shape)
+        img = decode_rgb(img_fn, idx)
+        if self.downscale == 1:
+            self.put(key, img)
+        else:
+            full_shape = img.shape
+            img = np.array(Image.fromarray(img).reduce(self.downscale))
+            self.put(key, img, full_shape)
+            img = self.upsample(img, full_shape)
+        self.stats["misses"] += 1
+        return img
+
+    def upsample(self, img, full_shape):
+        if self.downscale == 1:
+            return img
+        return np.array(Image.fromarray(img).resize((full_shape[1], full_shape[0]), Image.BILINEAR))
+
+    def get_stats(self):
+        if not self.open():
+            return dict(hits=0, misses=0, hit_rate=0)
+        hits, misses = int(self.stats["hits"][0]), int(self.stats["misses"][0])
+        return dict(hits=hits, misses=misses, hit_rate=hits / max(hits + misses, 1))
+
+
+def decode_rgb(img_fn, idx=None):
+    """
+    Decodes the uint8 RGB image (H, W, 3) of a frame from an image file or a shard (img_fn)
+    """
+    if is_shard_fn(img_fn):
+        img_fn = get_shard(img_fn).get_image_buffer(idx)
+    return np.array(Image.open(img_fn), np.uint8)[..., :3]
+
+
+__OPEN_CACHES = {}
+
+
+def get_image_cache(cfg):
+    """
+    Returns the ImageCache defined by cfg (filename, max_gb, downscale) or None if cfg
+    is not defined. Instances are cached per process.
+    """
+    if cfg is None or not cfg.get("filename", ""):
+        return None
+    if cfg.filename not in __OPEN_CACHES:
+        __OPEN_CACHES[cfg.filename] = ImageCache(
+            filename=cfg.filename,
+            max_bytes=cfg.get("max_gb", 8) * 2**30,
+            downscale=cfg.get("downscale", 1),
+        )
+    return __OPEN_CACHES[cfg.filename]
+
+
+def read_rgb(img_fn, idx=None, cache=None):
+    """
+    Returns the uint8 RGB image (H, W, 3) of a frame, using the image cache if defined
+    """
+    if cache is None:
+        return decode_rgb(img_fn, idx)
+    return cache.get_rgb(img_fn, idx)
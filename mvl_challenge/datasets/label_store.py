@@ -0,0 +1,199 @@
+import os
+import shutil
+import logging
+import numpy as np
+from tqdm import tqdm
+
+LABEL_STORE_SUFFIX = "__store"
+
+
+def get_label_store_dir(labels_dir, label):
+    """
+    Returns the directory of the consolidated store of a label, e.g., labels/mlc_label__store
+    """
+    return os.path.join(labels_dir, f"{label}{LABEL_STORE_SUFFIX}")
+
+
+def get_frame_label_fn(label_fn):
+    """
+    Returns the filename of a label file (npy or npz, without extension) or None if not found
+    """
+    for ext in (".npy", ".npz"):
+        if os.path.exists(label_fn + ext):
+            return label_fn + ext
+    return None
+
+
+def load_frame_label(label_fn):
+    """
+    Returns the phi_coords of a label file (npy or npz, without extension) or None if not found
+    """
+    if os.path.exists(label_fn + ".npy"):
+        return np.load(label_fn + ".npy")
+    if os.path.exists(label_fn + ".npz"):
+        return np.load(label_fn + ".npz")["phi_coords"]
+    return None
+
+
+def save_label_store(store_dir, list_idx, phi_coords, std=None, std_mask=None):
+    """
+    Saves the labels of N frames into a consolidated store.
+
+    Args:
+        store_dir (path): Output directory
+        list_idx (list): Frame ids (scene_room_idx)
+        phi_coords (array): Labels (N, 2, W)
+        std (array): Std of the labels (N, 2, W). Optional
+        std_mask (array): Frames with a defined std (N,). Default: all of them
+    """
+    assert phi_coords.shape[0] == list_idx.__len__(), "Labels and ids do not match"
+    os.makedirs(store_dir, exist_ok=True)
+
+    def save_array(name, data):
+        # ! Replaced (not overwritten), so arrays already memory-mapped by readers remain valid
+        fn = os.path.join(store_dir, name)
+        with open(f"{fn}.tmp", "wb") as f:
+            np.save(f, data)
+        os.replace(f"{fn}.tmp", fn)
+
+    if std is not None:
+        if std_mask is None:
+            std_mask = np.ones(list_idx.__len__(), dtype=np.uint8)
+        save_array("std.npy", std)
+        save_array("std_mask.npy", np.asarray(std_mask, dtype=np.uint8))
+    else:
+        # ! std of a previous store
+        for name in ("std.npy", "std_mask.npy"):
+            if os.path.exists(os.path.join(store_dir, name)):
+                os.remove(os.path.join(store_dir, name))
+    save_array("index.npy", np.array([idx.encode() for idx in list_idx], dtype="S64"))
+    # ! Saved last. Its mtime is the store mtime (see is_label_store_updated())
+    save_array("phi_coords.npy", phi_coords)
+    logging.info(f"Label store saved at {store_dir} ({list_idx.__len__()} frames)")
+
+
+def create_label_store(labels_dir, label, list_idx, store_dir=None):
+    """
+    Consolidates the per-frame label files (labels_dir/label/*.npy|npz) and
+    std files (labels_dir/std/*.npy) of the passed frames into a label store.
+    Frames without label are skipped.
+    """
+    if store_dir is None:
+        store_dir = get_label_store_dir(labels_dir, label)
+    list_found, list_phi_coords, list_std = [], [], []
+    for idx in tqdm(list_idx, desc=f"Reading {label} labels..."):
+        phi_coords = load_frame_label(os.path.join(labels_dir, label, idx))
+        if phi_coords is None:
+            logging.warning(f"Not found {label} for {idx}")
+            continue
+        list_found.append(idx)
+        list_phi_coords.append(phi_coords)
+        list_std.append(load_frame_label(os.path.join(labels_dir, "std", idx)))
+
+    assert list_found.__len__() > 0, f"Not found {label} labels in {labels_dir}"
+    phi_coords = np.stack(list_phi_coords)
+    std_mask = np.array([std is not None for std in list_std], dtype=np.uint8)
+    std = None
+    if np.any(std_mask):
+        std = np.stack([np.ones_like(ph) if s is None else s for ph, s in zip(list_phi_coords, list_std)])
+    save_label_store(store_dir, list_found, phi_coords, std=std, std_mask=std_mask)
+    return store_dir
+
+
+def remove_label_store(labels_dir, label):
+    """
+    Removes the store of a label (if any), e.g., when its per-frame label files are rewritten
+    """
+    store_dir = get_label_store_dir(labels_dir, label)
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+        logging.info(f"Removed outdated label store {store_dir}")
+
+
+def is_label_store_updated(store, labels_dir, label, list_idx):
+    """
+    Returns True if the store has all frames of list_idx and it is not older than
+    their per-frame label files (labels_dir/label/*.npy|npz), if they exist
+    """
+    for idx in list_idx:
+        if idx not in store:
+            logging.warning(f"Not found {idx} in {store.store_dir}")
+            return False
+        label_fn = get_frame_label_fn(os.path.join(labels_dir, label, idx))
+        if label_fn is not None and os.path.getmtime(label_fn) > store.mtime:
+            logging.warning(f"{label_fn} is newer than {store.store_dir}")
+            return False
+    return True
+
+
+class LabelStore:
+    """
+    Consolidated labels (N, 2, W) and std (N, 2, W) of a set of frames.
+    Arrays are memory-mapped lazily, therefore instances can be passed to
+    DataLoader workers at no cost, and rows are read zero-copy.
+    """
+
+    def __init__(self, store_dir):
+        assert os.path.isdir(store_dir), f"Not found {store_dir}"
+        self.store_dir = store_dir
+        self.mtime = get_label_store_mtime(store_dir)
+        self.list_idx = [idx.decode() for idx in np.load(os.path.join(store_dir, "index.npy"))]
+        self.rows = {idx: row for row, idx in enumerate(self.list_idx)}
+        self.with_std = os.path.exists(os.path.join(store_dir, "std.npy"))
+        self.__arrays = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_LabelStore__arrays"] = None
+        return state
+
+    @property
+    def arrays(self):
+        if self.__arrays is None:
+            self.__arrays = dict(phi_coords=np.load(os.path.join(self.store_dir, "phi_coords.npy"), mmap_mode="r"))
+            if self.with_std:
+                self.__arrays["std"] = np.load(os.path.join(self.store_dir, "std.npy"), mmap_mode="r")
+                self.__arrays["std_mask"] = np.load(os.path.join(self.store_dir, "std_mask.npy"))
+        return self.__arrays
+
+    def __contains__(self, idx):
+        return idx in self.rows
+
+    def __len__(self):
+        return self.list_idx.__len__()
+
+    def get_label(self, idx):
+        """
+        Returns a read-only (2, W) view of the label of a frame
+        """
+        assert idx in self.rows, f"Not found {idx} in {self.store_dir}"
+        return self.arrays["phi_coords"][self.rows[idx]]
+
+    def has_std(self, idx):
+        return self.with_std and bool(self.arrays["std_mask"][self.rows[idx]])
+
+    def get_std(self, idx):
+        """
+        Returns a read-only (2, W) view of the std of a frame or None if it is not defined
+        """
+        if not self.has_std(idx):
+            return None
+        return self.arrays["std"][self.rows[idx]]
+
+
+__OPEN_STORES = {}
+
+
+def get_label_store_mtime(store_dir):
+    return os.path.getmtime(os.path.join(store_dir, "phi_coords.npy"))
+
+
+def get_label_store(store_dir):
+    """
+    Returns a LabelStore instance for the passed directory. Instances are cached per process
+    and reloaded if the store is rewritten.
+    """
+    store_dir = str(store_dir)
+    if store_dir not in __OPEN_STORES or __OPEN_STORES[store_dir].mtime != get_label_store_mtime(store_dir):
+        __OPEN_STORES[store_dir] = LabelStore(store_dir)
+    return __OPEN_STORES[store_dir]
@@ -1,8 +1,15 @@
 import os
 import json
+import threading
+import multiprocessing as mp
 from tqdm import tqdm
 from mvl_challenge.data_structure import Layout, CamPose
+from mvl_challenge.data_structure.layout import compute_list_ly_geometry
 from mvl_challenge.utils.layout_utils import filter_out_noisy_layouts
+from mvl_challenge.datasets.mvl_shard import get_shard, get_shard_fn, is_shard_fn
+from mvl_challenge.datasets.image_cache import get_image_cache, read_rgb
+from mvl_challenge.datasets.geometry_store import GeometryStore, create_geometry_store
+from mvl_challenge.utils.pipeline_utils import iter_pipeline
 import numpy as np
 import logging
 from imageio import imread
@@ -19,6 +26,7 @@ class MVLDataset:
     def __init__(self, cfg):
         logging.info("Initializing MVL Dataset...")
         self.cfg = cfg
+        self.inference_engine = None
         self.set_paths()
         logging.info("MVL Dataset successfully initialized")
 
@@ -28,11 +36,17 @@ class MVLDataset:
             self.cfg.runners.mvl.data_dir, "geometry_info"
         )
         self.DIR_IMGS = os.path.join(self.cfg.runners.mvl.data_dir, "img")
+        self.DIR_SHARDS = self.cfg.runners.mvl.get("shard_dir", "")
 
-        assert os.path.exists(
-            self.DIR_GEOM_INFO
-        ), f"Not found geometry info {self.DIR_GEOM_INFO}"
-        assert os.path.exists(self.DIR_IMGS), f"Not found img dir {self.DIR_IMGS}"
+        if self.DIR_SHARDS:
+            # ! Images and geometry are read from packed shards (one *.mvl per room)
+            assert os.path.exists(self.DIR_SHARDS), f"Not found shard dir {self.DIR_SHARDS}"
+            logging.info(f"Reading MVL shards from: {self.DIR_SHARDS}")
+        else:
+            assert os.path.exists(
+                self.DIR_GEOM_INFO
+            ), f"Not found geometry info {self.DIR_GEOM_INFO}"
+            assert os.path.exists(self.DIR_IMGS), f"Not found img dir {self.DIR_IMGS}"
 
         # * Set main lists of files
         #! List of scene names
@@ -45,12 +59,41 @@ class MVLDataset:
         self.list_frames = [fr for fr in self.data_scenes.values()]
         self.list_frames = [item for sublist in self.list_frames for item in sublist]
 
+        # ! Columnar geometry info loaded once for the whole scene list
+        self.geometry_store = None
+        geometry_store_fn = self.cfg.runners.mvl.get("geometry_store", "")
+        if geometry_store_fn and not self.DIR_SHARDS:
+            if not os.path.exists(geometry_store_fn):
+                create_geometry_store(self.DIR_GEOM_INFO, self.list_frames, geometry_store_fn)
+            self.geometry_store = GeometryStore(geometry_store_fn)
+            self.geometry_store.check_frames(self.list_frames)
+            logging.info(f"Geometry store: {geometry_store_fn}")
+
     def iter_list_ly(self):
         """Iterator for all room scene defined in this class"""
         for room_scene in self.list_rooms:
             list_ly = self.get_list_ly(room_scene)
             yield list_ly
 
+    def get_img_data(self, room_scene):
+        """
+        Returns a list of (img_fn, idx) for all frames in room_scene without loading any geometry.
+        For shards, img_fn is the shard filename and the image is decoded from it by idx.
+        """
+        scene_data = self.data_scenes[room_scene]
+        list_idx = [os.path.splitext(frame)[0] for frame in scene_data]
+
+        if self.DIR_SHARDS:
+            shard = get_shard(get_shard_fn(self.DIR_SHARDS, room_scene))
+            for idx in list_idx:
+                assert idx in shard, f"Not found {idx} in {shard.filename}"
+            return [(shard.filename, idx) for idx in list_idx]
+
+        list_img_data = [(os.path.join(self.DIR_IMGS, f"{idx}.jpg"), idx) for idx in list_idx]
+        for img_fn, _ in list_img_data:
+            assert os.path.exists(img_fn), f"Not found {img_fn}"
+        return list_img_data
+
     def get_list_ly(self, room_scene):
         """
         Returns a list of Layout instances described by room_scene.
@@ -58,27 +101,47 @@ class MVLDataset:
         By default it returns all scene names.
         """
         self.cfg._room_scene = room_scene
-        scene_data = self.data_scenes[room_scene]
+        self.list_ly = self.load_list_ly(room_scene)
+        return self.list_ly
 
-        self.list_ly = []
-        for frame in tqdm(scene_data, desc=f"Loading mvl data scene {room_scene}..."):
+    def load_list_ly(self, room_scene):
+        """
+        Same as get_list_ly() but without setting cfg._room_scene nor self.list_ly.
+        This is safe to be called from a background thread.
+        """
+        list_ly = []
+        for img_fn, idx in tqdm(self.get_img_data(room_scene), desc=f"Loading mvl data scene {room_scene}..."):
 
             ly = Layout(self.cfg)
-            ly.idx = os.path.splitext(frame)[0]
+            ly.idx = idx
+            ly.img_fn = img_fn
 
-            ly.img_fn = os.path.join(self.DIR_IMGS, f"{ly.idx}.jpg")
-            assert os.path.exists(ly.img_fn), f"Not found {ly.img_fn}"
             # ! Loading geometry
-            geom = json.load(open(os.path.join(self.DIR_GEOM_INFO, f"{ly.idx}.json")))
-
-            self.set_geom_info(layout=ly, geom=geom)
+            if self.DIR_SHARDS:
+                self.set_geom_info(layout=ly, geom=get_shard(ly.img_fn).get_geom_info(ly.idx))
+            elif self.geometry_store is not None:
+                self.set_geom_info_from_store(layout=ly, store=self.geometry_store)
+            else:
+                geom = json.load(open(os.path.join(self.DIR_GEOM_INFO, f"{ly.idx}.json")))
+                self.set_geom_info(layout=ly, geom=geom)
 
             # ! Setting in WC
             ly.cam_ref = "WC"
 
-            self.list_ly.append(ly)
+            list_ly.append(ly)
 
-        return self.list_ly
+        return list_ly
+
+    def get_inference_engine(self, model):
+        """
+        Returns the InferenceEngine of model over this dataset (created on the first call). It is reused
+        by every estimation pass, so its dataloader workers are persistent.
+        """
+        if self.inference_engine is None or self.inference_engine.model is not model:
+            from mvl_challenge.models.inference_engine import InferenceEngine
+
+            self.inference_engine = InferenceEngine(model, self.cfg)
+        return self.inference_engine
 
     def print_mvl_data_info(self):
         a = [dt.__len__() for dt in self.data_scenes.values()]
@@ -96,22 +159,108 @@ class MVLDataset:
         layout.pose.idx = layout.idx
         layout.camera_height = geom["cam_h"]
 
+    @staticmethod
+    def set_geom_info_from_store(layout: Layout, store: GeometryStore):
+        row = store.rows[layout.idx]
+        layout.pose = CamPose(layout.cfg)
+        layout.pose.set_rot_and_t(store.rot[row], store.translation[row])
+        layout.pose.idx = layout.idx
+        layout.camera_height = float(store.cam_h[row])
+
 
 class MVImageLayout(data.Dataset):
-    def __init__(self, list_data):
+    def __init__(self, list_data, uint8_images=False, image_cache=None):
         self.data = list_data  # [(img_fn, idx),...]
+        # ! uint8 images are normalized by the model (see WrapperHorizonNet.forward_batch())
+        self.uint8_images = uint8_images
+        # ! cfg of the decoded-image cache (see image_cache.py)
+        self.image_cache = image_cache
 
     def __len__(self):
         return self.data.__len__()
 
     def __getitem__(self, idx):
         image_fn = self.data[idx][0]
-        assert os.path.exists(image_fn)
-        img = np.array(Image.open(image_fn), np.float32)[..., :3] / 255.0
+        if not is_shard_fn(image_fn):
+            assert os.path.exists(image_fn)
+        img = read_rgb(image_fn, self.data[idx][1], cache=get_image_cache(self.image_cache))
+        if self.uint8_images:
+            return dict(images=torch.from_numpy(img).permute(2, 0, 1), idx=self.data[idx][1])
+        img = img.astype(np.float32) / 255.0
         x = torch.FloatTensor(img.transpose([2, 0, 1]).copy())
         return dict(images=x, idx=self.data[idx][1])
 
 
+def seed_worker(worker_id):
+    np.random.seed()
+
+
+def get_loader_context(num_workers):
+    """
+    Returns the multiprocessing context of the DataLoader workers (None: default, i.e. fork).
+    Forking is only safe from the main thread: locks held by other threads (e.g. tqdm, logging)
+    are copied locked. Loaders created in a background thread (e.g. runners.mvl.pipelined)
+    start their workers from a forkserver instead.
+    """
+    if num_workers > 0 and threading.current_thread() is not threading.main_thread():
+        return mp.get_context("forkserver")
+    return None
+
+
+def set_estimated_phi_coords(list_ly, evaluated_data):
+    """
+    Sets the estimations {idx: data} (see WrapperHorizonNet.estimate_batch()) of all ly in list_ly.
+    Rows after y_bon and y_cor (3, W) are the std of y_bon (e.g. TTA), set as phi_coords_std
+    """
+    for ly in list_ly:
+        data = evaluated_data[ly.idx]
+        ly.set_phi_coords(phi_coords=data[:3])
+        if data.shape[0] > 3:
+            ly.phi_coords_std = data[3:]
+
+
+def estimate_list_ly(model, list_ly):
+    # ! Overwrite phi_coords within the list_ly by the estimating new layouts.
+    model.estimate_within_list_ly(list_ly)
+    return list_ly
+
+
+def iter_estimated_list_ly(model, dataset: MVLDataset, persistent_engine=None):
+    """
+    Creates a generator which yields the list of layouts of every room in dataset,
+    with phi_coords estimated by the passed model.
+    persistent_engine (None: runners.mvl.persistent_engine) estimates all rooms with an InferenceEngine.
+    """
+    num_inference_workers = dataset.cfg.runners.mvl.get("inference_workers", 0)
+    if num_inference_workers > 0:
+        from mvl_challenge.models.multiprocess_inference import iter_multiprocess_room_estimations
+
+        # ! Rooms are estimated by spawned cpu workers sharing the model weights
+        for room_scene, evaluated_data in iter_multiprocess_room_estimations(
+            model, dataset, num_inference_workers
+        ):
+            list_ly = dataset.load_list_ly(room_scene=room_scene)
+            set_estimated_phi_coords(list_ly, evaluated_data)
+            yield list_ly
+        return
+
+    if persistent_engine is None:
+        persistent_engine = dataset.cfg.runners.mvl.get("persistent_engine", False)
+    if persistent_engine:
+        # ! A single dataloader for all rooms, kept by the model across calls. Batches are filled across rooms
+        engine = dataset.get_inference_engine(model)
+        list_rooms_data = [(room, dataset.get_img_data(room)) for room in dataset.list_rooms]
+        for room_scene, evaluated_data in engine.iter_room_estimations(list_rooms_data):
+            list_ly = dataset.load_list_ly(room_scene=room_scene)
+            set_estimated_phi_coords(list_ly, evaluated_data)
+            yield list_ly
+        return
+
+    for room_scene in dataset.list_rooms:
+        list_ly = dataset.load_list_ly(room_scene=room_scene)
+        yield estimate_list_ly(model, list_ly)
+
+
 def iter_mvl_room_scenes(model, dataset: MVLDataset):
     """
     Creates a generator which yields a list of layout from a defined
@@ -120,12 +269,45 @@ def iter_mvl_room_scenes(model, dataset: MVLDataset):
 
     dataset.print_mvl_data_info()
     cfg = dataset.cfg
-    for room_scene in dataset.list_rooms:
-        list_ly = dataset.get_list_ly(room_scene=room_scene)
 
-        # ! Overwrite phi_coords within the list_ly by the estimating new layouts.
-        model.estimate_within_list_ly(list_ly)
+    def filter_list_ly(list_ly):
+        # ! Geometry of the whole room in one vectorized pass
+        compute_list_ly_geometry(list_ly)
         filter_out_noisy_layouts(
             list_ly=list_ly, max_room_factor_size=cfg.runners.mvl.max_room_factor_size
         )
+        return list_ly
+
+    if not cfg.runners.mvl.get("pipelined", False):
+        iter_list_ly = map(filter_list_ly, iter_estimated_list_ly(model, dataset))
+    elif (
+        cfg.runners.mvl.get("persistent_engine", False)
+        or cfg.runners.mvl.get("inference_workers", 0) > 0
+    ):
+        # ! Loading and inference are already overlapped by the engine/workers.
+        iter_list_ly = iter_pipeline(
+            iter_estimated_list_ly(model, dataset),
+            stages=[filter_list_ly],
+            max_in_flight=cfg.runners.mvl.get("max_rooms_in_flight", 3),
+        )
+    else:
+        if cfg.runners.mvl.num_workers > 0:
+            logging.info(
+                f"Pipelined rooms: {cfg.runners.mvl.num_workers} dataloader workers are started per room "
+                "from a forkserver (set runners.mvl.persistent_engine to start them once)"
+            )
+        # ! room k+1 is loaded while room k is in the model and room k-1 is consumed
+        iter_list_ly = iter_pipeline(
+            dataset.list_rooms,
+            stages=[
+                dataset.load_list_ly,
+                lambda list_ly: estimate_list_ly(model, list_ly),
+                filter_list_ly,
+            ],
+            max_in_flight=cfg.runners.mvl.get("max_rooms_in_flight", 3),
+        )
+
+    # ! Rooms are yielded in the same order as dataset.list_rooms
+    for room_scene, list_ly in zip(dataset.list_rooms, iter_list_ly):
+        cfg._room_scene = room_scene
         yield list_ly
@@ -0,0 +1,211 @@
+import io
+import json
+import os
+import numpy as np
+from imageio import imread
+
+SHARD_EXT = ".mvl"
+SHARD_MAGIC = b"MVLSHRD1"
+SHARD_ALIGN = 64
+
+# ! Fixed-width record per frame. Labels and std are stored as separated (N, 2, W) arrays
+SHARD_INDEX_DTYPE = np.dtype(
+    [
+        ("idx", "S64"),
+        ("img_offset", "<u8"),
+        ("img_size", "<u8"),
+        ("translation", "<f8", (3,)),
+        ("quaternion", "<f8", (4,)),
+        ("cam_h", "<f8"),
+    ]
+)
+
+
+def _align(offset):
+    return (offset + SHARD_ALIGN - 1) // SHARD_ALIGN * SHARD_ALIGN
+
+
+def is_shard_fn(filename):
+    return str(filename).endswith(SHARD_EXT)
+
+
+def get_shard_fn(shard_dir, room_scene):
+    return os.path.join(shard_dir, f"{room_scene}{SHARD_EXT}")
+
+
+def save_mvl_shard(filename, room_scene, list_frames, width=1024):
+    """
+    Saves all frames of a room into a single packed shard file.
+
+    Args:
+        filename (path): Output shard file (*.mvl)
+        room_scene (str): Room name as defined in the scene list
+        list_frames (list): List of dicts with keys idx, img_bytes (encoded image),
+            geom (geometry info dict) and labels (dict of (2, W) phi_coords arrays,
+            e.g., {"gt": ..., "mlc_label": ..., "std": ...})
+    """
+    num_frames = list_frames.__len__()
+    index = np.zeros(num_frames, dtype=SHARD_INDEX_DTYPE)
+    list_labels = sorted({name for fr in list_frames for name in fr["labels"].keys()})
+
+    img_offset = 0
+    for i, fr in enumerate(list_frames):
+        index[i]["idx"] = fr["idx"].encode()
+        index[i]["img_offset"] = img_offset
+        index[i]["img_size"] = fr["img_bytes"].__len__()
+        index[i]["translation"] = fr["geom"]["translation"]
+        index[i]["quaternion"] = fr["geom"]["quaternion"]
+        index[i]["cam_h"] = fr["geom"]["cam_h"]
+        img_offset += fr["img_bytes"].__len__()
+
+    # ! Computing the layout of the file. Offsets are relative to the beginning of data
+    arrays = {}
+    offset = _align(index.nbytes)
+    for name in list_labels:
+        arrays[name] = dict(offset=offset)
+        offset = _align(offset + num_frames * 2 * width * 8)
+        arrays[name]["mask_offset"] = offset
+        offset = _align(offset + num_frames)
+
+    header = dict(
+        room_scene=room_scene,
+        num_frames=num_frames,
+        width=width,
+        index_offset=0,
+        arrays=arrays,
+        blob_offset=offset,
+    )
+    header_bytes = json.dumps(header).encode()
+    data_start = _align(SHARD_MAGIC.__len__() + 8 + header_bytes.__len__())
+
+    # ! Replaced (not overwritten), so shards already memory-mapped by readers remain valid
+    with open(f"{filename}.tmp", "wb") as f:
+        f.write(SHARD_MAGIC)
+        f.write(np.array([header_bytes.__len__()], dtype="<u8").tobytes())
+        f.write(header_bytes)
+        f.seek(data_start)
+        f.write(index.tobytes())
+        for name in list_labels:
+            phi_coords = np.zeros((num_frames, 2, width), dtype="<f8")
+            mask = np.zeros(num_frames, dtype=np.uint8)
+            for i, fr in enumerate(list_frames):
+                if name in fr["labels"]:
+                    phi_coords[i] = fr["labels"][name]
+                    mask[i] = 1
+            f.seek(data_start + arrays[name]["offset"])
+            f.write(phi_coords.tobytes())
+            f.seek(data_start + arrays[name]["mask_offset"])
+            f.write(mask.tobytes())
+        f.seek(data_start + header["blob_offset"])
+        [f.write(fr["img_bytes"]) for fr in list_frames]
+    os.replace(f"{filename}.tmp", filename)
+
+
+class MVLShard:
+    """
+    Reader of a packed room shard (*.mvl). The file is memory-mapped lazily,
+    therefore instances can be passed to DataLoader workers at no cost.
+    """
+
+    def __init__(self, filename):
+        assert os.path.exists(filename), f"Not found {filename}"
+        self.filename = filename
+        self.mtime = os.path.getmtime(filename)
+        self.__buffer = None
+        self.read_header()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_MVLShard__buffer"] = None
+        return state
+
+    def read_header(self):
+        with open(self.filename, "rb") as f:
+            magic = f.read(SHARD_MAGIC.__len__())
+            assert magic == SHARD_MAGIC, f"Not a MVL shard {self.filename}"
+            header_size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            self.header = json.loads(f.read(header_size))
+        self.data_start = _align(SHARD_MAGIC.__len__() + 8 + header_size)
+        self.room_scene = self.header["room_scene"]
+        self.num_frames = self.header["num_frames"]
+        self.width = self.header["width"]
+        self.list_labels = list(self.header["arrays"].keys())
+        index = np.fromfile(
+            self.filename,
+            dtype=SHARD_INDEX_DTYPE,
+            count=self.num_frames,
+            offset=self.data_start + self.header["index_offset"],
+        )
+        self.list_idx = [idx.decode() for idx in index["idx"]]
+        self.rows = {idx: row for row, idx in enumerate(self.list_idx)}
+
+    @property
+    def buffer(self):
+        if self.__buffer is None:
+            self.__buffer = np.memmap(self.filename, dtype=np.uint8, mode="r")
+        return self.__buffer
+
+    @property
+    def index(self):
+        start = self.data_start + self.header["index_offset"]
+        return self.buffer[
+            start : start + self.num_frames * SHARD_INDEX_DTYPE.itemsize
+        ].view(SHARD_INDEX_DTYPE)
+
+    def __contains__(self, idx):
+        return idx in self.rows
+
+    def __len__(self):
+        return self.num_frames
+
+    def get_geom_info(self, idx):
+        """
+        Returns the geometry info of a frame as defined in geometry_info/*.json
+        """
+        record = self.index[self.rows[idx]]
+        return dict(
+            translation=record["translation"].tolist(),
+            quaternion=record["quaternion"].tolist(),
+            cam_h=float(record["cam_h"]),
+        )
+
+    def get_image_buffer(self, idx):
+        """
+        Returns the encoded image of a frame as a file-like object
+        """
+        record = self.index[self.rows[idx]]
+        start = self.data_start + self.header["blob_offset"] + int(record["img_offset"])
+        return io.BytesIO(self.buffer[start : start + int(record["img_size"])])
+
+    def get_rgb(self, idx):
+        return imread(self.get_image_buffer(idx))
+
+    def has_label(self, label, idx):
+        if label not in self.header["arrays"]:
+            return False
+        start = self.data_start + self.header["arrays"][label]["mask_offset"]
+        return bool(self.buffer[start + self.rows[idx]])
+
+    def get_label(self, label, idx):
+        """
+        Returns a read-only (2, W) phi_coords view for the passed label, e.g., gt, mlc_label, std
+        """
+        assert self.has_label(label, idx), f"Not found {label} for {idx} in {self.filename}"
+        start = self.data_start + self.header["arrays"][label]["offset"]
+        size = self.num_frames * 2 * self.width * 8
+        phi_coords = self.buffer[start : start + size].view("<f8")
+        return phi_coords.reshape(self.num_frames, 2, self.width)[self.rows[idx]]
+
+
+__OPEN_SHARDS = {}
+
+
+def get_shard(filename):
+    """
+    Returns a MVLShard instance for the passed filename. Instances are cached per process
+    and reloaded if the shard is rewritten.
+    """
+    filename = str(filename)
+    if filename not in __OPEN_SHARDS or __OPEN_SHARDS[filename].mtime != os.path.getmtime(filename):
+        __OPEN_SHARDS[filename] = MVLShard(filename)
+    return __OPEN_SHARDS[filename]
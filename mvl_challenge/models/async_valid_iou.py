@@ -0,0 +1,87 @@
+import atexit
+import logging
+import queue
+import traceback
+from collections import OrderedDict
+import torch.multiprocessing as mp
+
+
+def run_valid_iou_worker(cfg, jobs, results):
+    """
+    Background validation process. It owns a WrapperHorizonNet and its own valid_iou_loader,
+    and evaluates every received (epoch, state_dict) until None is received.
+    Results are put as (epoch, valid_eval, error), where error is the traceback of a failed validation.
+    """
+    from mvl_challenge.models.wrapper_horizon_net import WrapperHorizonNet
+
+    model = WrapperHorizonNet(cfg)
+    model.set_valid_dataloader()
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        epoch, state_dict = job
+        model.net.load_state_dict(state_dict)
+        model.current_epoch = epoch
+        try:
+            results.put((epoch, model.compute_valid_iou(), None))
+        except Exception:
+            logging.error(f"Async IoU validation failed at epoch {epoch}")
+            results.put((epoch, None, traceback.format_exc()))
+
+
+class AsyncValidIoU:
+    """
+    Runs the IoU validation of weight snapshots in a background process, so training
+    does not wait for the validation pass. Snapshots are kept until their validation
+    is collected (e.g. to save the best checkpoints).
+    """
+
+    def __init__(self, cfg, max_pending=2):
+        self.cfg = cfg
+        self.max_pending = max_pending
+        self.snapshots = OrderedDict()
+        ctx = mp.get_context("spawn")
+        self.jobs = ctx.Queue()
+        self.results = ctx.Queue()
+        # ! Not daemonic, since the valid_iou_loader starts its own worker processes
+        self.worker = ctx.Process(target=run_valid_iou_worker, args=(cfg, self.jobs, self.results))
+        self.worker.start()
+        # ! e.g. training interrupted by an exception. The pending validations are dropped
+        atexit.register(self.close, terminate=True)
+
+    def submit(self, epoch, state_dict):
+        snapshot = OrderedDict((k, v.detach().cpu().clone()) for k, v in state_dict.items())
+        self.snapshots[epoch] = snapshot
+        self.jobs.put((epoch, snapshot))
+
+    def iter_results(self, block=False):
+        """
+        Yields (epoch, valid_eval, snapshot) for every finished validation.
+        With block=True, it waits until all submitted snapshots are validated.
+        Otherwise, it only waits while more than max_pending snapshots are pending.
+        A failed validation raises a RuntimeError with the traceback of the worker.
+        """
+        while self.snapshots.__len__() > 0:
+            must_wait = block or self.snapshots.__len__() > self.max_pending
+            try:
+                epoch, valid_eval, error = self.results.get(block=must_wait, timeout=1 if must_wait else None)
+            except queue.Empty:
+                if must_wait:
+                    assert self.worker.is_alive(), "Async IoU validation worker is not alive"
+                    continue
+                return
+            if error is not None:
+                raise RuntimeError(f"Async IoU validation failed at epoch {epoch}:\n{error}")
+            yield epoch, valid_eval, self.snapshots.pop(epoch)
+
+    def close(self, terminate=False):
+        if self.worker is None:
+            return
+        if terminate:
+            self.worker.terminate()
+        else:
+            self.jobs.put(None)
+        self.worker.join()
+        self.worker = None
+        atexit.unregister(self.close)
@@ -0,0 +1,62 @@
+import logging
+import itertools
+import numpy as np
+import torch
+import torch.nn as nn
+
+INFERENCE_PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def set_torch_threads(num_threads=-1, num_interop_threads=-1):
+    """
+    Sets the intra-op and inter-op threads of torch. -1 keeps the torch defaults.
+    """
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # ! It can only be set once, before any inter-op parallel work
+            logging.warning("Inter-op threads already set. Ignoring num_interop_threads")
+    logging.info(
+        f"Torch threads: intra-op {torch.get_num_threads()}, inter-op {torch.get_num_interop_threads()}"
+    )
+
+
+def get_inference_net(net, precision="fp32", channels_last=False):
+    """
+    Returns the network used for CPU inference. For int8, the LSTM/linear layers are
+    dynamically quantized on a copy, so net is kept as it is (e.g. for training).
+    """
+    assert precision in INFERENCE_PRECISIONS, f"Unknown precision {precision}"
+    inference_net = net
+    if precision == "int8":
+        inference_net = torch.ao.quantization.quantize_dynamic(
+            net, {nn.LSTM, nn.Linear}, dtype=torch.qint8, inplace=False
+        )
+    if channels_last:
+        inference_net = inference_net.to(memory_format=torch.channels_last)
+    return inference_net.eval()
+
+
+def get_weights_version(net):
+    """
+    Returns a fingerprint of the weights (parameters and buffers) of net. It changes with every
+    in-place update (e.g. optimizer.step(), load_state_dict()) or replaced tensor.
+    """
+    return tuple((t.data_ptr(), t._version) for t in itertools.chain(net.parameters(), net.buffers()))
+
+
+def get_phi_coords_parity(y_bon_ref, y_bon_est, height):
+    """
+    Returns the error of the estimated phi_coords (B, 2, W) w.r.t. a reference (e.g. fp32),
+    in radians and pixels for images of the passed height.
+    """
+    err = np.abs(np.asarray(y_bon_est, dtype=np.float64) - np.asarray(y_bon_ref, dtype=np.float64))
+    return dict(
+        max_err=float(err.max()),
+        mean_err=float(err.mean()),
+        max_err_px=float(err.max() * height / np.pi),
+        mean_err_px=float(err.mean() * height / np.pi),
+    )
@@ -0,0 +1,118 @@
+import os
+import hashlib
+import logging
+import numpy as np
+from mvl_challenge.datasets.mvl_shard import get_shard, is_shard_fn
+
+INFERENCE_CACHE_EXT = ".npy"
+
+
+def get_file_hash(filename, chunk_size=2**20):
+    sha1 = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def get_image_hash(img_fn, idx=None):
+    """
+    Returns the sha1 of the encoded image (file content or shard blob) of a frame
+    """
+    if is_shard_fn(img_fn):
+        return hashlib.sha1(get_shard(img_fn).get_image_buffer(idx).getbuffer()).hexdigest()
+    return get_file_hash(img_fn)
+
+
+class InferenceCache:
+    """
+    On-disk cache of model outputs (y_bon, y_cor stacked as a (3, W) array, plus the y_bon std with TTA) addressed by
+    the model hash (ckpt content and every setting which changes the outputs) and the image content hash.
+    The cache size is capped (max_bytes), evicting the least recently used outputs.
+    """
+
+    def __init__(self, cache_dir, model_key, max_bytes):
+        self.cache_dir = os.path.join(cache_dir, model_key)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.update_cache_size()
+
+    def update_cache_size(self):
+        # ! Also accounts for the outputs written by other processes
+        self.cache_size = sum(
+            entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.is_file()
+        )
+
+    def get_fn(self, image_hash):
+        return os.path.join(self.cache_dir, f"{image_hash}{INFERENCE_CACHE_EXT}")
+
+    def get(self, image_hash):
+        fn = self.get_fn(image_hash)
+        try:
+            data = np.load(fn)
+        except (FileNotFoundError, ValueError, EOFError):
+            self.misses += 1
+            return None
+        # ! mtime is used as last access for LRU eviction
+        os.utime(fn)
+        self.hits += 1
+        return data
+
+    def put(self, image_hash, data):
+        fn = self.get_fn(image_hash)
+        tmp_fn = f"{fn}.{os.getpid()}.tmp"
+        with open(tmp_fn, "wb") as f:
+            np.save(f, np.asarray(data, dtype=np.float32))
+        os.replace(tmp_fn, fn)
+        self.cache_size += os.path.getsize(fn)
+
+    def enforce_size_cap(self):
+        if self.cache_size <= self.max_bytes:
+            return
+        entries = sorted(
+            (entry for entry in os.scandir(self.cache_dir) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        self.cache_size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.cache_size <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.cache_size -= size
+
+    def get_stats(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / max(self.hits + self.misses, 1),
+            cache_size=self.cache_size,
+        )
+
+
+def get_model_key(ckpt, **settings):
+    """
+    Returns the hash which identifies the outputs of a model: ckpt content and every
+    setting which changes the outputs (e.g. precision, channels_last, tta, image downscale)
+    """
+    key = get_file_hash(ckpt)
+    for name, value in sorted(settings.items()):
+        key += f"__{name}={value}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def get_inference_cache(cfg, ckpt, **settings):
+    """
+    Returns the InferenceCache defined by cfg (cache_dir, max_gb) or None if cfg is not defined.
+    settings are the model settings which change the outputs (see get_model_key())
+    """
+    if cfg is None or not cfg.get("cache_dir", ""):
+        return None
+    model_key = get_model_key(ckpt, **settings)
+    logging.info(f"Inference cache: {cfg.cache_dir} (model {model_key[:12]})")
+    return InferenceCache(cfg.cache_dir, model_key, max_bytes=cfg.get("max_gb", 2) * 2**30)
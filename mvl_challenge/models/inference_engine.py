@@ -0,0 +1,93 @@
+import time
+import logging
+from tqdm import tqdm
+from torch.utils.data import DataLoader
+from mvl_challenge.datasets.mvl_dataset import MVImageLayout, get_loader_context, seed_worker
+
+
+class InferenceEngine:
+    """
+    Long-lived inference engine for layout models (e.g. WrapperHorizonNet).
+    A single DataLoader with persistent workers is used for all rooms, batches are
+    filled across room boundaries, and estimations are grouped back per room.
+    Frames found in the model inference cache (runners.mvl.inference_cache) are not estimated.
+    """
+
+    def __init__(self, model, cfg):
+        self.model = model
+        self.cfg = cfg
+        self.list_data = None
+        self.dataloader = None
+        self.images_count = 0
+        self.elapsed_time = 0
+
+    @property
+    def images_per_sec(self):
+        if self.elapsed_time == 0:
+            return 0
+        return self.images_count / self.elapsed_time
+
+    def set_dataloader(self, list_data):
+        if self.list_data == list_data:
+            # ! Reusing the dataloader (and its persistent workers)
+            return
+        self.list_data = list_data
+        num_workers = self.cfg.runners.mvl.num_workers
+        self.dataloader = DataLoader(
+            MVImageLayout(
+                list_data,
+                uint8_images=self.cfg.runners.mvl.get("uint8_images", False),
+                image_cache=self.cfg.runners.mvl.get("image_cache", None),
+            ),
+            batch_size=self.cfg.runners.mvl.batch_size,
+            shuffle=False,
+            drop_last=False,
+            num_workers=num_workers,
+            pin_memory=True if self.model.device.type != "cpu" else False,
+            persistent_workers=num_workers > 0,
+            worker_init_fn=seed_worker,
+            multiprocessing_context=get_loader_context(num_workers),
+        )
+
+    def iter_room_estimations(self, list_rooms_data):
+        """
+        Yields (room_scene, {idx: phi_coords}) in the same order as list_rooms_data,
+        as soon as all frames of a room have been estimated (see set_estimated_phi_coords()).
+
+        Args:
+            list_rooms_data (list): [(room_scene, [(img_fn, idx), ...]), ...]
+        """
+        list_data = [dt for _, room_data in list_rooms_data for dt in room_data]
+        evaluated_data, image_hashes = self.model.get_cached_estimations(list_data)
+        self.set_dataloader([dt for dt in list_data if dt[1] not in evaluated_data])
+        self.model.net.eval()
+
+        iter_rooms = iter(list_rooms_data)
+        room = next(iter_rooms, None)
+
+        tic = time.time()
+        for x in tqdm(self.dataloader, desc="Estimating layout..."):
+            for data, idx in zip(self.model.estimate_batch(x["images"]), x["idx"]):
+                evaluated_data[idx] = data
+                self.model.put_cached_estimation(image_hashes, idx, data)
+            self.images_count += x["idx"].__len__()
+
+            # ! Rooms are completed in order since the dataloader is not shuffled
+            while room is not None and all(idx in evaluated_data for _, idx in room[1]):
+                self.elapsed_time += time.time() - tic
+                yield room[0], {idx: evaluated_data.pop(idx) for _, idx in room[1]}
+                tic = time.time()
+                room = next(iter_rooms, None)
+        self.elapsed_time += time.time() - tic
+
+        # ! Only empty or cached rooms can remain at this point
+        while room is not None:
+            assert all(idx in evaluated_data for _, idx in room[1]), f"Missing estimations for {room[0]}"
+            yield room[0], {idx: evaluated_data.pop(idx) for _, idx in room[1]}
+            room = next(iter_rooms, None)
+
+        self.model.update_inference_cache()
+        logging.info(
+            f"Inference engine: {self.images_count} images in {self.elapsed_time:.2f}s "
+            + f"({self.images_per_sec:.2f} images/sec)"
+        )
@@ -0,0 +1,98 @@
+import os
+import logging
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from tqdm import tqdm
+from torch.utils.data import DataLoader
+from mvl_challenge.datasets.mvl_dataset import MVImageLayout
+from mvl_challenge.models.wrapper_horizon_net import WrapperHorizonNet
+
+# ! Inference model and cfg of every spawned worker (see init_inference_worker())
+__WORKER_STATE = {}
+
+
+def get_cores_per_worker(num_workers):
+    """
+    Splits the cores available for this process into num_workers contiguous subsets
+    """
+    cores = sorted(os.sched_getaffinity(0))
+    if num_workers > cores.__len__():
+        logging.warning(f"{num_workers} inference workers for {cores.__len__()} cores. Cores are shared")
+        return [[cores[i % cores.__len__()]] for i in range(num_workers)]
+    return [subset.tolist() for subset in np.array_split(cores, num_workers)]
+
+
+def init_inference_worker(cores_queue, model_state, cfg):
+    cores = cores_queue.get()
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(cores.__len__())
+    __WORKER_STATE["model"] = WrapperHorizonNet.from_inference_state(model_state)
+    __WORKER_STATE["cfg"] = cfg
+
+
+def estimate_room_task(task):
+    """
+    Returns (room_scene, {idx: phi_coords}) for all frames of a room task (room_scene, [(img_fn, idx), ...]).
+    Images are decoded in the worker itself (workers are daemonic, no nested dataloaders).
+    Frames found in the model inference cache are not estimated.
+    """
+    room_scene, img_data = task
+    model, cfg = __WORKER_STATE["model"], __WORKER_STATE["cfg"]
+    evaluated_data, image_hashes = model.get_cached_estimations(img_data)
+    layout_dataloader = DataLoader(
+        MVImageLayout(
+            [dt for dt in img_data if dt[1] not in evaluated_data],
+            uint8_images=cfg.runners.mvl.get("uint8_images", False),
+            image_cache=cfg.runners.mvl.get("image_cache", None),
+        ),
+        batch_size=cfg.runners.mvl.batch_size,
+        shuffle=False,
+        drop_last=False,
+        num_workers=0,
+    )
+    for x in layout_dataloader:
+        for data, idx in zip(model.estimate_batch(x["images"]), x["idx"]):
+            evaluated_data[idx] = data
+            model.put_cached_estimation(image_hashes, idx, data)
+    return room_scene, evaluated_data
+
+
+def iter_multiprocess_room_estimations(model, dataset, num_workers):
+    """
+    Estimates all rooms of dataset.list_rooms with num_workers spawned processes, each one
+    pinned to its own subset of cores. The model weights are shared by all workers
+    (shared memory), and rooms are dispatched dynamically to the idle workers.
+    Yields (room_scene, {idx: phi_coords}) in the same order as dataset.list_rooms.
+    """
+    assert model.device.type == "cpu", "Multi-process inference runs on cpu only"
+    model.net.eval()
+    # ! The workers map the weights of model.net instead of copying them. An int8 inference
+    # ! network is quantized once by every worker from them (see get_inference_state())
+    model.net.share_memory()
+    # ! The inference cache is opened before starting the workers. Hits are only counted in the workers
+    inference_cache = model.get_inference_cache()
+
+    # ! Workers are spawned, not forked: a fork after torch ran multi-threaded (OpenMP) work, e.g. loading
+    # ! or quantizing the model, deadlocks multi-threaded workers. It is also safe from any thread (pipelined)
+    ctx = mp.get_context("spawn")
+    cores_queue = ctx.Queue()
+    [cores_queue.put(cores) for cores in get_cores_per_worker(num_workers)]
+    logging.info(f"Multi-process inference: {num_workers} workers")
+    with ctx.Pool(
+        num_workers,
+        initializer=init_inference_worker,
+        initargs=(cores_queue, model.get_inference_state(), dataset.cfg),
+    ) as pool:
+        yield from tqdm(
+            pool.imap(
+                estimate_room_task,
+                ((room, dataset.get_img_data(room)) for room in dataset.list_rooms),
+                chunksize=1,
+            ),
+            total=dataset.list_rooms.__len__(),
+            desc="Estimating layout...",
+        )
+    if inference_cache is not None:
+        inference_cache.update_cache_size()
+        inference_cache.enforce_size_cap()
@@ -0,0 +1,64 @@
+import torch
+
+TTA_AGGREGATIONS = ("mean", "median")
+
+
+def get_tta_transforms(num_rolls=1, flip=False):
+    """
+    Returns the list of (flip, roll) transforms of the test-time augmentation.
+    roll is the fraction of the width the images are rotated horizontally
+    (rounded to whole columns, see get_tta_cols()). The first transform is always the identity.
+    """
+    assert num_rolls > 0, f"Wrong number of rolls {num_rolls}"
+    flips = (False, True) if flip else (False,)
+    return [(fl, k / num_rolls) for fl in flips for k in range(num_rolls)]
+
+
+def get_tta_cols(width, transforms, inverse=False):
+    """
+    Returns the source columns (K, width) of every transform (flip, then roll), as in
+    MVLDataLoader augmentation. With inverse=True, the columns undo the transform.
+    Images and outputs must have the same width, so both are rolled by the same columns.
+    """
+    cols = torch.arange(width)
+    list_cols = []
+    for flip, roll in transforms:
+        dx = int(round(roll * width))
+        if inverse:
+            src = (width - 1 - cols + dx) % width if flip else (cols + dx) % width
+        else:
+            src = (cols - dx) % width
+            src = width - 1 - src if flip else src
+        list_cols.append(src)
+    return torch.stack(list_cols)
+
+
+def stack_tta_batch(images, transforms):
+    """
+    Returns the augmented copies (K x B, C, H, W) of a batch of images (B, C, H, W),
+    stacked transform by transform
+    """
+    cols = get_tta_cols(images.shape[-1], transforms).to(images.device)
+    return torch.cat([images.index_select(-1, src) for src in cols])
+
+
+def undo_tta_batch(y, transforms):
+    """
+    Returns the per-column outputs (K x B, C, W) of an augmented batch mapped back
+    to the original columns, as (K, B, C, W)
+    """
+    cols = get_tta_cols(y.shape[-1], transforms, inverse=True).to(y.device)
+    y = y.view(transforms.__len__(), -1, *y.shape[1:])
+    return torch.stack([y[k].index_select(-1, src) for k, src in enumerate(cols)])
+
+
+def aggregate_tta(y, aggregation="mean"):
+    """
+    Aggregates the aligned outputs (K, B, C, W) of every transform.
+    Returns the aggregated outputs (B, C, W) and their per-column std (B, C, W)
+    """
+    assert aggregation in TTA_AGGREGATIONS, f"Unknown aggregation {aggregation}"
+    std = y.std(dim=0, unbiased=False)
+    if aggregation == "median":
+        return y.quantile(0.5, dim=0), std
+    return y.mean(dim=0), std
@@ -11,13 +11,49 @@ from torch.utils.data import DataLoader
 from torch.utils.tensorboard import SummaryWriter
 from tqdm import tqdm, trange
 from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 from mvl_challenge.config.cfg import save_cfg
 from mvl_challenge import ROOT_DIR
-from mvl_challenge.datasets.mvl_dataset import MVImageLayout
+from mvl_challenge.datasets.mvl_dataset import (
+    MVImageLayout,
+    set_estimated_phi_coords,
+    get_loader_context,
+    seed_worker,
+)
 from mvl_challenge.utils.io_utils import save_json_dict, print_cfg_information, create_directory
-from mvl_challenge.data_loaders.mvl_dataloader import MVLDataLoader
+from mvl_challenge.data_loaders.mvl_dataloader import MVLDataLoader, unpack_batch
+from mvl_challenge.data_loaders.room_sampler import RoomBatchSampler, CacheHitReport
+from mvl_challenge.models.async_valid_iou import AsyncValidIoU
+from mvl_challenge.models.cpu_inference import (
+    set_torch_threads,
+    get_inference_net,
+    get_weights_version,
+    get_phi_coords_parity,
+)
+from mvl_challenge.models.inference_cache import get_inference_cache, get_image_hash
+from mvl_challenge.models.test_time_augmentation import (
+    get_tta_transforms,
+    stack_tta_batch,
+    undo_tta_batch,
+    aggregate_tta,
+)
 from mvl_challenge.utils.eval_utils import eval_2d3d_iuo_from_tensors, compute_weighted_L1, compute_L1_loss
 
+# ! Attributes needed by estimate_batch() (see get_inference_state())
+INFERENCE_STATE_KEYS = (
+    "cfg",
+    "device",
+    "net",
+    "inference_net",
+    "precision",
+    "channels_last",
+    "parity_check",
+    "parity_report",
+    "tta_transforms",
+    "tta_aggregation",
+    "inference_cache",
+)
+
 
 class WrapperHorizonNet:
     def __init__(self, cfg):
@@ -38,8 +74,107 @@ class WrapperHorizonNet:
             self.device
         )
         logging.info(f"ckpt: {cfg.model.ckpt}")
+        self.set_inference_mode()
+        self.set_tta_mode()
+        self.inference_cache = None
         logging.info("HorizonNet Wrapper Successfully initialized")
 
+    def set_inference_mode(self):
+        """
+        Sets the CPU inference fast path defined in cfg.model.inference
+        (precision: fp32|bf16|int8, channels_last, num_threads, num_interop_threads, parity_check).
+        Only forward_batch() uses it, training and validation run on self.net.
+        """
+        self.inference_net = self.net
+        self.inference_weights_version = None
+        self.precision = "fp32"
+        self.channels_last = False
+        self.parity_check = False
+        self.parity_report = None
+        cfg_inference = self.cfg.model.get("inference", None)
+        if cfg_inference is None:
+            return
+        if self.device.type != "cpu":
+            logging.warning("Inference mode in cfg.model.inference is only applied on cpu")
+            return
+
+        set_torch_threads(
+            num_threads=cfg_inference.get("num_threads", -1),
+            num_interop_threads=cfg_inference.get("num_interop_threads", -1),
+        )
+        self.precision = cfg_inference.get("precision", "fp32")
+        self.channels_last = cfg_inference.get("channels_last", False)
+        self.parity_check = cfg_inference.get("parity_check", False)
+        self.inference_net = get_inference_net(
+            self.net, precision=self.precision, channels_last=self.channels_last
+        )
+        if self.inference_net is not self.net:
+            # ! e.g. int8 copy. It is rebuilt when the weights of self.net change (see update_inference_net())
+            self.inference_weights_version = get_weights_version(self.net)
+        logging.info(f"CPU inference: {self.precision} (channels_last: {self.channels_last})")
+
+    def get_inference_state(self):
+        """
+        Returns the (picklable) state needed to run estimate_batch() in another process
+        (e.g. spawned inference workers). Weights in shared memory are not copied when pickled.
+        """
+        state = {key: self.__dict__[key] for key in INFERENCE_STATE_KEYS}
+        if self.inference_net is not self.net:
+            # ! e.g. int8 copy. Quantized modules can not be shared, it is rebuilt from self.net
+            state["inference_net"] = None
+        # ! Weights do not change in other processes, so the inference network is never rebuilt there
+        state["inference_weights_version"] = None
+        return state
+
+    @classmethod
+    def from_inference_state(cls, state):
+        """
+        Returns a wrapper which only runs inference, from the state of get_inference_state()
+        """
+        model = cls.__new__(cls)
+        model.__dict__.update(state)
+        if model.inference_net is None:
+            model.inference_net = get_inference_net(
+                model.net, precision=model.precision, channels_last=model.channels_last
+            )
+        return model
+
+    def update_inference_net(self):
+        """
+        Rebuilds the inference network if it is a copy (e.g. int8) and the weights of self.net
+        changed since it was built (e.g. training, load_state_dict())
+        """
+        if self.inference_weights_version is None:
+            return
+        weights_version = get_weights_version(self.net)
+        if weights_version == self.inference_weights_version:
+            return
+        logging.info(f"Weights changed. Rebuilding the {self.precision} inference network")
+        self.inference_net = get_inference_net(
+            self.net, precision=self.precision, channels_last=self.channels_last
+        )
+        self.inference_weights_version = weights_version
+
+    def set_tta_mode(self):
+        """
+        Sets the test-time augmentation defined in cfg.model.tta (num_rolls, flip, aggregation: mean|median).
+        The augmented copies of the images are stacked into the same forward batch (see forward_batch_tta()).
+        """
+        self.tta_transforms = None
+        self.tta_aggregation = "mean"
+        cfg_tta = self.cfg.model.get("tta", None)
+        if cfg_tta is None:
+            return
+        transforms = get_tta_transforms(
+            num_rolls=cfg_tta.get("num_rolls", 1), flip=cfg_tta.get("flip", False)
+        )
+        if transforms.__len__() == 1:
+            # ! Identity only
+            return
+        self.tta_transforms = transforms
+        self.tta_aggregation = cfg_tta.get("aggregation", "mean")
+        logging.info(f"TTA: {transforms.__len__()} transforms ({self.tta_aggregation})")
+
     @staticmethod
     def set_horizon_net_path():
         hn_dir = os.path.join(ROOT_DIR, "models", "HorizonNet")
@@ -48,28 +183,155 @@ class WrapperHorizonNet:
 
     def estimate_within_list_ly(self, list_ly):
         """
-        Estimates phi_coords (layout boundaries) for all ly defined in list_ly using the passed model instance
+        Estimates phi_coords (layout boundaries) for all ly defined in list_ly using the passed model instance.
+        If runners.mvl.inference_cache is defined, only frames not found in the cache are estimated
         """
+        evaluated_data, image_hashes = self.get_cached_estimations([(ly.img_fn, ly.idx) for ly in list_ly])
+        list_ly_to_estimate = [ly for ly in list_ly if ly.idx not in evaluated_data]
+
+        if list_ly_to_estimate.__len__() > 0:
+            layout_dataloader = DataLoader(
+                MVImageLayout(
+                    [(ly.img_fn, ly.idx) for ly in list_ly_to_estimate],
+                    uint8_images=self.cfg.runners.mvl.get("uint8_images", False),
+                    image_cache=self.cfg.runners.mvl.get("image_cache", None),
+                ),
+                batch_size=self.cfg.runners.mvl.batch_size,
+                shuffle=False,
+                drop_last=False,
+                num_workers=self.cfg.runners.mvl.num_workers,
+                pin_memory=True if self.device.type != "cpu" else False,
+                worker_init_fn=seed_worker,
+                multiprocessing_context=get_loader_context(self.cfg.runners.mvl.num_workers),
+            )
+            self.net.eval()
+            for x in tqdm(layout_dataloader, desc=f"Estimating layout..."):
+                for data, idx in zip(self.estimate_batch(x["images"]), x["idx"]):
+                    evaluated_data[idx] = data
+                    self.put_cached_estimation(image_hashes, idx, data)
 
-        layout_dataloader = DataLoader(
-            MVImageLayout([(ly.img_fn, ly.idx) for ly in list_ly]),
-            batch_size=self.cfg.runners.mvl.batch_size,
-            shuffle=False,
-            drop_last=False,
-            num_workers=self.cfg.runners.mvl.num_workers,
-            pin_memory=True if self.device != "cpu" else False,
-            worker_init_fn=lambda x: np.random.seed(),
+        self.update_inference_cache()
+        set_estimated_phi_coords(list_ly, evaluated_data)
+
+    def get_inference_cache(self):
+        """
+        Returns the InferenceCache defined in runners.mvl.inference_cache (created on the first call) or None
+        """
+        cfg_cache = self.cfg.runners.mvl.get("inference_cache", None)
+        if cfg_cache is None or not cfg_cache.get("cache_dir", ""):
+            return None
+        if self.inference_cache is None:
+            # ! Every setting which changes the outputs is part of the model key
+            cfg_image_cache = self.cfg.runners.mvl.get("image_cache", None)
+            image_downscale = 1
+            if cfg_image_cache is not None and cfg_image_cache.get("filename", ""):
+                image_downscale = cfg_image_cache.get("downscale", 1)
+            self.inference_cache = get_inference_cache(
+                cfg_cache,
+                self.cfg.model.ckpt,
+                precision=self.precision,
+                channels_last=self.channels_last,
+                tta=None if self.tta_transforms is None else f"{self.tta_transforms}_{self.tta_aggregation}",
+                uint8_images=self.cfg.runners.mvl.get("uint8_images", False),
+                image_downscale=image_downscale,
+            )
+        return self.inference_cache
+
+    def get_cached_estimations(self, list_data):
+        """
+        Returns the estimations {idx: data} of list_data [(img_fn, idx), ...] found in the inference
+        cache and the image hashes {idx: hash} of all frames. Both are empty if the cache is not defined.
+        """
+        evaluated_data, image_hashes = {}, {}
+        inference_cache = self.get_inference_cache()
+        if inference_cache is None:
+            return evaluated_data, image_hashes
+        for img_fn, idx in list_data:
+            image_hashes[idx] = get_image_hash(img_fn, idx)
+            data = inference_cache.get(image_hashes[idx])
+            if data is not None:
+                evaluated_data[idx] = data
+        return evaluated_data, image_hashes
+
+    def put_cached_estimation(self, image_hashes, idx, data):
+        if self.inference_cache is not None:
+            self.inference_cache.put(image_hashes[idx], data)
+
+    def update_inference_cache(self):
+        """
+        Enforces the size cap of the inference cache (if defined) and logs its hit rate
+        """
+        if self.inference_cache is None:
+            return
+        self.inference_cache.enforce_size_cap()
+        stats = self.inference_cache.get_stats()
+        logging.info(f"Inference cache: hit rate {stats['hit_rate']:.3f} ({stats['hits']} hits)")
+
+    def estimate_batch(self, images):
+        """
+        Returns the estimations of a batch of images (B, 3, H, W) as a list of arrays:
+        y_bon and y_cor stacked (3, W), plus the per-column std of y_bon (5, W) with TTA.
+        See set_estimated_phi_coords()
+        """
+        if self.tta_transforms is not None:
+            y_bon_, y_cor_, y_std_ = self.forward_batch_tta(images)
+            return [np.vstack((y_, cor_, std_)) for y_, cor_, std_ in zip(y_bon_, y_cor_, y_std_)]
+        y_bon_, y_cor_ = self.forward_batch(images)
+        return [np.vstack((y_, cor_)) for y_, cor_ in zip(y_bon_, y_cor_)]
+
+    def forward_batch(self, images):
+        """
+        Runs the model on a batch of images (B, 3, H, W) and returns y_bon, y_cor on cpu.
+        If TTA is defined (cfg.model.tta), the aggregated outputs are returned.
+        """
+        if self.tta_transforms is not None:
+            y_bon_, y_cor_, _ = self.forward_batch_tta(images)
+            return y_bon_, y_cor_
+        return self.forward_inference_net(images)
+
+    def forward_batch_tta(self, images):
+        """
+        Runs the model on all TTA copies of a batch of images (B, 3, H, W) in a single forward pass.
+        Returns the aggregated y_bon, y_cor and the per-column std of y_bon, on cpu.
+        """
+        images = images.to(self.device)
+        y_bon_, y_cor_ = self.forward_inference_net(stack_tta_batch(images, self.tta_transforms))
+        assert y_bon_.shape[-1] == images.shape[-1], "TTA requires per-column outputs (same width as the images)"
+        y_bon_, y_bon_std_ = aggregate_tta(
+            undo_tta_batch(y_bon_, self.tta_transforms), self.tta_aggregation
         )
-        self.net.eval()
-        evaluated_data = {}
-        for x in tqdm(layout_dataloader, desc=f"Estimating layout..."):
+        y_cor_, _ = aggregate_tta(undo_tta_batch(y_cor_, self.tta_transforms), self.tta_aggregation)
+        return y_bon_, y_cor_, y_bon_std_
+
+    def forward_inference_net(self, images):
+        """
+        Runs the inference network on a batch of images (B, 3, H, W) and returns y_bon, y_cor on cpu.
+        uint8 images are normalized on the device.
+        """
+        self.update_inference_net()
+        images = images.to(self.device)
+        if images.dtype == torch.uint8:
+            images = images.float() / 255.0
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad(), torch.autocast(
+            device_type=self.device.type, dtype=torch.bfloat16, enabled=self.precision == "bf16"
+        ):
+            y_bon_, y_cor_ = self.inference_net(images)
+        y_bon_, y_cor_ = y_bon_.float().cpu(), y_cor_.float().cpu()
+
+        if self.parity_check and self.parity_report is None:
+            # ! phi_coords error w.r.t. fp32 (first batch only)
             with torch.no_grad():
-                y_bon_, y_cor_ = self.net(x["images"].to(self.device))
-                # y_bon_, y_cor_ = net(x[0].to(device))
-            for y_, cor_, idx in zip(y_bon_.cpu(), y_cor_.cpu(), x["idx"]):
-                data = np.vstack((y_, cor_))
-                evaluated_data[idx] = data
-        [ly.set_phi_coords(phi_coords=evaluated_data[ly.idx]) for ly in list_ly]
+                y_bon_ref, _ = self.net(images)
+            self.parity_report = get_phi_coords_parity(
+                y_bon_ref.cpu().numpy(), y_bon_.numpy(), height=images.shape[2]
+            )
+            logging.info(
+                f"Parity {self.precision} vs fp32: max err {self.parity_report['max_err_px']:.3f} px - "
+                + f"mean err {self.parity_report['mean_err_px']:.3f} px"
+            )
+        return y_bon_, y_cor_
 
     def set_optimizer(self):
         if self.cfg.model.optimizer == "SGD":
@@ -124,7 +386,7 @@ class WrapperHorizonNet:
                         desc=f"Training HorizonNet epoch:{self.current_epoch}/{self.cfg.model.epochs}"):
 
             self.iterations += 1
-            x, y_bon_ref, std = next(iterator_train)
+            x, y_bon_ref, std = unpack_batch(next(iterator_train), self.device)
             y_bon_est, _ = self.net(x.to(self.device))
 
             if y_bon_est is np.nan:
@@ -154,6 +416,9 @@ class WrapperHorizonNet:
 
         self.lr_scheduler.step()
 
+        for key, value in self.train_cache_report.get_epoch_report().items():
+            self.tb_writer.add_scalar(f"train/{key}", value, self.current_epoch)
+
         # Epoch finished
         self.current_epoch += 1
 
@@ -171,9 +436,14 @@ class WrapperHorizonNet:
 
         return self.is_training
 
-    def save_current_scores(self):
+    def save_current_scores(self, epoch=None):
         # ! Saving current epoch data
-        fn = os.path.join(self.dir_ckpt, f"valid_eval_{self.current_epoch}.json")
+        if epoch is None:
+            if self.cfg.runners.valid_iou.get("async_validation", False):
+                # ! Scores are saved when the async validation finishes
+                return
+            epoch = self.current_epoch
+        fn = os.path.join(self.dir_ckpt, f"valid_eval_{epoch}.json")
         save_json_dict(filename=fn, dict_data=self.curr_scores)
         # ! Save the best scores in a json file regardless of saving the model or not
         save_json_dict(
@@ -181,60 +451,125 @@ class WrapperHorizonNet:
             filename=os.path.join(self.dir_ckpt, "best_score.json")
         )
 
+    def eval_valid_iou_batch(self, y_bon_est, y_bon_ref, loss):
+        """
+        Returns the loss and the mean 2D/3D IoU of a validation batch.
+        IoU is evaluated for the whole batch at once (see eval_2d3d_iuo_batch)
+        """
+        true_eval = {"2DIoU": [], "3DIoU": []}
+        eval_2d3d_iuo_from_tensors(y_bon_est, y_bon_ref, true_eval)
+        local_eval = dict(loss=loss)
+        local_eval["2DIoU"] = np.mean(true_eval["2DIoU"])
+        local_eval["3DIoU"] = np.mean(true_eval["3DIoU"])
+        return local_eval
+
     def valid_iou_loop(self, only_val=False):
+        if not only_val and self.cfg.runners.valid_iou.get("async_validation", False):
+            return self.valid_iou_loop_async()
+
+        valid_eval = self.compute_valid_iou()
+        if only_val:
+            logging.info(f"3D-IoU score: {valid_eval['3DIoU']:.4f}")
+            logging.info(f"2D-IoU score: {valid_eval['2DIoU']:.4f}")
+            return {"2D-IoU": valid_eval["2DIoU"], "3D-IoU": valid_eval["3DIoU"]}
+
+        self.update_valid_iou_scores(valid_eval, self.current_epoch)
+
+    def valid_iou_loop_async(self):
+        """
+        Submits a snapshot of the current weights to a background validation process
+        (see AsyncValidIoU) and updates the scores of the already finished validations.
+        The last epoch waits for all pending validations.
+        """
+        if self.async_valid_iou is None:
+            self.async_valid_iou = AsyncValidIoU(
+                self.cfg, max_pending=self.cfg.runners.valid_iou.get("async_max_pending", 2)
+            )
+        self.async_valid_iou.submit(self.current_epoch, self.net.state_dict())
+        self.collect_async_valid_iou(block=not self.is_training)
+
+    def collect_async_valid_iou(self, block=False):
+        if self.async_valid_iou is None:
+            return
+        for epoch, valid_eval, state_dict in self.async_valid_iou.iter_results(block=block):
+            self.update_valid_iou_scores(valid_eval, epoch, state_dict=state_dict)
+            self.save_current_scores(epoch)
+        if block:
+            self.async_valid_iou.close()
+            self.async_valid_iou = None
+
+    def compute_valid_iou(self):
+        """
+        Returns the mean loss, 2DIoU and 3DIoU of the IoU validation set
+        """
         print_cfg_information(self.cfg)
         self.net.eval()
         iterator_valid_iou = iter(self.valid_iou_loader)
         total_eval = {}
         invalid_cnt = 0
 
-        for _ in trange(len(iterator_valid_iou), desc="IoU Validation epoch %d" % self.current_epoch):
-            x, y_bon_ref, std = next(iterator_valid_iou)
-
-            with torch.no_grad():
-                y_bon_est, _ = self.net(x.to(self.device))
-
-                true_eval = {"2DIoU": [], "3DIoU": []}
-                for gt, est in zip(y_bon_ref.cpu().numpy(), y_bon_est.cpu().numpy()):
-                    eval_2d3d_iuo_from_tensors(est[None], gt[None], true_eval, )
-
-
-                local_eval = dict(
-                    loss=compute_weighted_L1(y_bon_est.to(
-                        self.device), y_bon_ref.to(self.device), std.to(self.device))
-                )
-                local_eval["2DIoU"] = torch.FloatTensor(
-                    [true_eval["2DIoU"]]).mean()
-                local_eval["3DIoU"] = torch.FloatTensor(
-                    [true_eval["3DIoU"]]).mean()
+        def accumulate(local_eval, batch_size):
+            nonlocal invalid_cnt
             try:
                 for k, v in local_eval.items():
-                    if v.isnan():
+                    v = float(v)
+                    if np.isnan(v):
                         continue
-                    total_eval[k] = total_eval.get(k, 0) + v.item() * x.size(0)
+                    total_eval[k] = total_eval.get(k, 0) + v * batch_size
             except:
                 invalid_cnt += 1
                 pass
 
-        if only_val:
-            scaler_value = self.cfg.runners.valid_iou.batch_size * \
-                (len(iterator_valid_iou) - invalid_cnt)
-            curr_score_3d_iou = total_eval["3DIoU"] / scaler_value
-            curr_score_2d_iou = total_eval["2DIoU"] / scaler_value
-            logging.info(f"3D-IoU score: {curr_score_3d_iou:.4f}")
-            logging.info(f"2D-IoU score: {curr_score_2d_iou:.4f}")
-            return {"2D-IoU": curr_score_2d_iou, "3D-IoU": curr_score_3d_iou}
+        # ! IoU of batch k can be evaluated while batch k+1 is in the model
+        executor = (
+            ThreadPoolExecutor(max_workers=1)
+            if self.cfg.runners.valid_iou.get("overlap_iou_eval", False)
+            else None
+        )
+        pending = None
+
+        for _ in trange(len(iterator_valid_iou), desc="IoU Validation epoch %d" % self.current_epoch):
+            x, y_bon_ref, std = unpack_batch(next(iterator_valid_iou), self.device)
+
+            with torch.no_grad():
+                y_bon_est, _ = self.net(x.to(self.device))
+                loss = compute_weighted_L1(y_bon_est.to(
+                    self.device), y_bon_ref.to(self.device), std.to(self.device))
+                y_bon_est = y_bon_est.cpu().numpy()
+                y_bon_ref = y_bon_ref.cpu().numpy()
+
+            if executor is None:
+                accumulate(self.eval_valid_iou_batch(y_bon_est, y_bon_ref, loss), x.size(0))
+                continue
+
+            if pending is not None:
+                accumulate(pending[0].result(), pending[1])
+            pending = (
+                executor.submit(self.eval_valid_iou_batch, y_bon_est, y_bon_ref, loss),
+                x.size(0),
+            )
+
+        if pending is not None:
+            accumulate(pending[0].result(), pending[1])
+        if executor is not None:
+            executor.shutdown()
 
         scaler_value = self.cfg.runners.valid_iou.batch_size * \
             (len(iterator_valid_iou) - invalid_cnt)
-        for k, v in total_eval.items():
+        return {k: v / scaler_value for k, v in total_eval.items()}
+
+    def update_valid_iou_scores(self, valid_eval, epoch, state_dict=None):
+        """
+        Logs the IoU validation of an epoch, updates the current/best scores and saves
+        the best models. state_dict defines the validated weights (Default: current weights)
+        """
+        for k, v in valid_eval.items():
             k = "valid_IoU/%s" % k
-            self.tb_writer.add_scalar(
-                k, v / scaler_value, self.current_epoch)
+            self.tb_writer.add_scalar(k, v, epoch)
 
         # Save best validation loss model
-        curr_score_3d_iou = total_eval["3DIoU"] / scaler_value
-        curr_score_2d_iou = total_eval["2DIoU"] / scaler_value
+        curr_score_3d_iou = valid_eval["3DIoU"]
+        curr_score_2d_iou = valid_eval["2DIoU"]
 
         # ! Saving current score
         self.curr_scores['iou_valid_scores'] = dict(
@@ -262,15 +597,15 @@ class WrapperHorizonNet:
                 logging.info(
                     f"New 3D-IoU Best Score {curr_score_3d_iou: 0.4f}")
                 self.best_scores["best_iou_valid_score"]['best_3d_iou_score'] = curr_score_3d_iou
-                self.save_model("best_3d_iou_valid.pth")
+                self.save_model("best_3d_iou_valid.pth", state_dict)
 
             if best_2d_iou_score < curr_score_2d_iou:
                 logging.info(
                     f"New 2D-IoU Best Score {curr_score_2d_iou: 0.4f}")
                 self.best_scores["best_iou_valid_score"]['best_2d_iou_score'] = curr_score_2d_iou
-                self.save_model("best_2d_iou_valid.pth")
+                self.save_model("best_2d_iou_valid.pth", state_dict)
 
-    def save_model(self, filename):
+    def save_model(self, filename, net_state_dict=None):
         if not self.cfg.model.get("save_ckpt", True):
             return
 
@@ -282,7 +617,7 @@ class WrapperHorizonNet:
                     "backbone": self.net.backbone,
                     "use_rnn": self.net.use_rnn,
                 },
-                "state_dict": self.net.state_dict(),
+                "state_dict": self.net.state_dict() if net_state_dict is None else net_state_dict,
             }
         )
         torch.save(state_dict, os.path.join(
@@ -294,6 +629,7 @@ class WrapperHorizonNet:
         self.iterations = 0
         self.best_scores = dict()
         self.curr_scores = dict()
+        self.async_valid_iou = None
         self.set_optimizer()
         self.set_scheduler()
         self.set_train_dataloader()
@@ -313,15 +649,31 @@ class WrapperHorizonNet:
 
     def set_train_dataloader(self):
         logging.info("Setting Training Dataloader")
-        self.train_loader = DataLoader(
-            MVLDataLoader(self.cfg.runners.train),
-            batch_size=self.cfg.runners.train.batch_size,
-            shuffle=True,
-            drop_last=True,
-            num_workers=self.cfg.runners.train.num_workers,
-            pin_memory=True if self.device != 'cpu' else False,
-            worker_init_fn=lambda x: np.random.seed(),
-        )
+        dataset = MVLDataLoader(self.cfg.runners.train)
+        room_locality = self.cfg.runners.train.get("room_locality", None)
+        if room_locality is None:
+            self.train_loader = DataLoader(
+                dataset,
+                batch_size=self.cfg.runners.train.batch_size,
+                shuffle=True,
+                drop_last=True,
+                num_workers=self.cfg.runners.train.num_workers,
+                pin_memory=True if self.device.type != 'cpu' else False,
+                worker_init_fn=lambda x: np.random.seed(),
+            )
+        else:
+            # ! Shuffled blocks of frames of the same room (see RoomBatchSampler)
+            logging.info(f"Room-aware batch sampler (locality: {room_locality})")
+            self.train_loader = DataLoader(
+                dataset,
+                batch_sampler=RoomBatchSampler(
+                    dataset, self.cfg.runners.train.batch_size, locality=room_locality, drop_last=True
+                ),
+                num_workers=self.cfg.runners.train.num_workers,
+                pin_memory=True if self.device.type != 'cpu' else False,
+                worker_init_fn=lambda x: np.random.seed(),
+            )
+        self.train_cache_report = CacheHitReport(dataset, self.train_loader.batch_sampler)
 
     def set_valid_dataloader(self):
         logging.info("Setting IoU Validation Dataloader")
@@ -331,5 +683,5 @@ class WrapperHorizonNet:
             shuffle=False,
             drop_last=False,
             num_workers=self.cfg.runners.valid_iou.num_workers,
-            pin_memory=True if self.device != 'cpu' else False,
+            pin_memory=True if self.device.type != 'cpu' else False,
             worker_init_fn=lambda x: np.random.seed())
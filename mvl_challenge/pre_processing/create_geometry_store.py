@@ -0,0 +1,62 @@
+import argparse
+from mvl_challenge import EPILOG, DEFAULT_MVL_DIR, SCENE_LIST_DIR
+import os
+from pathlib import Path
+from mvl_challenge.config.cfg import set_loggings
+from mvl_challenge.utils.io_utils import get_all_frames_from_scene_list
+from mvl_challenge.datasets.geometry_store import create_geometry_store
+
+
+def main(args):
+    set_loggings()
+    if args.output_file is None:
+        args.output_file = os.path.join(
+            args.scene_dir, "geometry_store", f"{Path(args.scene_list).stem}.npy"
+        )
+    list_frames = get_all_frames_from_scene_list(args.scene_list)
+    create_geometry_store(
+        geom_info_dir=os.path.join(args.scene_dir, "geometry_info"),
+        list_frames=list_frames,
+        filename=args.output_file,
+    )
+
+
+def get_argparse():
+    desc = (
+        "This script packs the geometry info (geometry_info/*.json) of a scene list into a single columnar file. "
+        + "The output file can be used by MVLDataset by setting runners.mvl.geometry_store in the cfg file."
+    )
+
+    parser = argparse.ArgumentParser(description=desc, epilog=EPILOG)
+
+    parser.add_argument(
+        "-d",
+        "--scene_dir",
+        type=str,
+        default=f"{DEFAULT_MVL_DIR}",
+        help="MVL dataset directory.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--scene_list",
+        type=str,
+        default=f"{SCENE_LIST_DIR}/scene_list__warm_up_pilot_set.json",
+        help="Scene_list of mvl scenes in scene_room_idx format.",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        default=None,
+        help="Output file. (Default: ${scene_dir}/geometry_store/${scene_list}.npy)",
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = get_argparse()
+    main(args)
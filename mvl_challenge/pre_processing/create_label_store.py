@@ -0,0 +1,65 @@
+import argparse
+from mvl_challenge import EPILOG, DEFAULT_MVL_DIR, SCENE_LIST_DIR
+import os
+from pathlib import Path
+from mvl_challenge.config.cfg import set_loggings
+from mvl_challenge.utils.io_utils import get_all_frames_from_scene_list
+from mvl_challenge.datasets.label_store import create_label_store
+
+
+def main(args):
+    set_loggings()
+    if args.labels_dir is None:
+        args.labels_dir = os.path.join(args.scene_dir, "labels")
+    list_idx = [Path(fr).stem for fr in get_all_frames_from_scene_list(args.scene_list)]
+    for label in args.labels:
+        create_label_store(labels_dir=args.labels_dir, label=label, list_idx=list_idx)
+
+
+def get_argparse():
+    desc = (
+        "This script consolidates the per-frame labels (e.g. labels/mlc_label/*.npy) and std (labels/std/*.npy) "
+        + "of a scene list into a label store (labels/${label}__store). "
+        + "The store can be read by MVLDataLoader by setting data_dir.label_store in the cfg file."
+    )
+
+    parser = argparse.ArgumentParser(description=desc, epilog=EPILOG)
+
+    parser.add_argument(
+        "-d",
+        "--scene_dir",
+        type=str,
+        default=f"{DEFAULT_MVL_DIR}",
+        help="MVL dataset directory.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--scene_list",
+        type=str,
+        default=f"{SCENE_LIST_DIR}/scene_list__warm_up_pilot_set.json",
+        help="Scene_list of mvl scenes in scene_room_idx format.",
+    )
+
+    parser.add_argument(
+        "--labels_dir",
+        type=str,
+        default=None,
+        help="Labels directory. (Default: ${scene_dir}/labels)",
+    )
+
+    parser.add_argument(
+        "--labels",
+        type=str,
+        nargs="+",
+        default=["mlc_label"],
+        help="Labels to consolidate, e.g., gt mlc_label. (Default: mlc_label)",
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = get_argparse()
+    main(args)
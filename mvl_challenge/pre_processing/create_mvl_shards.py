@@ -0,0 +1,112 @@
+import argparse
+from mvl_challenge import EPILOG, DEFAULT_MVL_DIR, SCENE_LIST_DIR
+import os
+import json
+import logging
+import numpy as np
+from tqdm import tqdm
+from mvl_challenge.config.cfg import set_loggings
+from mvl_challenge.utils.io_utils import create_directory
+from mvl_challenge.datasets.mvl_shard import save_mvl_shard, get_shard_fn
+
+
+def load_frame_labels(labels_dir, list_labels, idx):
+    """
+    Returns the available phi_coords labels (npz or npy) for the passed frame idx
+    """
+    labels = {}
+    for label in list_labels:
+        label_fn = os.path.join(labels_dir, label, f"{idx}")
+        if os.path.exists(label_fn + ".npy"):
+            labels[label] = np.load(label_fn + ".npy")
+        elif os.path.exists(label_fn + ".npz"):
+            labels[label] = np.load(label_fn + ".npz")["phi_coords"]
+    return labels
+
+
+def create_room_shard(args, room_scene, list_frames):
+    frames = []
+    for frame in list_frames:
+        idx = os.path.splitext(frame)[0]
+        img_fn = os.path.join(args.scene_dir, "img", f"{idx}.jpg")
+        assert os.path.exists(img_fn), f"Not found {img_fn}"
+        with open(img_fn, "rb") as f:
+            img_bytes = f.read()
+        geom = json.load(open(os.path.join(args.scene_dir, "geometry_info", f"{idx}.json")))
+        frames.append(
+            dict(
+                idx=idx,
+                img_bytes=img_bytes,
+                geom=geom,
+                labels=load_frame_labels(args.labels_dir, args.labels + ["std"], idx),
+            )
+        )
+    save_mvl_shard(get_shard_fn(args.output_dir, room_scene), room_scene, frames)
+
+
+def main(args):
+    set_loggings()
+    if args.labels_dir is None:
+        args.labels_dir = os.path.join(args.scene_dir, "labels")
+
+    create_directory(args.output_dir, delete_prev=False)
+    data_scenes = json.load(open(args.scene_list, "r"))
+    for room_scene, list_frames in tqdm(data_scenes.items(), desc="Creating MVL shards..."):
+        create_room_shard(args, room_scene, list_frames)
+    logging.info(f"Saved {data_scenes.__len__()} shards at {args.output_dir}")
+
+
+def get_argparse():
+    desc = (
+        "This script packs a MVL dataset (img, geometry_info and labels) into one shard file per room. "
+        + "Shards can be read by MVLDataset and MVLDataLoader by setting shard_dir in the cfg file."
+    )
+
+    parser = argparse.ArgumentParser(description=desc, epilog=EPILOG)
+
+    parser.add_argument(
+        "-d",
+        "--scene_dir",
+        type=str,
+        default=f"{DEFAULT_MVL_DIR}",
+        help="MVL dataset directory.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--scene_list",
+        type=str,
+        default=f"{SCENE_LIST_DIR}/scene_list__warm_up_pilot_set.json",
+        help="Scene_list of mvl scenes in scene_room_idx format.",
+    )
+
+    parser.add_argument(
+        "--labels_dir",
+        type=str,
+        default=None,
+        help="Labels directory. (Default: ${scene_dir}/labels)",
+    )
+
+    parser.add_argument(
+        "--labels",
+        type=str,
+        nargs="*",
+        default=["gt"],
+        help="Labels to pack, e.g., gt mlc_label. The std labels are packed if available.",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output_dir",
+        type=str,
+        default=f"{DEFAULT_MVL_DIR}/shards",
+        help="Output directory for the shard files.",
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = get_argparse()
+    main(args)
@@ -8,12 +8,16 @@ import logging
 from imageio import imread, imwrite
 from mvl_challenge import EPILOG, ASSETS_DIR, CFG_DIR
 from mvl_challenge.utils.io_utils import create_directory
+from mvl_challenge.datasets.label_store import save_label_store, get_label_store_dir, remove_label_store
 from mvl_challenge.config.cfg import set_loggings, get_empty_cfg
 from mvl_challenge.utils.io_utils import (
     get_scene_room_from_scene_room_idx,
     get_all_frames_from_scene_list,
 )
-from mvl_challenge.utils.layout_utils import get_boundary_from_list_corners
+from mvl_challenge.utils.layout_utils import (
+    get_boundary_from_list_corners,
+    get_phi_bound_from_list_corners,
+)
 from mvl_challenge.utils.spherical_utils import (
     xyz2uv,
     uv2phi_coords,
@@ -35,52 +39,127 @@ from mvl_challenge.pre_processing.create_scene_room_idx_list import (
 )
 
 
+def get_dense_phi_coords(bound_ceil, bound_floor, cam_pose):
+    """
+    Returns the phi_coords (2, W) of a frame by projecting the dense boundaries
+    (see get_boundary_from_list_corners()). None if any column is not defined.
+    """
+    # ! Transform into camera coordinates
+    local_xyz_ceil = np.linalg.inv(cam_pose)[:3, :] @ extend_array_to_homogeneous(
+        bound_ceil
+    )
+    local_xyz_floor = np.linalg.inv(cam_pose)[:3, :] @ extend_array_to_homogeneous(
+        bound_floor
+    )
+
+    # ! projection into uv coord
+    uv_ceil = xyz2uv(local_xyz_ceil)
+    uv_floor = xyz2uv(local_xyz_floor)
+
+    #! Projection into phi_coords
+    phi_coords_ceil = uv2phi_coords(uv_ceil, type_bound="ceiling")
+    phi_coords_floor = uv2phi_coords(uv_floor, type_bound="floor")
+    if phi_coords_ceil is None or phi_coords_floor is None:
+        return None
+    return np.vstack([phi_coords_ceil, phi_coords_floor])
+
+
+def get_analytic_phi_coords(crn_ceil, crn_floor, cam_poses, batch_size=16):
+    """
+    Returns the phi_coords (F, 2, W) of all frames by intersecting every column ray with the
+    room walls (see get_phi_bound_from_list_corners()). Frames are processed in batches.
+    """
+    list_phi_coords = []
+    for i in range(0, cam_poses.shape[0], batch_size):
+        list_phi_coords.append(
+            np.stack(
+                [
+                    get_phi_bound_from_list_corners(
+                        crn_ceil, cam_poses[i : i + batch_size], type_bound="ceiling"
+                    ),
+                    get_phi_bound_from_list_corners(
+                        crn_floor, cam_poses[i : i + batch_size], type_bound="floor"
+                    ),
+                ],
+                axis=1,
+            )
+        )
+    return np.concatenate(list_phi_coords, axis=0)
+
+
+def log_phi_coords_parity(sc_rm_idx, ph_analytic, ph_dense, height, max_px_diff=1):
+    """
+    Logs the difference between the analytic and dense phi_coords (2, W) of a frame,
+    in pixels for an image of the passed height: max and mean error, and the number of
+    columns with any difference and with a difference of max_px_diff or more
+    """
+    if ph_analytic is None or ph_dense is None:
+        logging.warning(f"Parity check skipped for {sc_rm_idx}: phi_coords is None")
+        return
+    px_diff = np.abs(ph_analytic - ph_dense) * height / np.pi
+    col_diff = px_diff.max(axis=0)
+    logging.info(
+        f"Parity check {sc_rm_idx}: max diff {px_diff.max():.3f} px - mean diff {px_diff.mean():.3f} px - "
+        + f"columns with diff > 0: {np.sum(col_diff > 0)} - "
+        + f"columns with diff >= {max_px_diff}px: {np.sum(col_diff >= max_px_diff)} (of {col_diff.size})"
+    )
+
+
 def save_phi_bound(args, list_corners, scene_room_idx_list):
     # ! ceiling
     crn_ceil = [np.array(c[0]).T for c in list_corners]
-    bound_ceil = get_boundary_from_list_corners(crn_ceil)
 
     # ! Floor
     crn_floor = [np.array(c[1]).T for c in list_corners]
-    bound_floor = get_boundary_from_list_corners(crn_floor)
 
+    saved_labels = {}
     gt_dir = create_directory(args.output_dir, delete_prev=False)
     gt_vis_dir = create_directory(args.output_dir + "_vis", delete_prev=False)
 
+    # ! Getting SE3 transformations in geom_info
+    cam_poses = []
     for sc_rm_idx in scene_room_idx_list:
-        scene_room_idx = Path(sc_rm_idx).stem
         geom_info_fn = os.path.join(args.geom_info_dir, f"{sc_rm_idx}.json")
         assert os.path.exists(geom_info_fn), f"Not found {geom_info_fn}"
         geom_data = json.load(open(geom_info_fn, "r"))
-
-        # ! Getting SE3 transformation in geom_info
-        cam_pose = tum_pose2matrix44(
-            [-1] + geom_data["translation"] + geom_data["quaternion"]
+        cam_poses.append(
+            tum_pose2matrix44([-1] + geom_data["translation"] + geom_data["quaternion"])
         )
+    cam_poses = np.stack(cam_poses) if cam_poses.__len__() > 0 else np.zeros((0, 4, 4))
 
-        # ! Transform into camera coordinates
-        local_xyz_ceil = np.linalg.inv(cam_pose)[:3, :] @ extend_array_to_homogeneous(
-            bound_ceil
-        )
-        local_xyz_floor = np.linalg.inv(cam_pose)[:3, :] @ extend_array_to_homogeneous(
-            bound_floor
-        )
+    if args.method == "dense" or args.parity_check:
+        bound_ceil = get_boundary_from_list_corners(crn_ceil)
+        bound_floor = get_boundary_from_list_corners(crn_floor)
+        list_dense_phi_coords = [
+            get_dense_phi_coords(bound_ceil, bound_floor, cam_pose)
+            for cam_pose in cam_poses
+        ]
+
+    if args.method == "analytic" or args.parity_check:
+        list_analytic_phi_coords = [
+            None if np.any(np.isnan(phi_coords)) else phi_coords
+            for phi_coords in get_analytic_phi_coords(crn_ceil, crn_floor, cam_poses)
+        ]
 
-        # ! projection into uv coord
-        uv_ceil = xyz2uv(local_xyz_ceil)
-        uv_floor = xyz2uv(local_xyz_floor)
+    if args.method == "analytic":
+        list_phi_coords = list_analytic_phi_coords
+    else:
+        list_phi_coords = list_dense_phi_coords
+
+    for i, (sc_rm_idx, phi_coords) in enumerate(zip(scene_room_idx_list, list_phi_coords)):
+        scene_room_idx = Path(sc_rm_idx).stem
 
         img = imread(
             Path(args.geom_info_dir).parent.__str__() + f"/img/{scene_room_idx}.jpg"
         )
+        if args.parity_check:
+            log_phi_coords_parity(
+                sc_rm_idx, list_analytic_phi_coords[i], list_dense_phi_coords[i], height=img.shape[0]
+            )
 
-        #! Projection into phi_coords
-        phi_coords_ceil = uv2phi_coords(uv_ceil, type_bound="ceiling")
-        phi_coords_floor = uv2phi_coords(uv_floor, type_bound="floor")
-        if phi_coords_ceil is None or phi_coords_floor is None:
+        if phi_coords is None:
             logging.warning("phi_coords is None")
             continue
-        phi_coords = np.vstack([phi_coords_ceil, phi_coords_floor])
         assert phi_coords.shape == (2, 1024)
         img = add_caption_to_image(image=img, caption="mvl-challenge " + scene_room_idx)
 
@@ -91,9 +170,11 @@ def save_phi_bound(args, list_corners, scene_room_idx_list):
 
         imwrite(gt_vis_fn, img)
         np.savez_compressed(gt_fn, phi_coords=phi_coords)
+        saved_labels[scene_room_idx] = phi_coords
         print(f"Saving... {gt_fn}.npz", end="\r")
         # logging.info(f"Saved {gt_fn}")
     print(f"Finished {gt_dir}")
+    return saved_labels
 
 
 def main(args):
@@ -102,6 +183,7 @@ def main(args):
 
     create_directory(args.output_dir, delete_prev=False)
     scene_room_idx_list = get_all_frames_from_scene_list(args.scene_list)
+    saved_labels = {}
 
     all_rooms = np.unique(
         [get_scene_room_from_scene_room_idx(room) for room in scene_room_idx_list]
@@ -126,12 +208,27 @@ def main(args):
                 mvl_data = json.load(open(mvl_labels_fn, "r"))
                 list_corners = mvl_data["room_corners"][idx]
 
-                save_phi_bound(
-                    args,
-                    list_corners,
-                    [g for g in scene_room_idx_list if room_name in g],
+                saved_labels.update(
+                    save_phi_bound(
+                        args,
+                        list_corners,
+                        [g for g in scene_room_idx_list if room_name in g],
+                    )
                 )
 
+    if not args.label_store:
+        # ! A previous store would serve outdated labels
+        remove_label_store(Path(args.output_dir).parent.__str__(), Path(args.output_dir).name)
+    elif saved_labels.__len__() > 0:
+        # ! Consolidated labels for training (see label_store.py)
+        save_label_store(
+            store_dir=get_label_store_dir(
+                Path(args.output_dir).parent.__str__(), Path(args.output_dir).name
+            ),
+            list_idx=list(saved_labels.keys()),
+            phi_coords=np.stack(list(saved_labels.values())),
+        )
+
     # # ! Save scene_list for GT labels
     # cfg = get_empty_cfg()
     # cfg.mvl_dir = args.output_dir
@@ -185,6 +282,28 @@ def get_argparse():
         help="Output directory for the output_file to be created.",
     )
 
+    parser.add_argument(
+        "--method",
+        default="dense",
+        choices=["analytic", "dense"],
+        type=str,
+        help="dense: projection of 1mm sampled boundaries (reference GT labels). "
+        + "analytic: ray-wall intersections at the column centers, faster but up to a few px "
+        + "different from dense (see --parity_check). (Default: dense)",
+    )
+
+    parser.add_argument(
+        "--label_store",
+        action="store_true",
+        help="Saves also all labels in a consolidated label store (${output_dir}__store).",
+    )
+
+    parser.add_argument(
+        "--parity_check",
+        action="store_true",
+        help="Compares the analytic labels against the dense ones (logged per frame).",
+    )
+
     args = parser.parse_args()
     return args
 
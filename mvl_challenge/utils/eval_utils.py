@@ -1,25 +1,26 @@
+import numpy as np
 from mvl_challenge.utils.spherical_utils import phi_coords2xyz
 from shapely.geometry import Polygon
-import torch.nn.functional as F
 from mvl_challenge.utils.vispy_utils import plot_color_plc
 
 
+# ! torch is imported only by the losses, so IoU can be evaluated without torch
 def compute_L1_loss(y_est, y_ref):
+        import torch.nn.functional as F
         return F.l1_loss(y_est, y_ref)     
     
 def compute_weighted_L1(y_est, y_ref, std, min_std=1E-2):
+    import torch.nn.functional as F
     return F.l1_loss(y_est/(std + min_std)**2, y_ref/(std + min_std)**2) 
 
 
 def eval_2d3d_iuo_from_tensors(est_bon, gt_bon, losses, ch=1.6):
-    est_bearing_ceiling = phi_coords2xyz(est_bon[:, 0, :].squeeze())
-    est_bearing_floor = phi_coords2xyz(est_bon[:, 1, :].squeeze())
-    gt_bearing_ceiling = phi_coords2xyz(gt_bon[:, 0, :].squeeze())
-    gt_bearing_floor = phi_coords2xyz(gt_bon[:, 1, :].squeeze())
-
-    iou2d, iou3d = get_2d3d_iou(ch, est_bearing_floor, gt_bearing_floor, est_bearing_ceiling, gt_bearing_ceiling)
-    losses["2DIoU"].append(iou2d)
-    losses["3DIoU"].append(iou3d)
+    """
+    Appends the 2D/3D IoU of every sample in the batch (B, 2, W) to losses
+    """
+    iou2d, iou3d = eval_2d3d_iuo_batch(est_bon, gt_bon, ch)
+    losses["2DIoU"].extend(iou2d.tolist())
+    losses["3DIoU"].extend(iou3d.tolist())
 
 
 def eval_2d3d_iuo(phi_coords_est, phi_coords_gt_bon, ch=1):
@@ -75,3 +76,129 @@ def get_2d3d_iou(ch, est_bearing_floor, gt_bearing_floor, est_bearing_ceiling, g
         iou3d = 0
 
     return iou2d, iou3d
+
+
+def eval_2d3d_iuo_batch(phi_coords_est, phi_coords_gt_bon, ch=1):
+    """
+    Batched version of eval_2d3d_iuo().
+    Layouts are star-shaped polygons w.r.t. the camera (one vertex per column), thus their
+    intersection is computed per angular sector (column) without shapely.
+    Frames whose estimation is not star-shaped (e.g. negative floor phi_coords) or whose GT
+    is not valid are evaluated by get_2d3d_iou() (same invalid-GT and exception handling).
+    Args:
+        phi_coords_est (B, 2, W): Estimated phi_coords
+        phi_coords_gt_bon (B, 2, W'): GT phi_coords. W' != W is evaluated by get_2d3d_iou()
+        ch (float or (B,)): Camera heights
+    Returns:
+        iou2d (B,), iou3d (B,)
+    """
+    phi_coords_est = np.asarray(phi_coords_est, dtype=np.float64)
+    phi_coords_gt_bon = np.asarray(phi_coords_gt_bon, dtype=np.float64)
+    B, _, W = phi_coords_est.shape
+    ch = np.broadcast_to(np.asarray(ch, dtype=np.float64), (B,))
+
+    est_bearings = phi_coords2xyz(phi_coords_est)
+    gt_bearings = phi_coords2xyz(phi_coords_gt_bon)
+
+    est_pcl_floor, est_h = get_batch_floor_pcl_and_height(ch, est_bearings)
+    gt_pcl_floor, gt_h = get_batch_floor_pcl_and_height(ch, gt_bearings)
+
+    # ! Star-shaped (w.r.t. the camera) polygons: positive and finite floor distances
+    # ! with the same vertex directions (same width W)
+    star_shaped = (
+        np.full(B, phi_coords_gt_bon.shape[-1] == W)
+        & np.all(phi_coords_est[:, 1, :] > 0, axis=1)
+        & np.all(phi_coords_gt_bon[:, 1, :] > 0, axis=1)
+        & np.all(np.isfinite(est_pcl_floor), axis=(1, 2))
+        & np.all(np.isfinite(gt_pcl_floor), axis=(1, 2))
+    )
+
+    iou2d = np.zeros(B)
+    iou3d = np.zeros(B)
+    if np.any(star_shaped):
+        area_dt = get_batch_polygon_area(est_pcl_floor[star_shaped])
+        area_gt = get_batch_polygon_area(gt_pcl_floor[star_shaped])
+        area_inter = get_batch_star_shaped_intersection_area(
+            est_pcl_floor[star_shaped], gt_pcl_floor[star_shaped]
+        )
+        iou2d[star_shaped] = area_inter / (area_gt + area_dt - area_inter)
+
+        _est_h, _gt_h = est_h[star_shaped], gt_h[star_shaped]
+        area3d_inter = area_inter * np.minimum(_est_h, _gt_h)
+        area3d_pred = area_dt * _est_h
+        area3d_gt = area_gt * _gt_h
+        with np.errstate(divide="ignore", invalid="ignore"):
+            iou3d[star_shaped] = area3d_inter / (area3d_pred + area3d_gt - area3d_inter)
+
+    for i in np.where(~star_shaped)[0]:
+        iou2d[i], iou3d[i] = get_2d3d_iou(
+            ch[i],
+            est_bearings[i, 1],
+            gt_bearings[i, 1],
+            est_bearings[i, 0],
+            gt_bearings[i, 0],
+        )
+    return iou2d, iou3d
+
+
+def get_batch_floor_pcl_and_height(ch, bearings):
+    """
+    Returns the floor pcl projected in the xz plane (B, 2, W) and the layout height (B,)
+    from ceiling and floor bearings (B, 2, 3, W). Same as get_2d3d_iou().
+    """
+    bearings_ceiling, bearings_floor = bearings[:, 0], bearings[:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pcl_floor = (ch[:, None] / bearings_floor[:, 1, :])[:, None, :] * bearings_floor
+        scale_ceiling = pcl_floor[:, 2] / bearings_ceiling[:, 2]
+        pcl_ceiling_y = scale_ceiling * bearings_ceiling[:, 1]
+    h = np.abs(pcl_ceiling_y.mean(axis=1) - ch)
+    return pcl_floor[:, (0, 2), :], h
+
+
+def get_batch_polygon_area(pcl):
+    """
+    Shoelace area of a batch of polygons (B, 2, W)
+    """
+    x, y = pcl[:, 0], pcl[:, 1]
+    return 0.5 * np.abs(
+        np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1)
+    )
+
+
+def get_batch_star_shaped_intersection_area(pcl_a, pcl_b):
+    """
+    Intersection area of two batches of polygons (B, 2, W) which are star-shaped w.r.t.
+    the origin and share the same vertex directions (e.g. layouts defined per column).
+    In every angular sector [u, u+1] the intersection is bounded by the closest
+    edge, or by both edges split at their crossing point.
+    """
+
+    def cross(p, q):
+        return p[:, 0] * q[:, 1] - p[:, 1] * q[:, 0]
+
+    a0, a1 = pcl_a, np.roll(pcl_a, -1, axis=2)
+    b0, b1 = pcl_b, np.roll(pcl_b, -1, axis=2)
+
+    # ! Orientation of the vertices (counterclockwise or clockwise)
+    sign = np.sign(np.sum(cross(a0, a1), axis=1, keepdims=True))
+
+    area_a = 0.5 * sign * cross(a0, a1)
+    area_b = 0.5 * sign * cross(b0, b1)
+
+    a_closer_0 = np.linalg.norm(a0, axis=1) <= np.linalg.norm(b0, axis=1)
+    a_closer_1 = np.linalg.norm(a1, axis=1) <= np.linalg.norm(b1, axis=1)
+    sector_area = np.where(a_closer_0, area_a, area_b)
+
+    # ! Edges crossing within the sector
+    crossing = a_closer_0 != a_closer_1
+    if np.any(crossing):
+        da, db = a1 - a0, b1 - b0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s = cross(b0 - a0, db) / cross(da, db)
+        x = a0 + s[:, None, :] * da
+        start = np.where(a_closer_0[:, None, :], a0, b0)
+        end = np.where(a_closer_0[:, None, :], b1, a1)
+        crossing_area = 0.5 * sign * (cross(start, x) + cross(x, end))
+        sector_area = np.where(crossing, crossing_area, sector_area)
+
+    return np.sum(sector_area, axis=1)
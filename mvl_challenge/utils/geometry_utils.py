@@ -2,6 +2,7 @@ import math
 
 import numpy as np
 from pyquaternion import Quaternion
+from mvl_challenge.utils import spherical_projection
 
 
 def get_quaternion_from_matrix(matrix):
@@ -47,6 +48,39 @@ def tum_pose2matrix44(l, seq="xyzw"):
     return transform
 
 
+def quaternions2rotation_matrices(quaternions):
+    """
+    Vectorized version of Quaternion(qx, qy, qz, qw).rotation_matrix
+    for an array of quaternions (N, 4) in [qx, qy, qz, qw] order.
+    Returns an array of rotation matrices (N, 3, 3)
+    """
+    q = np.asarray(quaternions, dtype=np.float64)
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+
+    rot = np.empty((q.shape[0], 3, 3))
+    rot[:, 0, 0] = 1 - 2 * (y**2 + z**2)
+    rot[:, 0, 1] = 2 * (x * y - z * w)
+    rot[:, 0, 2] = 2 * (x * z + y * w)
+    rot[:, 1, 0] = 2 * (x * y + z * w)
+    rot[:, 1, 1] = 1 - 2 * (x**2 + z**2)
+    rot[:, 1, 2] = 2 * (y * z - x * w)
+    rot[:, 2, 0] = 2 * (x * z - y * w)
+    rot[:, 2, 1] = 2 * (y * z + x * w)
+    rot[:, 2, 2] = 1 - 2 * (x**2 + y**2)
+    return rot
+
+
+def areRotationMatrices(R):
+    """
+    Vectorized version of isRotationMatrix() for an array of matrices (N, 3, 3).
+    """
+    shouldBeIdentity = np.transpose(R, (0, 2, 1)) @ R
+    I = np.identity(3, dtype=R.dtype)
+    n = np.linalg.norm(I - shouldBeIdentity, axis=(1, 2))
+    return n < 1e-6
+
+
 def isRotationMatrix(R):
     """
     Checks if a matrix is a valid rotation matrix.
@@ -75,13 +109,9 @@ def get_bearings_from_phi_coords(phi_coords):
     """
     Returns 3D bearing vectors (on the unite sphere) from phi_coords
     """
-    W = phi_coords.__len__()
-    u = np.linspace(0, W - 1, W)
-    theta_coords = (2 * np.pi * u / W) - np.pi
-    bearings_y = -np.sin(phi_coords)
-    bearings_x = np.cos(phi_coords) * np.sin(theta_coords)
-    bearings_z = np.cos(phi_coords) * np.cos(theta_coords)
-    return np.vstack((bearings_x, bearings_y, bearings_z))
+    return spherical_projection.phi_coords2xyz(
+        phi_coords, dtype=np.float64, flip_y=True
+    )
 
 
 def stack_camera_poses(list_poses):
@@ -5,6 +5,9 @@ from copy import deepcopy
 import os
 from pathlib import Path
 from mvl_challenge.utils.vispy_utils import plot_color_plc
+from mvl_challenge.data_structure.layout_batch import LayoutBatch
+from mvl_challenge.utils.spherical_projection import get_theta_tables
+from mvl_challenge.datasets.label_store import get_label_store, get_label_store_dir, is_label_store_updated
 
 
 def label_cor2ly_phi_coord(label_cor_path, shape=(512, 1024)):
@@ -90,9 +93,14 @@ def filter_out_noisy_layouts(list_ly, max_room_factor_size=2):
     Filters out the passed list_ly based on the cam2boundary instances defined for each ly.
     All layouts which have an estimation greater than max_room_factor_size x median( of all cam distances) are filtered out
     Args:
-        list_ly (list): List of Layout instances
+        list_ly (list): List of Layout instances or a LayoutBatch
         max_room_factor_size (int, optional): max ly size allowed. Defaults to 2.
+    Returns:
+        The filtered list of Layout instances (or LayoutBatch)
     """
+    if isinstance(list_ly, LayoutBatch):
+        return list_ly.filter_out_noisy_layouts(max_room_factor_size)
+
     # ! Filtering out noisy estimation
     logging.info(f"Filtering noisy layouts: initial #{list_ly.__len__()}")
     mean_ = np.median([ly.cam2boundary.max() for ly in list_ly])
@@ -100,13 +108,17 @@ def filter_out_noisy_layouts(list_ly, max_room_factor_size=2):
         ly for ly in list_ly if ly.cam2boundary.max() < max_room_factor_size * mean_
     ]
     logging.info(f"Filtering noisy layouts: final #{list_ly.__len__()}")
+    return list_ly
 
 
 def normalize_list_ly(list_ly, scale_and_center=None):
     """
     Normalize the size of all layouts in a room between -1 to 1,
     centralizing all point to the median center of the room.
+    list_ly can be a list of Layout instances or a LayoutBatch.
     """
+    if isinstance(list_ly, LayoutBatch):
+        return list_ly.normalize_boundaries(scale_and_center)
 
     if scale_and_center is None:
         pcl = np.hstack([ly.boundary_floor for ly in list_ly])
@@ -127,6 +139,15 @@ def load_pseudo_labels(list_ly, hard_copy=False):
         list_ly = [deepcopy(ly) for ly in list_ly]
 
     pseudo_labels_dir = cfg.mlc_labels[cfg.mlc_data].labels_dir
+    store_dir = get_label_store_dir(pseudo_labels_dir, "mlc_label")
+    if os.path.isdir(store_dir):
+        # ! Rows of the consolidated store (see label_store.py)
+        store = get_label_store(store_dir)
+        if is_label_store_updated(store, pseudo_labels_dir, "mlc_label", [ly.idx for ly in list_ly]):
+            [ly.recompute_data(phi_coords=np.array(store.get_label(ly.idx))) for ly in list_ly]
+            return list_ly
+        logging.warning(f"Outdated label store {store_dir}. Reading the per-frame labels")
+
     list_fn = os.listdir(os.path.join(pseudo_labels_dir, "mlc_label"))
     # Select only the pseudo labels which belong to the current room
     ps_labels = {
@@ -152,3 +173,67 @@ def get_boundary_from_list_corners(list_corner):
         boundary.append(bound_points)
 
     return np.hstack(boundary)
+
+
+def get_phi_bound_from_list_corners(
+    list_corners, cam_poses, shape=(512, 1024), type_bound="floor", quantize=True
+):
+    """
+    Computes the phi_coords (F, W) of a room boundary, defined by its corners, for a batch of F
+    camera poses. Every column ray is intersected in closed form with the walls
+    (i.e., no dense sampling of the boundary as in get_boundary_from_list_corners()).
+    Args:
+        list_corners (list): Corners (3,) of the room boundary (ceiling or floor) in WC
+        cam_poses (F, 4, 4): SE3 camera poses
+        shape (tuple, optional): Image shape. Defaults to (512, 1024).
+        type_bound (str, optional): "floor" (the max phi) or "ceiling" (the min phi) per column.
+        quantize (bool, optional): Quantize the phi_coords to the image rows as the
+            labels created from xyz2uv(). Defaults to True.
+    Returns:
+        phi_coords (F, W). Columns without intersection are NaN.
+    """
+    H, W = shape
+    corners = np.stack([np.asarray(c, dtype=np.float64).reshape(3) for c in list_corners])
+    cam_poses = np.asarray(cam_poses, dtype=np.float64).reshape(-1, 4, 4)
+
+    # ! Walls in camera coordinates (F, 3, M)
+    rot_T = cam_poses[:, :3, :3].transpose(0, 2, 1)
+    pts = rot_T @ (corners.T[None] - cam_poses[:, :3, 3:])
+    pts_a, pts_b = pts, np.roll(pts, -1, axis=2)
+
+    theta_coords, sin_theta, cos_theta = get_theta_tables(W)
+    sin_theta = sin_theta[None, :, None]
+    cos_theta = cos_theta[None, :, None]
+
+    # ! Signed distance of every wall end to the vertical plane of every column ray (F, W, M)
+    def dist2plane(p):
+        return p[:, None, 0, :] * cos_theta - p[:, None, 2, :] * sin_theta
+
+    d_a, d_b = dist2plane(pts_a), dist2plane(pts_b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = d_a / (d_a - d_b)
+    hit = (t >= 0) & (t <= 1)
+    t = np.where(hit, t, 0)
+
+    # ! Intersection point (range along the ray and height)
+    def interp(axis):
+        return pts_a[:, None, axis, :] + t * (
+            pts_b[:, None, axis, :] - pts_a[:, None, axis, :]
+        )
+
+    ray_range = interp(0) * sin_theta + interp(2) * cos_theta
+    hit &= ray_range > 0
+    phi = np.arctan2(interp(1), ray_range)
+
+    if type_bound == "floor":
+        phi_bound = np.max(np.where(hit, phi, -np.inf), axis=2)
+    elif type_bound == "ceiling":
+        phi_bound = np.min(np.where(hit, phi, np.inf), axis=2)
+    else:
+        raise ValueError("wrong type_bound")
+    phi_bound[~np.any(hit, axis=2)] = np.nan
+
+    if quantize:
+        v = np.clip(np.floor((phi_bound / np.pi + 0.5) * H + 0.5), 0, H - 1)
+        phi_bound = (v / H - 0.5) * np.pi
+    return phi_bound
@@ -0,0 +1,115 @@
+import os
+import time
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+from imageio import imread, imwrite
+from mvl_challenge.datasets.mvl_shard import get_shard, is_shard_fn
+from mvl_challenge.utils.eval_utils import eval_2d3d_iuo_batch
+from mvl_challenge.utils.io_utils import load_gt_label
+from mvl_challenge.utils.results_store import get_results_records
+from mvl_challenge.utils.image_utils import (
+    draw_boundaries_phi_coords,
+    add_caption_to_image,
+    COLOR_CYAN,
+    COLOR_GREEN,
+)
+
+
+def get_num_eval_workers(num_workers):
+    """
+    Returns the number of evaluation processes. -1 means all cores of the machine.
+    """
+    if num_workers < 0:
+        return os.cpu_count()
+    return num_workers
+
+
+def get_room_eval_task(list_ly, gt_dir, vis_dir=None):
+    """
+    Returns the (picklable) data needed to evaluate a room in a worker process
+    """
+    return dict(
+        gt_dir=gt_dir,
+        vis_dir=vis_dir,
+        list_idx=[ly.idx for ly in list_ly],
+        list_img_fn=[ly.img_fn for ly in list_ly],
+        phi_coords=np.stack([ly.phi_coords for ly in list_ly]),
+        camera_heights=np.array([ly.camera_height for ly in list_ly]),
+    )
+
+
+def eval_room_task(task):
+    """
+    Loads the GT labels, computes 2D/3D IoU and saves visualizations (if vis_dir is defined)
+    for all frames of a room. Returns the results records (see get_results_records())
+    in the same order as the task.
+    """
+    tic = time.time()
+    list_phi_coords_gt = [
+        load_gt_label(os.path.join(task["gt_dir"], f"{idx}.npz"))
+        for idx in task["list_idx"]
+    ]
+
+    # ! 2D/3D IoU of the whole room at once
+    room_iou2d, room_iou3d = eval_2d3d_iuo_batch(
+        phi_coords_est=task["phi_coords"],
+        phi_coords_gt_bon=np.stack(list_phi_coords_gt),
+        ch=task["camera_heights"],
+    )
+
+    if task["vis_dir"] is not None:
+        for idx, img_fn, phi_coords_est, phi_coords_gt in zip(
+            task["list_idx"], task["list_img_fn"], task["phi_coords"], list_phi_coords_gt
+        ):
+            img = get_shard(img_fn).get_rgb(idx) if is_shard_fn(img_fn) else imread(img_fn)
+            draw_boundaries_phi_coords(img, phi_coords=phi_coords_est, color=COLOR_CYAN)
+            draw_boundaries_phi_coords(img, phi_coords=phi_coords_gt, color=COLOR_GREEN)
+            img = add_caption_to_image(img, idx)
+            imwrite(os.path.join(task["vis_dir"], f"{idx}.jpg"), img)
+
+    return get_results_records(
+        list_idx=task["list_idx"],
+        iou2d=room_iou2d,
+        iou3d=room_iou3d,
+        cam_h=task["camera_heights"],
+        failed=np.minimum(room_iou2d, room_iou3d) < 0,
+        eval_time=(time.time() - tic) / task["list_idx"].__len__(),
+    )
+
+
+def iter_room_evaluations(
+    iter_tasks, num_workers=0, max_rooms_in_flight=None, func=eval_room_task
+):
+    """
+    Evaluates every room task (see get_room_eval_task()) and yields the results of
+    func (Default: eval_room_task()) in the same order as iter_tasks.
+    With num_workers > 0, tasks are evaluated by a process pool while iter_tasks
+    (e.g. the model inference) keeps running in the main process.
+
+    Args:
+        iter_tasks: Iterable of room tasks
+        num_workers (int): Number of processes. 0 evaluates in the main process.
+        max_rooms_in_flight (int): Max number of submitted rooms not yet yielded.
+            Defaults to 2 x num_workers.
+        func: Picklable (module level) function evaluating a task
+    """
+    if num_workers == 0:
+        yield from map(func, iter_tasks)
+        return
+
+    if max_rooms_in_flight is None:
+        max_rooms_in_flight = 2 * num_workers
+
+    with Pool(processes=num_workers) as pool:
+        pending = deque()
+        for task in iter_tasks:
+            pending.append(pool.apply_async(func, (task,)))
+            # ! Streaming already finished rooms (in order)
+            while pending.__len__() >= max_rooms_in_flight or (
+                pending.__len__() > 0 and pending[0].ready()
+            ):
+                yield pending.popleft().get()
+
+        while pending.__len__() > 0:
+            yield pending.popleft().get()
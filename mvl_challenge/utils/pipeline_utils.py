@@ -0,0 +1,80 @@
+import queue
+import threading
+
+__END = object()
+
+
+class PipelineError:
+    def __init__(self, err):
+        self.err = err
+
+
+def iter_pipeline(iterable, stages, max_in_flight=3):
+    """
+    Generator which passes every item of iterable through a list of stages (functions).
+    The iterable and every stage run in their own background thread connected by queues,
+    so item k+1 can be processed by stage i while item k is in stage i+1.
+    Results are yielded in the same order as iterable.
+
+    Args:
+        iterable: Source of items (e.g. a list of room names or a generator)
+        stages (list): Functions applied in order to every item
+        max_in_flight (int): Max number of items alive at the same time,
+            including the one being consumed by the caller.
+    """
+    assert max_in_flight > 0, "max_in_flight must be greater than zero"
+    slots = threading.Semaphore(max_in_flight)
+    stop = threading.Event()
+    queues = [queue.Queue() for _ in range(stages.__len__() + 1)]
+
+    def run_source():
+        try:
+            iterator = iter(iterable)
+            while True:
+                # ! A slot is taken before the next item is created
+                slots.acquire()
+                if stop.is_set():
+                    return
+                item = next(iterator, __END)
+                if item is __END:
+                    break
+                queues[0].put(item)
+        except BaseException as err:
+            queues[0].put(PipelineError(err))
+            return
+        queues[0].put(__END)
+
+    def run_stage(func, q_in, q_out):
+        while True:
+            item = q_in.get()
+            if item is __END or isinstance(item, PipelineError) or stop.is_set():
+                q_out.put(item)
+                return
+            try:
+                q_out.put(func(item))
+            except BaseException as err:
+                q_out.put(PipelineError(err))
+                return
+
+    threads = [threading.Thread(target=run_source, daemon=True)]
+    for i, func in enumerate(stages):
+        threads.append(
+            threading.Thread(
+                target=run_stage, args=(func, queues[i], queues[i + 1]), daemon=True
+            )
+        )
+    [th.start() for th in threads]
+
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is __END:
+                return
+            if isinstance(item, PipelineError):
+                raise item.err
+            yield item
+            # ! The caller has finished with the previous item
+            slots.release()
+    finally:
+        stop.set()
+        slots.release()
@@ -0,0 +1,172 @@
+import json
+import os
+import numpy as np
+from mvl_challenge.utils.io_utils import get_scene_room_from_scene_room_idx
+
+RESULTS_EXT = ".mvlres"
+RESULTS_MAGIC = b"MVLRES01"
+RESULTS_ALIGN = 64
+
+# ! Fixed-width record per evaluated frame. Failed frames are stored with IoU 0 (the highest penalty)
+RESULTS_DTYPE = np.dtype(
+    [
+        ("idx", "S64"),
+        ("room", "S64"),
+        ("scene", "S32"),
+        ("iou2d", "<f8"),
+        ("iou3d", "<f8"),
+        ("cam_h", "<f8"),
+        ("failed", "u1"),
+        ("eval_time", "<f8"),
+    ]
+)
+
+
+def get_scene_from_scene_room(room_scene):
+    return "_".join(room_scene.split("_")[:2])
+
+
+def encode_field(values, field):
+    """
+    Returns values encoded for a fixed-width field of RESULTS_DTYPE. Longer values raise a ValueError
+    (they would be silently truncated)
+    """
+    values = [value.encode() for value in values]
+    max_len = RESULTS_DTYPE[field].itemsize
+    too_long = [value for value in values if value.__len__() > max_len]
+    if too_long.__len__() > 0:
+        raise ValueError(f"{field} longer than {max_len} bytes can not be stored: {too_long[0].decode()}")
+    return values
+
+
+def get_results_records(list_idx, iou2d, iou3d, cam_h, failed, eval_time=0):
+    """
+    Returns a structured array (N,) of RESULTS_DTYPE for the passed frames.
+    eval_time (seconds) can be defined per frame or for all of them.
+    The IoU of failed frames is stored as 0 (the highest penalty), so they are counted in every mean.
+    """
+    failed = np.broadcast_to(np.asarray(failed, dtype=bool), (list_idx.__len__(),))
+    records = np.zeros(list_idx.__len__(), dtype=RESULTS_DTYPE)
+    list_room = [get_scene_room_from_scene_room_idx(idx) for idx in list_idx]
+    records["idx"] = encode_field(list_idx, "idx")
+    records["room"] = encode_field(list_room, "room")
+    records["scene"] = encode_field([get_scene_from_scene_room(room) for room in list_room], "scene")
+    records["iou2d"] = np.where(failed, 0, iou2d)
+    records["iou3d"] = np.where(failed, 0, iou3d)
+    records["cam_h"] = cam_h
+    records["failed"] = failed
+    records["eval_time"] = eval_time
+    return records
+
+
+class ResultsWriter:
+    """
+    Append-only columnar results file (*.mvlres). Records are flushed as they are written,
+    so a partial file (e.g. an interrupted evaluation) can be read by ResultsStore.
+    """
+
+    def __init__(self, filename, meta=None):
+        self.filename = filename
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        meta_bytes = json.dumps(meta or {}).encode()
+        header_size = RESULTS_MAGIC.__len__() + 8 + meta_bytes.__len__()
+        padding = (-header_size) % RESULTS_ALIGN
+        self.file = open(filename, "wb")
+        self.file.write(RESULTS_MAGIC)
+        self.file.write(np.array([meta_bytes.__len__()], dtype="<u8").tobytes())
+        self.file.write(meta_bytes)
+        self.file.write(b"\0" * padding)
+        self.file.flush()
+        self.num_records = 0
+
+    def write(self, records):
+        records = np.asarray(records, dtype=RESULTS_DTYPE)
+        self.file.write(records.tobytes())
+        self.file.flush()
+        self.num_records += records.size
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ResultsStore:
+    """
+    Read-only access to a results file (*.mvlres). Records are memory-mapped and
+    aggregations are computed in chunks.
+    """
+
+    def __init__(self, filename):
+        assert os.path.exists(filename), f"Not found {filename}"
+        self.filename = filename
+        with open(filename, "rb") as f:
+            magic = f.read(RESULTS_MAGIC.__len__())
+            assert magic == RESULTS_MAGIC, f"Not a results file {filename}"
+            meta_size = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            self.meta = json.loads(f.read(meta_size).decode())
+        header_size = RESULTS_MAGIC.__len__() + 8 + meta_size
+        self.data_start = header_size + (-header_size) % RESULTS_ALIGN
+
+        # ! A trailing partial record (interrupted writing) is ignored
+        num_records = (os.path.getsize(filename) - self.data_start) // RESULTS_DTYPE.itemsize
+        self.records = (
+            np.memmap(
+                filename,
+                dtype=RESULTS_DTYPE,
+                mode="r",
+                offset=self.data_start,
+                shape=(num_records,),
+            )
+            if num_records > 0
+            else np.zeros(0, dtype=RESULTS_DTYPE)
+        )
+
+    def __len__(self):
+        return self.records.size
+
+    def iter_chunks(self, chunk_size=65536):
+        for i in range(0, self.__len__(), chunk_size):
+            yield self.records[i : i + chunk_size]
+
+    def aggregate(self, by="room", chunk_size=65536):
+        """
+        Returns {key: dict(frames, failed, m2dIoU, m3dIoU, eval_time)} where key is
+        the room, scene or "total" (by="total"). Failed frames are counted with IoU 0.
+        """
+        acc = {}
+        for chunk in self.iter_chunks(chunk_size):
+            if by == "total":
+                keys, inverse = np.array([b"total"]), np.zeros(chunk.size, dtype=np.int64)
+            else:
+                keys, inverse = np.unique(chunk[by], return_inverse=True)
+            counts = np.bincount(inverse, minlength=keys.size)
+            sums = {
+                col: np.bincount(inverse, weights=chunk[col], minlength=keys.size)
+                for col in ("iou2d", "iou3d", "failed", "eval_time")
+            }
+            for i, key in enumerate(keys):
+                key_acc = acc.setdefault(
+                    key.decode(),
+                    dict(frames=0, iou2d=0.0, iou3d=0.0, failed=0, eval_time=0.0),
+                )
+                key_acc["frames"] += int(counts[i])
+                key_acc["failed"] += int(sums["failed"][i])
+                key_acc["iou2d"] += sums["iou2d"][i]
+                key_acc["iou3d"] += sums["iou3d"][i]
+                key_acc["eval_time"] += sums["eval_time"][i]
+
+        return {
+            key: dict(
+                frames=value["frames"],
+                failed=value["failed"],
+                m2dIoU=value["iou2d"] / value["frames"],
+                m3dIoU=value["iou3d"] / value["frames"],
+                eval_time=value["eval_time"],
+            )
+            for key, value in sorted(acc.items())
+        }
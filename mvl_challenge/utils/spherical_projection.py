@@ -0,0 +1,96 @@
+from functools import lru_cache
+
+import numpy as np
+
+# ! dtypes with precomputed tables. Any other dtype is computed as float64
+TABLE_DTYPES = (np.float32, np.float64)
+
+
+@lru_cache(maxsize=None)
+def get_theta_tables(W, dtype=np.float64):
+    """
+    Returns the (read-only) theta_coords, sin(theta_coords) and cos(theta_coords)
+    tables (W,) of an equirectangular image of width W.
+    Tables are computed in float64 once and cast to the requested dtype.
+    """
+    u = np.linspace(0, W - 1, W)
+    theta_coords = (2 * np.pi * u / W) - np.pi
+    tables = (theta_coords, np.sin(theta_coords), np.cos(theta_coords))
+    tables = tuple(np.ascontiguousarray(t, dtype=dtype) for t in tables)
+    [t.setflags(write=False) for t in tables]
+    return tables
+
+
+@lru_cache(maxsize=None)
+def get_u_table(W):
+    """
+    Returns the (read-only) u pixel coordinates (W,) of theta_coords,
+    i.e., the same as sph2uv() for the columns of a phi_coords array.
+    """
+    theta_coords, _, _ = get_theta_tables(W, np.float64)
+    u = np.clip(np.floor((0.5 * theta_coords / np.pi + 0.5) * W + 0.5), 0, W - 1)
+    u = u.astype(int)
+    u.setflags(write=False)
+    return u
+
+
+def get_table_dtype(phi_coords, dtype=None):
+    if dtype is not None:
+        return np.dtype(dtype).type
+    if phi_coords.dtype.type in TABLE_DTYPES:
+        return phi_coords.dtype.type
+    return np.float64
+
+
+def phi_coords2xyz(phi_coords, out=None, dtype=None, flip_y=False):
+    """
+    Returns 3D bearing vectors (3, W) from phi_coords (W,), or (..., 3, W) for a
+    batch of phi_coords (..., W). The passed out buffer is used if defined.
+
+    Args:
+        phi_coords: phi_coords array (..., W)
+        out: Optional pre-allocated buffer (..., 3, W)
+        dtype: float32 or float64. Defaults to the phi_coords dtype.
+        flip_y: Returns -sin(phi_coords) for the y-axis (see get_bearings_from_phi_coords())
+    """
+    phi_coords = np.asarray(phi_coords)
+    dtype = get_table_dtype(phi_coords, dtype)
+    W = phi_coords.shape[-1]
+    _, sin_theta, cos_theta = get_theta_tables(W, dtype)
+
+    shape = phi_coords.shape[:-1] + (3, W)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    assert out.shape == shape, f"Wrong out shape {out.shape}, expected {shape}"
+
+    x, y, z = out[..., 0, :], out[..., 1, :], out[..., 2, :]
+    np.cos(phi_coords, out=x, casting="unsafe")
+    np.multiply(x, cos_theta, out=z)
+    np.multiply(x, sin_theta, out=x)
+    np.sin(phi_coords, out=y, casting="unsafe")
+    if flip_y:
+        np.negative(y, out=y)
+    return out
+
+
+def phi_coords2uv(phi_coords, shape=(512, 1024), out=None):
+    """
+    Converts phi_coords (2, W) (ceiling and floor boundaries) into uv pixels.
+    Returns uv_ceiling, uv_floor (2, W). The passed out buffer (2, 2, W) is used if defined.
+    """
+    phi_coords = np.asarray(phi_coords)
+    H, W = shape
+    if out is None:
+        out = np.empty((2, 2, W), dtype=int)
+    assert out.shape == (2, 2, W), f"Wrong out shape {out.shape}"
+
+    out[:, 0, :] = get_u_table(W)
+    # ! Computed in float64 as sph2uv()
+    v = np.divide(phi_coords[:2], np.pi, dtype=np.float64)
+    v += 0.5
+    v *= H
+    v += 0.5
+    np.floor(v, out=v)
+    np.clip(v, 0, H - 1, out=v)
+    out[:, 1, :] = v
+    return out[0], out[1]
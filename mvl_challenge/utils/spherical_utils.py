@@ -2,6 +2,8 @@ import math
 
 import numpy as np
 
+from mvl_challenge.utils import spherical_projection
+
 
 class SphericalCamera:
     def __init__(self, shape):
@@ -96,13 +98,14 @@ def phi_coords2xyz(phi_coords):
     """
     Returns 3D bearing vectors (on the unite sphere) from phi_coords
     """
-    W = phi_coords.__len__()
-    u = np.linspace(0, W - 1, W)
-    theta_coords = (2 * np.pi * u / W) - np.pi
-    bearings_y = np.sin(phi_coords)
-    bearings_x = np.cos(phi_coords) * np.sin(theta_coords)
-    bearings_z = np.cos(phi_coords) * np.cos(theta_coords)
-    return np.vstack((bearings_x, bearings_y, bearings_z))
+    return spherical_projection.phi_coords2xyz(phi_coords, dtype=np.float64)
+
+
+def phi_coords2xyz_batch(phi_coords):
+    """
+    Returns 3D bearing vectors (N, 3, W) from a batch of phi_coords (N, W)
+    """
+    return spherical_projection.phi_coords2xyz(phi_coords, dtype=np.float64)
 
 
 #! Checked ok!
@@ -111,47 +114,48 @@ def phi_coords2uv(phi_coords, shape=(512, 1024)):
     Converts a set of phi_coordinates (2, W), defined by ceiling and floor boundaries encoded as
     phi coordinates, into uv pixels
     """
-    H, W = shape
-    u = np.linspace(0, W - 1, W)
-    theta_coords = (2 * np.pi * u / W) - np.pi
-    uv_c = sph2uv(np.vstack((theta_coords, phi_coords[0])), shape)
-    uv_f = sph2uv(np.vstack((theta_coords, phi_coords[1])), shape)
-    return uv_c, uv_f
+    return spherical_projection.phi_coords2uv(phi_coords, shape)
 
 
 #! Checked ok!
 def uv2phi_coords(uv, shape=(512, 1024), type_bound="floor"):
-    # _, idx, count = np.unique(uv[0], return_index=True, return_counts=True)
-    u_coords = np.linspace(0, shape[1] - 1, shape[1]).astype(np.int16)
-    v = []
-    for u in u_coords:
-        v_idx = np.where(uv[0] == u)[0]
-        if v_idx.size == 0:
-            for i in range(5):
-                v_idx = np.where(uv[0] == (u + i) % shape[1])[0]
-                if v_idx.size > 0:
-                    break
-                v_idx = np.where(uv[0] == (u - i) % shape[1])[0]
-                if v_idx.size > 0:
-                    break
-            # for i in range(5):
-            #     v_idx = np.where(uv[0] == (u - i)% shape[1])[0]
-            #     if v_idx.size > 0:
-            #         break
-            #     v_idx = np.where(uv[0] == (u + i)% shape[1])[0]
-            #     if v_idx.size > 0:
-            #         break
-        if v_idx.size == 0:
-            return None
-
-        if type_bound == "floor":
-            v.append(np.max(uv[1, v_idx]))
-        elif type_bound == "ceiling":
-            v.append(np.min(uv[1, v_idx]))
-        else:
-            raise ValueError("wrong type_bound")
-
-    phi_bon = (np.array(v) / shape[0] - 0.5) * np.pi
+    """
+    Reduces a set of uv pixels (2, N) (e.g. a projected boundary) to phi_coords (W,),
+    taking the max (floor) or min (ceiling) v for every column u.
+    Empty columns take the value of the nearest non-empty column in the order
+    u+1, u-1, ..., u+4, u-4. Returns None if any column remains empty.
+    """
+    if type_bound == "floor":
+        reduce_at, init_value = np.maximum.at, -np.inf
+    elif type_bound == "ceiling":
+        reduce_at, init_value = np.minimum.at, np.inf
+    else:
+        raise ValueError("wrong type_bound")
+
+    W = shape[1]
+    u, v = uv[0], uv[1]
+    mask = (u >= 0) & (u < W)
+    u = u[mask].astype(np.int64)
+
+    # ! Grouped max/min of v per column u
+    v_bound = np.full(W, init_value)
+    reduce_at(v_bound, u, v[mask])
+    valid = np.bincount(u, minlength=W) > 0
+
+    # ! Filling empty columns with the nearest neighbour
+    phi_v = v_bound.copy()
+    filled = valid.copy()
+    u_coords = np.arange(W)
+    for i in range(1, 5):
+        for neighbour in ((u_coords + i) % W, (u_coords - i) % W):
+            fill = ~filled & valid[neighbour]
+            phi_v[fill] = v_bound[neighbour[fill]]
+            filled |= fill
+
+    if not np.all(filled):
+        return None
+
+    phi_bon = (phi_v / shape[0] - 0.5) * np.pi
     return phi_bon
 
 
@@ -10,13 +10,16 @@ import sys
 from matplotlib.colors import hsv_to_rgb
 import vispy.io as vispy_file
 import os
+from mvl_challenge.data_structure import LayoutBatch
 
 
 def plot_list_ly(list_ly=None, ceil_or_floor="", save_at=None):
-    room_scene = list_ly[0].cfg._room_scene
-    caption = room_scene
     if list_ly.__len__() < 1:
         return
+    cfg = list_ly.cfg if isinstance(list_ly, LayoutBatch) else list_ly[0].cfg
+    # ! e.g. a LayoutBatch without cfg
+    room_scene = "" if cfg is None else cfg.get("_room_scene", "")
+    caption = room_scene
 
     # ! Setting up vispy
     canvas = vispy.scene.SceneCanvas(
@@ -49,7 +52,10 @@ def plot_list_ly(list_ly=None, ceil_or_floor="", save_at=None):
     raw = []
     # [raw.append(np.linalg.inv(ly.pose)[0:3, :] @ extend_array_to_homogeneous(ly.boundary)) for ly in list_ly]
     # list_pl = flatten_lists_of_lists([ly.list_planes for ly in list_obj])
-    if ceil_or_floor == "":
+    if isinstance(list_ly, LayoutBatch):
+        # ! LayoutBatch: boundaries are already contiguous arrays
+        raw.append(list_ly.get_pcl(ceil_or_floor))
+    elif ceil_or_floor == "":
         [raw.append(ly.boundary_floor) for ly in list_ly]
         [raw.append(ly.boundary_ceiling) for ly in list_ly]
     elif ceil_or_floor == "ceil":
@@ -12,7 +12,9 @@ from mvl_challenge import DEFAULT_MVL_DIR
 from mvl_challenge.utils.spherical_utils import xyz2uv
 from mvl_challenge.utils.io_utils import create_directory, save_compressed_phi_coords
 from mvl_challenge.datasets.mvl_dataset import MVLDataset
+from mvl_challenge.data_structure import LayoutBatch
 from mvl_challenge.models.wrapper_horizon_net import WrapperHorizonNet
+from mvl_challenge.datasets.label_store import save_label_store, get_label_store_dir, remove_label_store
 from mvl_challenge.utils.image_utils import (
     draw_boundaries_uv, 
     draw_uncertainty_map, 
@@ -50,7 +52,17 @@ def save_visualization(fn, img_boundaries, sigma_map):
     plt.close()
 
 def compute_and_save_mlc_labels(list_ly):
-    for ref in tqdm(list_ly, desc="Estimating MLC Labels"):
+    """
+    Computes and saves the MLC pseudo labels (npy files) and their std for all ly in list_ly.
+    Returns {idx: (phi_coords, std)}
+    """
+    mlc_labels = {}
+    # ! Estimated boundaries (uv) of the whole room in one vectorized pass (see LayoutBatch)
+    room = LayoutBatch.from_list_ly(list_ly)
+    N, _, W = room.bearings_ceiling.shape
+    uv_ceiling_hat_room = xyz2uv(room.bearings_ceiling.transpose(1, 0, 2).reshape(3, -1)).reshape(2, N, W)
+    uv_floor_hat_room = xyz2uv(room.bearings_floor.transpose(1, 0, 2).reshape(3, -1)).reshape(2, N, W)
+    for i, ref in enumerate(tqdm(list_ly, desc="Estimating MLC Labels")):
         uv_ceiling_ps, uv_floor_ps, std_ceiling, std_floor, _ = compute_pseudo_labels(
             list_frames=list_ly,
             ref_frame=ref,
@@ -66,9 +78,10 @@ def compute_and_save_mlc_labels(list_ly):
         np.save(fn, phi_coords)
         fn = os.path.join(ref.cfg.mlc_dir.std, f"{ref.idx}")
         np.save(fn, std)
+        mlc_labels[ref.idx] = (phi_coords, std)
         
-        uv_ceiling_hat = xyz2uv(ref.bearings_ceiling)
-        uv_floor_hat = xyz2uv(ref.bearings_floor)
+        uv_ceiling_hat = uv_ceiling_hat_room[:, i]
+        uv_floor_hat = uv_floor_hat_room[:, i]
     
         img = ref.get_rgb()
         draw_boundaries_uv(
@@ -102,6 +115,7 @@ def compute_and_save_mlc_labels(list_ly):
         
         fn = os.path.join(ref.cfg.mlc_dir.vis, f"{ref.idx}.jpg")
         save_visualization(fn, img, sigma_map)
+    return mlc_labels
         
 def get_cfg_from_args(args):
     cfg = read_omega_cfg(args.cfg)
@@ -124,8 +138,21 @@ def main(args):
     mvl.print_mvl_data_info()
     create_mlc_label_dirs(cfg)
     
+    mlc_labels = {}
     for list_ly in iter_mvl_room_scenes(model=hn, dataset=mvl):
-        compute_and_save_mlc_labels(list_ly)
+        mlc_labels.update(compute_and_save_mlc_labels(list_ly))
+
+    if not cfg.mlc_dir.get("label_store", True):
+        # ! A previous store would serve outdated pseudo labels
+        remove_label_store(Path(cfg.mlc_dir.phi_coords).parent.__str__(), "mlc_label")
+    elif mlc_labels.__len__() > 0:
+        # ! Consolidated pseudo labels and std for training (see label_store.py)
+        save_label_store(
+            store_dir=get_label_store_dir(Path(cfg.mlc_dir.phi_coords).parent.__str__(), "mlc_label"),
+            list_idx=list(mlc_labels.keys()),
+            phi_coords=np.stack([phi_coords for phi_coords, _ in mlc_labels.values()]),
+            std=np.stack([std for _, std in mlc_labels.values()]),
+        )
 
 def get_passed_args():
     parser = argparse.ArgumentParser()
@@ -16,6 +16,8 @@ def get_cfg_from_args(args):
     cfg.ckpt = args.ckpt
     cfg.cuda_device = args.cuda_device
     cfg.id_exp = f"{Path(cfg.ckpt).stem}__{Path(args.pilot_scene_list).stem}"
+    if args.async_validation:
+        cfg.runners.valid_iou.async_validation = True
     return cfg
 
 def main(args):
@@ -73,6 +75,12 @@ def get_passed_args():
 
     parser.add_argument("--cuda_device", default=0, type=int, help="Cuda device. (Default: 0)")
 
+    parser.add_argument(
+        "--async_validation",
+        action="store_true",
+        help="IoU validation in a background process, overlapped with training.",
+    )
+
     args = parser.parse_args()
     return args
 